@@ -0,0 +1,376 @@
+"""
+Records keyboard and mouse activity, and replays it through an AFKWorker.
+
+A recording (a "trace") holds nothing but the times of input events, so it can
+be recorded on anybody's computer without capturing what they were doing.
+Replaying a trace runs an AFKWorker on a virtual clock, as fast as possible,
+and returns exactly which signals it emitted and when.  This makes it possible
+to try out different AFK settings against a real day of activity, and to
+regression test changes to them.
+
+Usage:
+    python afk_trace.py record my_day.trace
+    python afk_trace.py replay my_day.trace --config config.toml
+    python afk_trace.py synthesize test_day.trace --hours 8
+"""
+
+import argparse
+import array
+import random
+import struct
+import sys
+import time
+import logging
+from typing import Iterator, List, Optional, Tuple
+
+# pylint: disable=import-error
+import tomlkit
+import zstandard
+from PySide6.QtCore import QCoreApplication
+
+import afk_worker as aw
+import input_sources
+
+
+logger = logging.getLogger(__name__)
+
+
+class InputTrace:
+    """
+    The times of recorded input events.
+
+    Times are stored as the number of milliseconds since the previous event
+    (the first one since the start of the recording).  Events less than a
+    millisecond apart are only stored once.  On disk, that array is compressed
+    with zstd, after a small header.
+    """
+
+    _MAGIC = b"GTRC"
+    _VERSION = 1
+    # Magic, version, wall clock start time, duration (in milliseconds), and
+    #  number of events.
+    _HEADER = struct.Struct("<4sBdQQ")
+
+    def __init__(self, start_wall_time: float, duration: int = 0):
+        """
+        Args:
+            start_wall_time: When the recording started, from `time.time()`.
+            duration: How long the recording lasted, in milliseconds.
+        """
+        self.start_wall_time = start_wall_time
+        self.duration = duration
+        self.deltas = array.array("I")
+        self._last_offset = 0
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def append(self, offset: int):
+        """
+        Adds an input event `offset` milliseconds after the start of the
+        recording.  Offsets have to be added in order.
+        """
+        delta = offset - self._last_offset
+        if delta > 0 or not self.deltas:
+            self.deltas.append(delta)
+            self._last_offset = offset
+
+    def input_times(self) -> Iterator[float]:
+        """Yields the time of each input event, in seconds from the start."""
+        offset = 0
+        for delta in self.deltas:
+            offset += delta
+            yield offset / 1_000
+
+    def save(self, filename: str):
+        deltas = array.array("I", self.deltas)
+        if sys.byteorder == "big":
+            deltas.byteswap()
+        with open(filename, "wb") as f:
+            f.write(
+                self._HEADER.pack(
+                    self._MAGIC,
+                    self._VERSION,
+                    self.start_wall_time,
+                    self.duration,
+                    len(deltas),
+                )
+            )
+            f.write(zstandard.ZstdCompressor().compress(deltas.tobytes()))
+
+    @classmethod
+    def load(cls, filename: str) -> "InputTrace":
+        with open(filename, "rb") as f:
+            header = f.read(cls._HEADER.size)
+            compressed = f.read()
+        magic, version, start_wall_time, duration, count = cls._HEADER.unpack(
+            header
+        )
+        if magic != cls._MAGIC or version != cls._VERSION:
+            raise ValueError(
+                "{} is not a version {} input trace.".format(
+                    filename, cls._VERSION
+                )
+            )
+
+        trace = cls(start_wall_time, duration)
+        trace.deltas.frombytes(
+            zstandard.ZstdDecompressor().decompress(
+                compressed, max_output_size=count * trace.deltas.itemsize
+            )
+        )
+        if sys.byteorder == "big":
+            trace.deltas.byteswap()
+        trace._last_offset = sum(trace.deltas)
+        return trace
+
+
+class TraceRecorder:
+    """Records the input noticed by an input source into an InputTrace."""
+
+    def __init__(self, input_source: input_sources.InputSource):
+        self._input_source = input_source
+        self._start_time = time.monotonic()
+        self.trace = InputTrace(time.time())
+
+    def start(self):
+        self._start_time = time.monotonic()
+        self.trace = InputTrace(time.time())
+        self._input_source.add_input_callback(self._on_input)
+        self._input_source.start()
+
+    def stop(self) -> InputTrace:
+        self._input_source.remove_callback(self._on_input)
+        self._input_source.stop()
+        self.trace.duration = int(
+            (time.monotonic() - self._start_time) * 1_000
+        )
+        return self.trace
+
+    def _on_input(self):
+        offset = self._input_source.last_input_time() - self._start_time
+        self.trace.append(int(offset * 1_000))
+
+
+class _VirtualClock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+def replay_trace(
+    trace: InputTrace, **worker_options
+) -> List[Tuple[float, str, Optional[float]]]:
+    """
+    Replays a trace through an AFKWorker, on a virtual clock.
+
+    Any of the AFKWorker's arguments (except those about the input backend and
+    clocks) can be passed in.
+
+    Returns every signal the worker emitted, as a tuple of when it was emitted
+    and the signal's name and value.  Times are in seconds from the start of
+    the trace.
+    """
+    # Starting a QTimer warns if there's no application, even though the timer
+    #  never gets to fire.
+    if QCoreApplication.instance() is None:
+        replay_trace.app = QCoreApplication([])
+
+    clock = _VirtualClock()
+    input_hub = input_sources.InputHub()
+    worker = aw.AFKWorker(
+        input_backend="replay",
+        input_hub=input_hub,
+        clock=clock,
+        wall_clock=lambda: trace.start_wall_time + clock.time,
+        **worker_options,
+    )
+    input_source = input_hub.subscribe("replay")
+
+    emitted = []
+
+    def record(name, value=None):
+        emitted.append((clock.time, name, value))
+
+    worker.afk_signal.connect(
+        lambda t: record("afk", t - trace.start_wall_time)
+    )
+    worker.at_computer_signal.connect(
+        lambda t: record("at computer", t - trace.start_wall_time)
+    )
+    worker.in_limbo_signal.connect(lambda: record("in limbo"))
+    worker.leaving_limbo_signal.connect(lambda: record("leaving limbo"))
+    worker.scheduled_signal.connect(lambda t: record("scheduled", t))
+
+    def run_wakeups_until(end_time):
+        while (
+            worker.next_wakeup_time is not None
+            and worker.next_wakeup_time <= end_time
+        ):
+            clock.time = worker.next_wakeup_time
+            # pylint: disable=protected-access
+            worker._monitor_status()
+
+    worker.start_worker()
+    for input_time in trace.input_times():
+        run_wakeups_until(input_time)
+        clock.time = input_time
+        input_source.feed(input_time)
+    run_wakeups_until(trace.duration / 1_000)
+
+    # pylint: disable=protected-access
+    worker._stop_worker()
+    input_hub.unsubscribe(input_source)
+    return emitted
+
+
+def synthesize_trace(hours: float = 8, seed: Optional[int] = None):
+    """
+    Makes up a workday of input:  stretches of busy typing and mousing, with
+    pauses of all lengths in between, from a few seconds up to lunch.
+    """
+    rng = random.Random(seed)
+    duration = int(hours * 3_600_000)
+    trace = InputTrace(time.time(), duration)
+
+    offset = 0
+    while offset < duration:
+        burst_end = offset + int(rng.expovariate(1 / 600_000))
+        while offset < min(burst_end, duration):
+            trace.append(offset)
+            offset += int(rng.expovariate(1 / 40)) + 1
+        offset += int(
+            rng.choice([5_000, 30_000, 180_000, 900_000, 2_700_000])
+            * rng.random()
+        )
+    return trace
+
+
+def _worker_options_from_config(filename):
+    with open(filename, "r", encoding="utf-8") as f:
+        config = tomlkit.load(f)
+
+    options = dict(config.get("afk_options", {}))
+    for option in ("input_backend", "input_backend_options"):
+        options.pop(option, None)
+
+    timeouts = config.get("away_from_keyboard", {})
+    scheduled_timeouts = [
+        timeouts[name]
+        for name in ("short_break_timeout", "long_break_timeout")
+        if timeouts.get(name, 0) > 0
+    ]
+    if scheduled_timeouts:
+        options["scheduled_timeouts"] = scheduled_timeouts
+    return options
+
+
+def _format_offset(seconds):
+    return time.strftime("+%H:%M:%S", time.gmtime(seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser(
+        "record", help="Record input until interrupted (with Ctrl-C)."
+    )
+    record_parser.add_argument("trace")
+    record_parser.add_argument(
+        "--backend",
+        default="pynput",
+        help="The input backend to record with.  (Default: pynput)",
+    )
+
+    replay_parser = subparsers.add_parser(
+        "replay", help="Replay a trace, and print the signals emitted."
+    )
+    replay_parser.add_argument("trace")
+    replay_parser.add_argument(
+        "--config",
+        help="Take the AFK settings from this configuration file.",
+    )
+    replay_parser.add_argument("--input-timeout", type=float)
+    replay_parser.add_argument("--limbo-timeout-to-back", type=float)
+    replay_parser.add_argument("--limbo-timeout-to-afk", type=float)
+    replay_parser.add_argument(
+        "--scheduled-timeouts", type=float, nargs="+", metavar="TIMEOUT"
+    )
+    replay_parser.add_argument(
+        "--resets-scheduled-events-on-limbo", action="store_true", default=None
+    )
+
+    synthesize_parser = subparsers.add_parser(
+        "synthesize", help="Make up a trace of a workday."
+    )
+    synthesize_parser.add_argument("trace")
+    synthesize_parser.add_argument("--hours", type=float, default=8)
+    synthesize_parser.add_argument("--seed", type=int)
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        recorder = TraceRecorder(
+            input_sources.create_input_source(args.backend)
+        )
+        recorder.start()
+        print("Recording input.  Press Ctrl-C to stop.")
+        try:
+            while True:
+                time.sleep(3_600)
+        except KeyboardInterrupt:
+            pass
+        trace = recorder.stop()
+        trace.save(args.trace)
+        print("Saved {} input events to {}".format(len(trace), args.trace))
+
+    elif args.command == "replay":
+        trace = InputTrace.load(args.trace)
+        options = {}
+        if args.config:
+            options.update(_worker_options_from_config(args.config))
+        for option in (
+            "input_timeout",
+            "limbo_timeout_to_back",
+            "limbo_timeout_to_afk",
+            "scheduled_timeouts",
+            "resets_scheduled_events_on_limbo",
+        ):
+            if getattr(args, option) is not None:
+                options[option] = getattr(args, option)
+
+        start = time.perf_counter()
+        emitted = replay_trace(trace, **options)
+        elapsed = time.perf_counter() - start
+
+        for emitted_time, name, value in emitted:
+            if name in ("afk", "at computer"):
+                print(
+                    _format_offset(emitted_time),
+                    name,
+                    "since",
+                    _format_offset(value),
+                )
+            elif name == "scheduled":
+                print(_format_offset(emitted_time), name, value)
+            else:
+                print(_format_offset(emitted_time), name)
+        print(
+            "Replayed {} of input ({} events) in {:.3f} seconds.".format(
+                _format_offset(trace.duration / 1_000)[1:],
+                len(trace),
+                elapsed,
+            )
+        )
+
+    elif args.command == "synthesize":
+        trace = synthesize_trace(args.hours, args.seed)
+        trace.save(args.trace)
+        print("Saved {} input events to {}".format(len(trace), args.trace))
+
+
+if __name__ == "__main__":
+    main()
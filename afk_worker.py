@@ -1,17 +1,39 @@
 """Detects AFK status based on mouse and keyboard activity."""
 
+import heapq
+import itertools
+import math
+import threading
 import time
-from typing import List, Optional
+from typing import Callable, List, Optional
 import logging
 
 # pylint: disable=import-error
-import pynput
-from PySide6.QtCore import QObject, QThread, QTimer, Slot, Signal
+from PySide6.QtCore import Qt, QObject, QThread, QTimer, Slot, Signal
+
+from metrics import Histogram
+import input_sources
+from timer_service import TimerService
 
 
 logger = logging.getLogger(__name__)
 
 
+class _CallbackRunner(QObject):
+    """
+    Calls a function with the value emitted by whichever signal is connected
+    to `run`, in the thread this object was created in.
+    """
+
+    def __init__(self, function):
+        super().__init__()
+        self._function = function
+
+    @Slot(int)
+    def run(self, value):
+        self._function(value)
+
+
 # pylint: disable=too-many-instance-attributes, too-few-public-methods
 class AFKWorker(QObject):
     """
@@ -25,6 +47,12 @@ class AFKWorker(QObject):
     in_limbo_signal = Signal()
     leaving_limbo_signal = Signal()
     scheduled_signal = Signal(float)
+    input_activity_signal = Signal(float, int)
+
+    _input_wake_signal = Signal()
+    _scheduled_events_changed_signal = Signal()
+    _scheduled_event_due_signal = Signal(int)
+    _input_burst_signal = Signal()
 
     _AT_COMPUTER = "at computer"  # pylint: disable=invalid-name
     _AFK = "away from keyboard"  # pylint: disable=invalid-name
@@ -41,6 +69,15 @@ class AFKWorker(QObject):
         monitor_interval: float = 100,
         resets_scheduled_events_on_limbo: bool = False,
         allows_scheduled_events_before_afk: bool = False,
+        measures_input_latency: bool = False,
+        uses_deadline_timer: bool = True,
+        input_backend: str = "pynput",
+        input_backend_options: Optional[dict] = None,
+        input_hub: Optional[input_sources.InputHub] = None,
+        input_signal_interval: float = 0,
+        timer_service: Optional[TimerService] = None,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
     ):
         # TODO Fill in missing argument documentation.
         """
@@ -67,13 +104,63 @@ class AFKWorker(QObject):
                 into an "AFK" state.  This value returned by this signal can be
                 analyzed to run a specific action.  The signals raised by this
                 process can be emitted before the AFKWorker object officially
-                enters the "AFK" state.
+                enters the "AFK" state.  (To run a specific action without
+                having to analyze anything, use `add_scheduled_timeout`
+                instead.)
 
             monitor_interval: How frequently (in milliseconds) to monitor and
-                update the status.
+                update the status.  Only used if `uses_deadline_timer` is
+                False.
 
             resets_scheduled_events_on_limbo: TODO
             allows_scheduled_events_before_afk: TODO
+
+            measures_input_latency: Whether to time every call of the input
+                callback, and record the durations in the
+                `input_latency_histogram`.  The summary is logged when the
+                worker is stopped.
+
+            uses_deadline_timer: Whether to only monitor the status when it
+                could next change (the earliest of the input timeout, the limbo
+                timeouts and the next scheduled timeout), instead of every
+                `monitor_interval` milliseconds.  Input only wakes the monitor
+                while the status is waiting for it (i.e. "AFK", or in "limbo"
+                past `limbo_timeout_to_back`).
+
+            input_backend: How user input is detected.  One of the keys of
+                `input_sources.INPUT_BACKENDS`:  "pynput" (hooks every keyboard
+                and mouse event), "x11" (asks the X server for the idle time,
+                only when the status could change) or "evdev" (reads the Linux
+                input devices directly, from a single thread).
+
+            input_backend_options: Extra keyword arguments for the input
+                backend.
+
+            input_hub: Where to get the input source from.  Workers using the
+                same hub (by default, `input_sources.default_input_hub`) share
+                their input sources, so adding a worker doesn't add any more
+                input hooks.
+
+            input_signal_interval: Only applies if this worker is only
+                monitoring input (an `input_timeout` of 0, and no
+                `scheduled_timeouts`).  If 0, `at_computer_signal` and
+                `input_activity_signal` are emitted on every single input
+                event.  Otherwise, they're emitted at most once every this
+                many milliseconds:  straight away on the first input, and then
+                at the end of each interval with any input in it, with the
+                time of the latest input, and (for `input_activity_signal`)
+                how many input events there were.
+
+            timer_service: If given, the worker's timers run on this service
+                (so that their wakeups can be batched with the rest of the
+                app's), instead of on QTimers of their own.  The worker has to
+                live in the same thread as the service.
+
+            clock: The monotonic clock all the timeouts are measured with.  It
+                has to match the clock of the input source.  (This is meant
+                for replaying recorded input on a virtual clock.)
+
+            wall_clock: The clock the times emitted in signals come from.
         """
 
         super().__init__()
@@ -81,19 +168,9 @@ class AFKWorker(QObject):
         self._status = self._AT_COMPUTER
 
         self._input_timeout = input_timeout
-        if (
-            not allows_scheduled_events_before_afk
-            and scheduled_timeouts is not None
-        ):
-            earliest_scheduled_timeout = min(scheduled_timeouts)
-            if earliest_scheduled_timeout < input_timeout:
-                self._input_timeout = earliest_scheduled_timeout
-                logger.warning(
-                    # pylint: disable=line-too-long
-                    "You've scheduled an event to happen before the AFK period begins.  In general, this is discouraged, as it can lead to weird behavior.  The AFK period will be set to match your earliest scheduled timeout instead.  If you don't want this to happen, set `allows_scheduled_events_before_afk=True`.  Earliest scheduled timeout: %s.  Previous input_timeout: %s",
-                    earliest_scheduled_timeout,
-                    input_timeout,
-                )
+        self._allows_scheduled_events_before_afk = (
+            allows_scheduled_events_before_afk
+        )
 
         self._limbo_timeout_to_back = limbo_timeout_to_back
 
@@ -104,38 +181,114 @@ class AFKWorker(QObject):
                 limbo_timeout_to_back * limbo_timeout_to_afk_multiplier
             )
 
-        if scheduled_timeouts is not None:
-            self._scheduled_timeouts = scheduled_timeouts
-            self._scheduled_timeouts.sort()
-        else:
-            self._scheduled_timeouts = []
-        self._scheduled_current_index = 0
+        # ##############  Scheduled events
+        # The registry maps each handle to its timeout and callback.  The heap
+        #  holds (timeout, handle) pairs for the events which haven't been
+        #  dispatched yet in the current AFK period.  Cancelled events are
+        #  left in the heap, and skipped when they reach the top.  All of
+        #  these can be changed from other threads, hence the lock.
+        self._scheduled_lock = threading.Lock()
+        self._scheduled_events = {}
+        self._scheduled_heap = []
+        self._scheduled_handles = itertools.count(1)
+        self._scheduled_elapsed_time = 0
+        self._needs_scheduled_reset = False
+        self._is_scheduled_change_pending = False
+        self._scheduled_callback_runner = _CallbackRunner(
+            self._run_scheduled_callback
+        )
+        self._scheduled_event_due_signal.connect(
+            self._scheduled_callback_runner.run
+        )
 
         self._monitor_interval = monitor_interval
+        self._uses_deadline_timer = uses_deadline_timer
+        self._is_waiting_for_input = False
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self.next_wakeup_time = None
+        self.wakeup_count = 0
+        self._started_time = 0
         self._resets_scheduled_events_on_limbo = (
             resets_scheduled_events_on_limbo
         )
 
-        self._last_input_time = time.time()
-        self._last_input_before_afk = 0
-        self._entered_limbo_time = 0
-
-        self.kb_listener = pynput.keyboard.Listener(on_press=self._on_input)
-        self.mouse_listener = pynput.mouse.Listener(
-            on_move=self._on_input,
-            on_click=self._on_input,
-            on_scroll=self._on_input,
-        )
-
         self._is_only_monitoring_input = (
             self._input_timeout <= 0 and scheduled_timeouts is None
         )
+
+        # The input source only stores the time of the latest input (or works
+        #  it out when asked).  The monitor, running in this worker's thread,
+        #  does everything else, which means that the status is only ever
+        #  changed by one thread.
+        self._input_hub = input_hub or input_sources.default_input_hub
+        self._input_source = self._input_hub.subscribe(
+            input_backend,
+            measures_latency=measures_input_latency,
+            **(input_backend_options or {}),
+        )
+        self.input_latency_histogram = (
+            self._input_source.latency_histogram
+            or Histogram("Input callback latency")
+        )
+        # Keep hold of these, so they can be removed from the source again.
+        self._wake_callback = self._input_wake_signal.emit
+        self._tick_callback = self._on_input_tick
+        if self._is_only_monitoring_input:
+            self._input_source.add_input_callback(self._tick_callback)
+
+        # The input thread only counts events while a burst of input is being
+        #  coalesced.  It takes one queued signal to start a burst, then this
+        #  worker's timer emits once per interval until the input stops.
+        self._input_signal_interval = input_signal_interval
+        self._input_count_lock = threading.Lock()
+        self._input_count = 0
+        self._is_coalescing_input = False
+        if self._is_only_monitoring_input and self._input_signal_interval > 0:
+            if timer_service is not None:
+                self._input_signal_timer = timer_service.create_timer(
+                    self._emit_coalesced_input, single_shot=True
+                )
+            else:
+                self._input_signal_timer = QTimer(self)
+                self._input_signal_timer.setSingleShot(True)
+                self._input_signal_timer.timeout.connect(
+                    self._emit_coalesced_input
+                )
+            self._input_burst_signal.connect(self._emit_coalesced_input)
+
+        for timeout in sorted(scheduled_timeouts or []):
+            self.add_scheduled_timeout(timeout)
+
+        # All of these times come from the monotonic `clock`.  They are only
+        #  converted to wall clock times when they are emitted in a signal.
+        self._last_seen_input_time = self._input_source.last_input_time()
+        self._last_input_before_afk = 0
+        self._entered_limbo_time = 0
         self._is_using_limbo_state = self._limbo_timeout_to_back > 0
 
         if not self._is_only_monitoring_input:
-            self._timer = QTimer(self)
-            self._timer.timeout.connect(self._monitor_status)
-            self.stopTimerSignal.connect(self._stop_worker)
+            if timer_service is not None:
+                # The monitor only checks timeouts with `>`, so any slack is
+                #  fine.
+                self._timer = timer_service.create_timer(
+                    self._monitor_status,
+                    single_shot=self._uses_deadline_timer,
+                )
+            else:
+                self._timer = QTimer(self)
+                self._timer.timeout.connect(self._monitor_status)
+                if self._uses_deadline_timer:
+                    self._timer.setSingleShot(True)
+                    self._timer.setTimerType(Qt.PreciseTimer)
+            if self._uses_deadline_timer:
+                self._input_wake_signal.connect(self._on_input_wake)
+                # Queued, so that adding lots of events at once only wakes
+                #  the monitor once.
+                self._scheduled_events_changed_signal.connect(
+                    self._on_scheduled_events_changed, Qt.QueuedConnection
+                )
+        self.stopTimerSignal.connect(self._stop_worker)
 
         # ##############  Log signals being emitted
         self.afk_signal.connect(
@@ -155,37 +308,210 @@ class AFKWorker(QObject):
             lambda t: logger.info("Scheduled event (%s)", t)
         )
 
-    # pylint: disable=unused-argument
-    def _on_input(self, *args):
-        """Runs whenever mouse or keyboard activity is detected."""
-        self._last_input_time = time.time()
+    # ##############  Scheduled events
+    def add_scheduled_timeout(
+        self, timeout: float, callback: Optional[Callable[[], None]] = None
+    ) -> int:
+        """
+        Schedules an event for when `timeout` seconds have passed without any
+        input (i.e. into an "AFK" period), which can be done at any time, from
+        any thread.
 
-        if not self._is_only_monitoring_input:
-            if self._is_using_limbo_state:
-                if self._status == self._AFK:
-                    self._status = self._IN_LIMBO
-                    self._entered_limbo_time = time.time()
-                    self.in_limbo_signal.emit()
-                elif self._status == self._IN_LIMBO:
-                    elapsed_limbo_time = time.time() - self._entered_limbo_time
-                    if elapsed_limbo_time > self._limbo_timeout_to_back:
-                        self._status = self._AT_COMPUTER
-                        self.leaving_limbo_signal.emit()
-                        self.at_computer_signal.emit(self._entered_limbo_time)
+        When the event is due, `scheduled_signal` is emitted with the timeout,
+        and `callback` (if there is one) is called in the thread that created
+        this worker.  If the current AFK period is already past the timeout,
+        the event will first be due in the next one.
+
+        Returns a handle for the event, which can be used to cancel it.
+        """
+        if self._is_only_monitoring_input:
+            raise RuntimeError(
+                "Can't schedule events on a worker that is only monitoring"
+                " input."
+            )
+
+        if (
+            not self._allows_scheduled_events_before_afk
+            and timeout < self._input_timeout
+        ):
+            previous_input_timeout = self._input_timeout
+            self._input_timeout = timeout
+            logger.warning(
+                # pylint: disable=line-too-long
+                "You've scheduled an event to happen before the AFK period begins.  In general, this is discouraged, as it can lead to weird behavior.  The AFK period will be set to match your earliest scheduled timeout instead.  If you don't want this to happen, set `allows_scheduled_events_before_afk=True`.  Earliest scheduled timeout: %s.  Previous input_timeout: %s",
+                timeout,
+                previous_input_timeout,
+            )
+
+        with self._scheduled_lock:
+            handle = next(self._scheduled_handles)
+            self._scheduled_events[handle] = (timeout, callback)
+            if timeout >= self._scheduled_elapsed_time:
+                heapq.heappush(self._scheduled_heap, (timeout, handle))
             else:
-                if self._status == self._AFK:
+                self._needs_scheduled_reset = True
+
+        self._notify_scheduled_events_changed()
+        return handle
+
+    def cancel_scheduled_timeout(self, handle: int) -> bool:
+        """
+        Cancels a scheduled event, from any thread.  Its callback won't be
+        called after this returns, even if the event was already due.
+
+        Returns whether there was such an event to cancel.
+        """
+        with self._scheduled_lock:
+            was_scheduled = (
+                self._scheduled_events.pop(handle, None) is not None
+            )
+        if was_scheduled:
+            self._notify_scheduled_events_changed()
+        return was_scheduled
+
+    def _notify_scheduled_events_changed(self):
+        # Before the worker starts, there's no timer to re-arm yet.
+        if self._started_time and not self._is_scheduled_change_pending:
+            self._is_scheduled_change_pending = True
+            self._scheduled_events_changed_signal.emit()
+
+    @Slot()
+    def _on_scheduled_events_changed(self):
+        """Re-arms the deadline timer after events are added or cancelled."""
+        self._is_scheduled_change_pending = False
+        self._monitor_status()
+
+    def _run_scheduled_callback(self, handle):
+        with self._scheduled_lock:
+            _, callback = self._scheduled_events.get(handle, (None, None))
+        if callback is not None:
+            callback()
+
+    def _reset_scheduled_events(self):
+        """Makes all the scheduled events pending again, for a new period."""
+        with self._scheduled_lock:
+            self._scheduled_elapsed_time = 0
+            if not self._needs_scheduled_reset:
+                return
+            self._scheduled_heap = [
+                (timeout, handle)
+                for handle, (timeout, _) in self._scheduled_events.items()
+            ]
+            heapq.heapify(self._scheduled_heap)
+            self._needs_scheduled_reset = False
+
+    def _dispatch_scheduled_events(self, elapsed_time):
+        """Emits the signals for all the scheduled events which are now due."""
+        due_events = []
+        with self._scheduled_lock:
+            self._scheduled_elapsed_time = elapsed_time
+            heap = self._scheduled_heap
+            while heap and elapsed_time > heap[0][0]:
+                timeout, handle = heapq.heappop(heap)
+                if handle in self._scheduled_events:
+                    due_events.append((timeout, handle))
+                    self._needs_scheduled_reset = True
+
+        for timeout, handle in due_events:
+            self.scheduled_signal.emit(timeout)
+            self._scheduled_event_due_signal.emit(handle)
+
+    def _next_scheduled_timeout(self):
+        """Returns the timeout of the next pending scheduled event, if any."""
+        with self._scheduled_lock:
+            heap = self._scheduled_heap
+            while heap and heap[0][1] not in self._scheduled_events:
+                heapq.heappop(heap)
+            return heap[0][0] if heap else None
+
+    # ##############  Monitoring
+    def _on_input_tick(self):
+        """
+        Runs whenever mouse or keyboard activity is detected, if this worker
+        is only monitoring input.
+        """
+        if self._input_signal_interval <= 0:
+            input_time = self._wall_clock()
+            self.at_computer_signal.emit(input_time)
+            self.input_activity_signal.emit(input_time, 1)
+            return
+
+        with self._input_count_lock:
+            self._input_count += 1
+            if self._is_coalescing_input:
+                return
+            self._is_coalescing_input = True
+        self._input_burst_signal.emit()
+
+    @Slot()
+    def _emit_coalesced_input(self):
+        """
+        Emits the input counted since the last emission, at the start of a
+        burst of input and at the end of each interval during it.
+        """
+        with self._input_count_lock:
+            count, self._input_count = self._input_count, 0
+            if count == 0:
+                self._is_coalescing_input = False
+                return
+        input_time = self._to_wall_time(self._input_source.last_input_time())
+        self.at_computer_signal.emit(input_time)
+        self.input_activity_signal.emit(input_time, count)
+        self._input_signal_timer.start(self._input_signal_interval)
+
+    @Slot()
+    def _on_input_wake(self):
+        """Runs on the first input after we started waiting for it."""
+        self._is_waiting_for_input = False
+        self._monitor_status()
+
+    def _to_wall_time(self, monotonic_time):
+        """Converts a time from `clock` to a time from `wall_clock`."""
+        return self._wall_clock() - (self._clock() - monotonic_time)
+
+    def _handle_input(self, input_time):
+        """
+        Updates the status after input has been detected.
+
+        Only the latest input since the last time the status was monitored is
+        considered, which is enough to know whether there has been any input
+        at all, and whether there has been any input past the limbo timeout.
+        """
+        if self._is_using_limbo_state:
+            if self._status == self._AFK:
+                self._status = self._IN_LIMBO
+                self._entered_limbo_time = input_time
+                self.in_limbo_signal.emit()
+            elif self._status == self._IN_LIMBO:
+                elapsed_limbo_time = input_time - self._entered_limbo_time
+                if elapsed_limbo_time > self._limbo_timeout_to_back:
                     self._status = self._AT_COMPUTER
-                    self.at_computer_signal.emit(time.time())
+                    self.leaving_limbo_signal.emit()
+                    self.at_computer_signal.emit(
+                        self._to_wall_time(self._entered_limbo_time)
+                    )
         else:
-            self.at_computer_signal.emit(time.time())
+            if self._status == self._AFK:
+                self._status = self._AT_COMPUTER
+                self.at_computer_signal.emit(self._to_wall_time(input_time))
 
         if self._status == self._AT_COMPUTER:
-            self._scheduled_current_index = 0
+            self._reset_scheduled_events()
 
     @Slot()
     def _monitor_status(self):
-        """Runs at a regular interval to check for AFK conditions"""
-        elapsed_input_time = time.time() - self._last_input_time
+        """Checks for AFK conditions whenever the status could change."""
+        self.wakeup_count += 1
+        now = self._clock()
+
+        # Reading the timestamp once keeps this consistent, even if the
+        #  listener threads store a new one while we're working.
+        last_input_time = self._input_source.last_input_time()
+        if last_input_time != self._last_seen_input_time:
+            self._last_seen_input_time = last_input_time
+            self._handle_input(last_input_time)
+
+        elapsed_input_time = now - last_input_time
 
         if (
             self._status == self._IN_LIMBO
@@ -198,38 +524,123 @@ class AFKWorker(QObject):
             and elapsed_input_time > self._input_timeout
         ):
             self._status = self._AFK
-            self._last_input_before_afk = self._last_input_time
-            self.afk_signal.emit(self._last_input_time)
-
-        while True:
-            if self._scheduled_current_index >= len(self._scheduled_timeouts):
-                break
-            current_scheduled_time = self._scheduled_timeouts[
-                self._scheduled_current_index
-            ]
+            self._last_input_before_afk = last_input_time
+            self.afk_signal.emit(self._to_wall_time(last_input_time))
+
+        if (
+            self._status in (self._AFK, self._IN_LIMBO)
+            and not self._resets_scheduled_events_on_limbo
+        ):
+            elapsed_input_time = now - self._last_input_before_afk
+        self._dispatch_scheduled_events(elapsed_input_time)
+
+        if self._uses_deadline_timer:
+            self._arm_next_deadline(now)
+
+    def _next_deadline(self, now):
+        """
+        Returns the earliest time (from `clock`) at which the status
+        could change without any further input (or None if it can't), and
+        whether any further input could change the status before then.
+        """
+        last_input_time = self._last_seen_input_time
+        deadlines = []
+        wakes_on_input = False
+
+        if self._status == self._AT_COMPUTER:
+            deadlines.append(last_input_time + self._input_timeout)
+            scheduled_reference_time = last_input_time
+        else:
+            if self._status == self._IN_LIMBO:
+                deadlines.append(last_input_time + self._limbo_timeout_to_afk)
+                back_time = (
+                    self._entered_limbo_time + self._limbo_timeout_to_back
+                )
+                if now <= back_time:
+                    deadlines.append(back_time)
+                else:
+                    wakes_on_input = True
+            else:
+                wakes_on_input = True
+
             if (
-                self._status in (self._AFK, self._IN_LIMBO)
-                and not self._resets_scheduled_events_on_limbo
+                self._status == self._IN_LIMBO
+                and self._resets_scheduled_events_on_limbo
             ):
-                elapsed_input_time = time.time() - self._last_input_before_afk
-            if elapsed_input_time > current_scheduled_time:
-                self.scheduled_signal.emit(current_scheduled_time)
-                self._scheduled_current_index += 1
+                scheduled_reference_time = last_input_time
+            else:
+                scheduled_reference_time = self._last_input_before_afk
+
+        next_scheduled_timeout = self._next_scheduled_timeout()
+        if next_scheduled_timeout is not None:
+            deadlines.append(scheduled_reference_time + next_scheduled_timeout)
+
+        return min(deadlines, default=None), wakes_on_input
+
+    def _arm_next_deadline(self, now):
+        """Starts the single-shot timer for the next possible status change."""
+        deadline, wakes_on_input = self._next_deadline(now)
+
+        if wakes_on_input and not self._is_waiting_for_input:
+            if self._input_source.wake_on_input(self._wake_callback):
+                self._is_waiting_for_input = True
+                if (
+                    self._input_source.last_input_time()
+                    != self._last_seen_input_time
+                ):
+                    # Input arrived while we were working all this out, and
+                    #  nobody was listening for it yet.
+                    self.next_wakeup_time = now
+                    self._timer.start(0)
+                    return
             else:
-                break
+                poll_time = now + self._input_source.poll_interval_after(
+                    now - self._last_seen_input_time
+                )
+                deadline = min(deadline or poll_time, poll_time)
+
+        if deadline is None:
+            self.next_wakeup_time = None
+            self._timer.stop()
+        else:
+            # The timeouts are all checked with `>`, so we go a hair past the
+            #  deadline to avoid waking up for nothing.
+            msecs = max(0, math.ceil((deadline - now) * 1_000) + 1)
+            self.next_wakeup_time = now + msecs / 1_000
+            self._timer.start(msecs)
 
     @Slot()
     def start_worker(self):
         """The slot to call when the thread running this worker is started."""
+        self._started_time = self._clock()
+        self._input_source.start()
         if not self._is_only_monitoring_input:
-            self._timer.start(self._monitor_interval)
-        self.kb_listener.start()
-        self.mouse_listener.start()
+            if self._uses_deadline_timer:
+                self._monitor_status()
+            else:
+                self._timer.start(self._monitor_interval)
 
     @Slot()
     def _stop_worker(self):
         """The slot to call before shutting the thread down."""
+        self._input_source.remove_callback(self._wake_callback)
+        self._input_source.remove_callback(self._tick_callback)
+        self._input_source.stop()
+        self._input_hub.unsubscribe(self._input_source)
+        if self._is_only_monitoring_input:
+            if self._input_signal_interval > 0:
+                self._input_signal_timer.stop()
+            return
         self._timer.stop()
+        hours_running = (self._clock() - self._started_time) / 3_600
+        if hours_running > 0:
+            logger.info(
+                "%s monitor wakeups (%.1f per hour)",
+                self.wakeup_count,
+                self.wakeup_count / hours_running,
+            )
+        if self.input_latency_histogram.count:
+            logger.info(self.input_latency_histogram.summary())
 
 
 if __name__ == "__main__":
@@ -245,12 +656,10 @@ if __name__ == "__main__":
     }
 
     afk_thread = QThread()
-    afk_worker = AFKWorker(
-        input_timeout=10,
-        scheduled_timeouts=list(scheduled_events.keys()),
-    )
+    afk_worker = AFKWorker(input_timeout=10, measures_input_latency=True)
 
-    afk_worker.scheduled_signal.connect(lambda t: scheduled_events[t]())
+    for timeout, action in scheduled_events.items():
+        afk_worker.add_scheduled_timeout(timeout, action)
 
     afk_worker.at_computer_signal.connect(
         lambda t: print(
@@ -281,10 +690,10 @@ if __name__ == "__main__":
 
     # ##############  Set up thread that ticks on any input
     input_thread = QThread()
-    input_worker = AFKWorker(input_timeout=0)
+    input_worker = AFKWorker(input_timeout=0, input_signal_interval=250)
 
-    input_worker.at_computer_signal.connect(
-        lambda: print(".", end="", flush=True)
+    input_worker.input_activity_signal.connect(
+        lambda t, count: print(".", end="", flush=True)
     )
 
     input_worker.moveToThread(input_thread)
@@ -302,6 +711,7 @@ if __name__ == "__main__":
         afk_worker.stopTimerSignal.emit()
         afk_thread.quit()
         afk_thread.wait()
+        print(afk_worker.input_latency_histogram.summary())
 
         input_worker.stopTimerSignal.emit()
         input_thread.quit()
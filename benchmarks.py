@@ -0,0 +1,1103 @@
+"""
+Benchmarks for the hot paths of the Gentle Break Reminder.
+
+These aren't tests, and nothing fails:  they print numbers to compare before
+and after a change.  Run all of them, or pick some by name:
+
+    python benchmarks.py
+    python benchmarks.py input_signal_queue break_timeline timer_batching
+    python benchmarks.py deadline_jitter event_dispatch event_bus low_power
+    python benchmarks.py tooltip pulse_schedules glowbox_frames
+    python benchmarks.py glowbox_bandwidth state_files break_countdown
+
+The glow box is painted on Qt's offscreen platform, unless QT_QPA_PLATFORM
+says otherwise.
+"""
+
+import argparse
+import copy
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+
+# pylint: disable=import-error
+from PySide6.QtCore import (
+    Qt,
+    Property,
+    QObject,
+    QThread,
+    QTimer,
+    Slot,
+)
+
+# pylint: disable=import-error
+from PySide6.QtGui import QColor, QPalette
+
+# pylint: disable=import-error
+from PySide6.QtWidgets import QApplication, QSizeGrip, QWidget
+
+import afk_worker as aw
+import break_engine as be
+import breakscreen as bs
+import clock_watcher as cw
+import event_bus as eb
+import glowbox as gb
+import input_sources
+import low_power as lp
+import persistence
+import simulation
+import timer_service as ts
+import tooltip
+from metrics import Histogram
+
+
+def _get_app():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    return QApplication.instance() or QApplication([])
+
+
+# ##############  Input-only AFK worker signals
+class _BusyReceiver(QObject):
+    """
+    Stands in for the GUI thread:  each delivered signal costs some work, and
+    the depth of the event queue is sampled on every delivery.
+    """
+
+    def __init__(self, handler_cost):
+        super().__init__()
+        self.handler_cost = handler_cost
+        self.emitted = 0
+        self.delivered = 0
+        self.max_queue_depth = 0
+
+    def count_emission(self, *_):
+        # Connected directly, so this runs in the emitting thread.
+        self.emitted += 1
+
+    @Slot(float, int)
+    def on_input_activity(self, _input_time, _count):
+        self.max_queue_depth = max(
+            self.max_queue_depth, self.emitted - self.delivered
+        )
+        self.delivered += 1
+        time.sleep(self.handler_cost)
+
+
+def measure_input_signal_queue(
+    input_signal_interval, events_per_second=1_000, seconds=2.0
+):
+    """
+    Feeds a constant stream of input (like a mouse being moved around) to an
+    input-only AFKWorker, and measures the receiving thread's event queue.
+
+    Returns the number of signals emitted, the maximum queue depth, and how
+    long (in seconds) the receiver took to catch up after the input stopped.
+    """
+    app = _get_app()
+    input_hub = input_sources.InputHub()
+    worker = aw.AFKWorker(
+        input_timeout=0,
+        input_backend="replay",
+        input_hub=input_hub,
+        input_signal_interval=input_signal_interval,
+    )
+    input_source = input_hub.subscribe("replay")
+
+    # A receiver that takes 2 ms per signal can handle 500 signals a second.
+    receiver = _BusyReceiver(handler_cost=0.002)
+    worker.input_activity_signal.connect(
+        receiver.count_emission, Qt.DirectConnection
+    )
+    worker.input_activity_signal.connect(receiver.on_input_activity)
+
+    thread = QThread()
+    worker.moveToThread(thread)
+    thread.started.connect(worker.start_worker)
+    thread.start()
+
+    feeding_ended = []
+
+    def feed():
+        start = time.monotonic()
+        for i in range(int(events_per_second * seconds)):
+            next_time = start + i / events_per_second
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            input_source.feed(time.monotonic())
+        feeding_ended.append(time.monotonic())
+
+    def quit_when_caught_up():
+        if (
+            feeding_ended
+            and receiver.delivered == receiver.emitted
+            # Give a pending coalesced emission time to turn up.
+            and time.monotonic() - feeding_ended[0]
+            > 2 * input_signal_interval / 1_000
+        ):
+            app.quit()
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    poll_timer = QTimer(timeout=quit_when_caught_up)
+    poll_timer.start(1)
+    feeder.start()
+    app.exec()
+    caught_up_time = time.monotonic()
+    poll_timer.stop()
+    feeder.join()
+
+    worker.stopTimerSignal.emit()
+    thread.quit()
+    thread.wait()
+    input_hub.unsubscribe(input_source)
+
+    lag = max(
+        0.0,
+        caught_up_time
+        - feeding_ended[0]
+        - 2 * input_signal_interval / 1_000
+        - 0.001,
+    )
+    return receiver.emitted, receiver.max_queue_depth, lag
+
+
+def benchmark_input_signal_queue():
+    print("Input-only signals, 1000 input events/s for 2 s, 2 ms per signal:")
+    print("  interval   signals   max queue depth   catch-up lag")
+    for interval in (0, 50, 250):
+        emitted, max_depth, lag = measure_input_signal_queue(interval)
+        print(
+            "  {:>5} ms {:>9} {:>17} {:>11.0f} ms".format(
+                interval, emitted, max_depth, lag * 1_000
+            )
+        )
+
+
+# ##############  Break timeline
+def _time_calls(function, make_argument, repeat=20_000):
+    """
+    Times `function(make_argument())`, without timing `make_argument`, and
+    returns a histogram of the durations (in nanoseconds).
+    """
+    histogram = Histogram()
+    for _ in range(repeat):
+        argument = make_argument()
+        start = time.perf_counter_ns()
+        function(argument)
+        histogram.record(time.perf_counter_ns() - start)
+    return histogram
+
+
+def benchmark_break_timeline():
+    short_length, max_spacing, long_length, spacing = 20, 1_200, 600, 3_000
+    anchor = 1_000_000.0
+    long_break_time = anchor + spacing
+
+    timeline = be.BreakTimeline(
+        short_length, max_spacing, long_length, spacing
+    )
+    timeline.update(anchor, long_break_time)
+    first_break = timeline.next_short_break_time
+
+    # What the user did since the plan was made, as the anchor and long break
+    #  time the timeline is moved to.
+    events = {
+        "break taken on time": (first_break + short_length, long_break_time),
+        "break taken late": (first_break + 90 + short_length, long_break_time),
+        "break skipped": (first_break, long_break_time),
+        "reset by a short AFK": (anchor + 700, long_break_time),
+        "reset by a long AFK": (anchor + 900, anchor + 900 + spacing),
+    }
+
+    print("Break timeline updates (20 s short breaks, 50 min cycle):")
+    print("  {:<24} {:>8} {:>8}".format("event", "p50", "p99"))
+    for name, (new_anchor, new_long_break_time) in events.items():
+        histogram = _time_calls(
+            lambda tl, a=new_anchor, t=new_long_break_time: tl.update(a, t),
+            lambda: copy.copy(timeline),
+        )
+        print(
+            "  {:<24} {:>6}ns {:>6}ns".format(
+                name, histogram.p50, histogram.p99
+            )
+        )
+
+    for count in (2, 5, 20):
+        histogram = _time_calls(
+            lambda tl, n=count: tl.next_breaks(n), lambda: timeline
+        )
+        print(
+            "  {:<24} {:>6}ns {:>6}ns".format(
+                "next_breaks({})".format(count), histogram.p50, histogram.p99
+            )
+        )
+
+
+# ##############  Timer batching
+def measure_timer_batching(slack, timer_count=10, seconds=3.0, seed=1):
+    """
+    Runs `timer_count` repeating timers, at random intervals between 20 and
+    200 ms, on a TimerService with the given `slack` (in seconds).
+
+    Returns the wakeups per second, and a histogram of how late (in
+    microseconds) the callbacks ran.
+    """
+    app = _get_app()
+    rng = random.Random(seed)
+    service = ts.TimerService(slack=slack)
+    lateness = Histogram(unit="us")
+
+    def make_callback(interval, start):
+        def callback():
+            # Missed intervals are skipped, so this is measured from the
+            #  latest one that has passed.
+            now = time.monotonic()
+            late = (now - start) % interval
+            lateness.record(round(late * 1_000_000))
+
+        return callback
+
+    start = time.monotonic()
+    for _ in range(timer_count):
+        interval = rng.uniform(0.02, 0.2)
+        service.call_every(interval, make_callback(interval, start))
+    QTimer.singleShot(round(seconds * 1_000), app.quit)
+    app.exec()
+    elapsed = time.monotonic() - start
+    return service.wakeup_count / elapsed, lateness
+
+
+def benchmark_timer_batching():
+    print("Timer batching, 10 timers every 20-200 ms, for 3 s:")
+    print("  slack   wakeups/s   callbacks   late p50   late max")
+    for slack_ms in (0, 10, 50):
+        wakeups_per_second, lateness = measure_timer_batching(slack_ms / 1_000)
+        print(
+            "  {:>2} ms {:>11.1f} {:>11} {:>8}us {:>8}us".format(
+                slack_ms,
+                wakeups_per_second,
+                lateness.count,
+                lateness.p50,
+                lateness.max,
+            )
+        )
+
+
+# ##############  Break deadline jitter
+class _DayOfClocks:
+    """
+    The clocks of a made up day, as functions of the real (elapsed) time:  a
+    monotonic clock (which the timers run on) that stops while the computer
+    is suspended, and a wall clock which gets stepped now and then.
+    """
+
+    EPOCH = 1_700_000_000.0
+
+    def __init__(self, rng, day_length):
+        self.suspends = []
+        for _ in range(rng.choice([0, 1, 1, 2])):
+            self.suspends.append(
+                (rng.uniform(0, day_length), rng.uniform(5 * 60, 90 * 60))
+            )
+        self.suspends.sort()
+        # NTP corrections, and now and then the clock being set by hand.
+        self.steps = [
+            (rng.uniform(0, day_length), rng.uniform(-2, 2)) for _ in range(4)
+        ]
+        if rng.random() < 0.05:
+            self.steps.append(
+                (rng.uniform(0, day_length), rng.choice([-3_600, 3_600]))
+            )
+
+    def monotonic(self, real_time):
+        return real_time - sum(
+            min(max(real_time - start, 0), duration)
+            for start, duration in self.suspends
+        )
+
+    def wall(self, real_time):
+        return (
+            self.EPOCH
+            + real_time
+            + sum(offset for time_, offset in self.steps if time_ <= real_time)
+        )
+
+    def is_suspended(self, real_time):
+        return any(
+            start <= real_time < start + duration
+            for start, duration in self.suspends
+        )
+
+    def real_time_after(self, real_time, monotonic_delay):
+        """When a timer started at `real_time` goes off."""
+        end = real_time + monotonic_delay
+        for start, duration in self.suspends:
+            if real_time <= start < end:
+                end += duration
+        return end
+
+
+class _SuspendedWorkday(simulation.SimulatedWorkday):
+    """
+    A simulated workday, with timers that stop while the computer is
+    suspended, and a break engine on the given clock.  Records how far from
+    its deadline each of the engine's timers went off, in `errors`.
+    """
+
+    def __init__(self, config, rng, clocks, engine_clock, timer_error, errors):
+        super().__init__(config, rng)
+        self.clocks = clocks
+        self.timer_error = timer_error
+        self.errors = errors
+        self.due_while_suspended = 0
+
+        def now():
+            return self.simulation.now
+
+        self.engine_clock = lambda: engine_clock(now())
+        self.engine = be.BreakEngine(
+            config,
+            self,
+            clock=self.engine_clock,
+            wall_clock=lambda: clocks.wall(now()),
+        )
+        self.clock_watcher = None
+
+    def watch_clocks(self):
+        self.clock_watcher = cw.ClockWatcher(
+            clock=lambda: self.clocks.monotonic(self.simulation.now),
+            elapsed_clock=lambda: self.simulation.now,
+            wall_clock=lambda: self.clocks.wall(self.simulation.now),
+        )
+        self.clock_watcher.suspended.connect(self.engine.handle_suspend)
+        self.clock_watcher.clock_stepped.connect(self.engine.handle_clock_step)
+        self._schedule_clock_check()
+
+    def run(self):
+        for start, duration in self.clocks.suspends:
+            self.simulation.schedule(
+                start, lambda duration=duration: self._suspend(duration)
+            )
+        return super().run()
+
+    # ##############  Timers
+    def _after_timer(self, delay, action):
+        now = self.simulation.now
+        end = self.clocks.real_time_after(now, self.timer_error(delay))
+        return self.simulation.schedule(end - now, action)
+
+    def start_timer(self, event, delay):
+        self.simulation.cancel(self._timers.get(event))
+        self._timers[event] = self._after_timer(
+            delay, lambda: self._on_timer(event)
+        )
+
+    def _on_timer(self, event):
+        deadline = self.engine.timer_deadlines.get(event)
+        if deadline is not None:
+            error = self.engine_clock() - deadline
+            if self.clocks.is_suspended(self.simulation.now - error):
+                self.due_while_suspended += 1
+            else:
+                self.errors.record(round(abs(error) * 1_000))
+        self._deliver(event)
+
+    def _schedule_clock_check(self):
+        def check():
+            self.clock_watcher.check()
+            self._schedule_clock_check()
+
+        self._after_timer(self.clock_watcher.interval, check)
+
+    # ##############  Suspends
+    def _suspend(self, duration):
+        # Nobody is using a suspended computer.  (Nothing fires while
+        #  suspended, apart from the user wandering back.)
+        self.is_away = True
+        self.simulation.cancel(self._pending_wander)
+        self.simulation.cancel(self._pending_reaction)
+        self.simulation.schedule(duration, self._resume)
+
+    def _resume(self):
+        self.is_away = False
+        self._schedule_wander()
+
+
+def measure_deadline_jitter(is_monotonic, suspend_policy, days=100, seed=1):
+    """
+    Simulates `days` workdays with suspends and wall clock steps, with break
+    deadlines either on the wall clock and timers as imprecise as Qt's
+    default (coarse) timers, or on a monotonic clock with precise timers and
+    a clock watcher.
+
+    Returns a histogram of how far (in milliseconds) the engine's timers
+    went off from their deadlines, and how many came due while suspended.
+    """
+    _get_app()
+    rng = random.Random(seed)
+    config = copy.deepcopy(simulation.DEFAULT_CONFIG)
+    config["general"]["suspend_policy"] = suspend_policy
+    errors = Histogram(unit="ms")
+    due_while_suspended = 0
+    for _ in range(days):
+        clocks = _DayOfClocks(rng, 8 * 3_600)
+        if is_monotonic:
+            workday = _SuspendedWorkday(
+                config,
+                rng,
+                clocks,
+                engine_clock=lambda real_time: real_time,
+                timer_error=lambda delay: delay + rng.uniform(0, 0.05),
+                errors=errors,
+            )
+            workday.watch_clocks()
+        else:
+            workday = _SuspendedWorkday(
+                config,
+                rng,
+                clocks,
+                engine_clock=clocks.wall,
+                timer_error=lambda delay: delay * rng.uniform(0.95, 1.05),
+                errors=errors,
+            )
+        workday.run()
+        due_while_suspended += workday.due_while_suspended
+    return errors, due_while_suspended
+
+
+def benchmark_deadline_jitter():
+    print(
+        "Break timers, actual vs. scheduled, over 100 simulated workdays with"
+        " suspends and clock steps:"
+    )
+    print(
+        "  {:<44} {:>7} {:>9} {:>9} {:>9} {:>8}".format(
+            "deadlines", "timers", "p50", "p99", "max", "asleep"
+        )
+    )
+    for name, is_monotonic, policy in (
+        ("wall clock, coarse timers", False, "wall_clock"),
+        ("monotonic, watched (count_as_afk)", True, "count_as_afk"),
+        ("monotonic, watched (pause)", True, "pause"),
+        ("monotonic, watched (wall_clock)", True, "wall_clock"),
+    ):
+        errors, due_while_suspended = measure_deadline_jitter(
+            is_monotonic, policy
+        )
+        print(
+            "  {:<44} {:>7} {:>7}ms {:>7}ms {:>7}ms {:>8}".format(
+                name,
+                errors.count,
+                errors.p50,
+                errors.p99,
+                errors.max,
+                due_while_suspended,
+            )
+        )
+
+
+# ##############  Event dispatch
+def _fire_timer(engine, event):
+    """Processes a timer's event, as if the timer had just gone off."""
+    engine.timer_deadlines.pop(event, None)
+    engine.process_event(event)
+
+
+class _SlowNotificationUI(be.BreakUI):
+    """A UI whose early notification takes a while to show."""
+
+    def show_early_notification(self, is_long_break):
+        time.sleep(0.005)
+
+
+def benchmark_event_dispatch():
+    config = copy.deepcopy(simulation.DEFAULT_CONFIG)
+    print("Break engine event dispatch:")
+    print("  {:<44} {:>8} {:>8}".format("event", "p50", "p99"))
+    for is_traced in (False, True):
+        engine = be.BreakEngine(config, trace_transitions=is_traced)
+        engine.start()
+        traced = " (traced)" if is_traced else ""
+
+        histogram = _time_calls(
+            engine.process_event, lambda: be.returned_to_computer
+        )
+        print(
+            "  {:<44} {:>6}ns {:>6}ns".format(
+                "ignored" + traced, histogram.p50, histogram.p99
+            )
+        )
+
+        def round_trip(_):
+            _fire_timer(engine, be.short_break_due_timeout)
+            engine.process_event(be.break_ended)
+
+        histogram = _time_calls(round_trip, lambda: None, repeat=5_000)
+        print(
+            "  {:<44} {:>6}ns {:>6}ns".format(
+                "notification shown and skipped" + traced,
+                histogram.p50,
+                histogram.p99,
+            )
+        )
+
+    engine = be.BreakEngine(
+        config, _SlowNotificationUI(), trace_transitions=True
+    )
+    engine.start()
+    for _ in range(10):
+        _fire_timer(engine, be.short_break_due_timeout)
+        engine.process_event(be.break_ended)
+    print("\nWith a notification that takes 5 ms to show:")
+    print(engine.trace.summary())
+
+
+# ##############  Event bus
+class _CountingUI(be.BreakUI):
+    """Counts the states entered, and the notifications shown and hidden."""
+
+    def __init__(self):
+        self.states_entered = 0
+        self.windows_changed = 0
+
+    def state_entered(self, state):
+        self.states_entered += 1
+
+    def show_early_notification(self, is_long_break):
+        self.windows_changed += 1
+
+    def hide_notification(self):
+        self.windows_changed += 1
+
+
+def measure_event_burst(uses_bus, burst):
+    """
+    Feeds `burst` (a list of events, all turning up in one turn of the event
+    loop) to a break engine showing a short break notification, directly or
+    through an event bus.
+
+    Returns the states entered, the windows shown or hidden, the time taken
+    (in seconds), and the bus (if there was one).
+    """
+    app = _get_app()
+    ui = _CountingUI()
+    engine = be.BreakEngine(copy.deepcopy(simulation.DEFAULT_CONFIG), ui)
+    engine.start()
+    _fire_timer(engine, be.short_break_due_timeout)
+    ui.states_entered = ui.windows_changed = 0
+
+    bus = None
+    if uses_bus:
+        bus = eb.EventBus(engine.process_event, be.EVENT_PRIORITIES)
+    start = time.perf_counter()
+    for event in burst:
+        if bus is None:
+            engine.process_event(event)
+        else:
+            bus.post(event)
+    app.processEvents()
+    return (
+        ui.states_entered,
+        ui.windows_changed,
+        time.perf_counter() - start,
+        bus,
+    )
+
+
+def benchmark_event_bus():
+    bursts = {
+        # The AFK worker flapping in and out of limbo.
+        "AFK flapping x 50": [
+            be.afk_short_period_ended,
+            be.returned_to_computer,
+        ]
+        * 50,
+        # The notification timing out just as the user clicks it.
+        "timeout and click": [
+            be.short_break_early_notif_timeout,
+            be.break_started,
+        ],
+    }
+    print("Bursts of events in one turn of the event loop:")
+    print(
+        "  {:<20} {:<8} {:>7} {:>8} {:>10}".format(
+            "burst", "via", "states", "windows", "time"
+        )
+    )
+    for name, burst in bursts.items():
+        for uses_bus in (False, True):
+            states, windows, elapsed, bus = measure_event_burst(
+                uses_bus, burst
+            )
+            print(
+                "  {:<20} {:<8} {:>7} {:>8} {:>8.0f}us".format(
+                    name,
+                    "bus" if uses_bus else "direct",
+                    states,
+                    windows,
+                    elapsed * 1_000_000,
+                )
+            )
+    print()
+    print(bus.summary())
+
+
+# ##############  Low power mode
+def measure_low_power(seconds=10.0):
+    """
+    Runs the app's periodic timers (as gentle.py sets them up while a long
+    break is counting down, or a late notification is up) on a
+    TimerService, for `seconds` awake and then `seconds` in low power mode,
+    with the same things paused as gentle.py pauses.
+
+    Returns the timer wakeups per hour awake, and in low power mode.
+    """
+    app = _get_app()
+    service = ts.TimerService(slack=0.05)
+    low_power_mode = lp.LowPowerMode(service)
+
+    tooltip_timer = service.create_timer(lambda: None, slack=1)
+    tooltip_timer.start(60_000)
+    countdown_timer = service.create_timer(lambda: None)
+    countdown_timer.start(1_000)
+    snapshot_timer = service.create_timer(lambda: None, slack=5)
+    snapshot_timer.start(60_000)
+    # Asking the X server whether the screens are off (DPMS).
+    screen_power_timer = service.create_timer(lambda: None, slack=1)
+    screen_power_timer.start(10_000)
+    clock_watcher = cw.ClockWatcher(timer_service=service)
+    clock_watcher.start()
+    # The end of the break, which has to stay on time.
+    service.call_later(20 * 60, lambda: None)
+
+    def enter():
+        tooltip_timer.stop()
+        countdown_timer.stop()
+        snapshot_timer.stop()
+        screen_power_timer.stop()
+        clock_watcher.pause()
+
+    low_power_mode.entered.connect(enter)
+
+    start = time.monotonic()
+    QTimer.singleShot(round(seconds * 1_000), low_power_mode.mark_away)
+    QTimer.singleShot(round(seconds * 2_000), app.quit)
+    app.exec()
+    awake_wakeups = service.wakeup_count - low_power_mode.totals()[1]
+    clock_watcher.stop()
+    return (
+        awake_wakeups / (time.monotonic() - start - seconds) * 3_600,
+        low_power_mode.wakeups_per_hour(),
+    )
+
+
+def benchmark_low_power():
+    print("Timer wakeups while a long break counts down, 10 s of each:")
+    awake, asleep = measure_low_power()
+    print("  awake            {:>8.0f} per hour".format(awake))
+    print(
+        "  low power mode   {:>8.0f} per hour  (target:  < 10)".format(asleep)
+    )
+
+
+# ##############  System tray tool tip
+def measure_tooltip(waits_for_change, hours=1.0, interval=3.0):
+    """
+    Renders the tool tip (with clock times, relative times and the time at
+    the computer) for `hours` of made up time, either every `interval`
+    seconds, or only when it says it will change.
+
+    Returns how many times it was rendered, and how many times the text
+    pushed to the tray changed.
+    """
+    now = 1_700_000_000.0
+    end = now + hours * 3_600
+    renderer = tooltip.ScheduleTooltip(
+        "Gentle Break Reminder",
+        "%-I:%M %p",
+        show_clock_times=True,
+        show_relative_times=True,
+        fraction_present=lambda window: 0.5,
+        presence_window=3_600,
+        wall_clock=lambda: now,
+    )
+    next_short_break = now + 17 * 60 + 20
+    next_long_break = now + 50 * 60
+
+    changes = 0
+    shown_text = None
+    while now < end:
+        text, wait = renderer.render(next_long_break, next_short_break)
+        if text != shown_text:
+            shown_text = text
+            changes += 1
+        now += wait if waits_for_change else interval
+    return renderer.render_count, changes
+
+
+def benchmark_tooltip():
+    print("System tray tool tip, for an hour:")
+    print("  renders when           renders   pushed to tray")
+    for waits_for_change in (False, True):
+        renders, changes = measure_tooltip(waits_for_change)
+        print(
+            "  {:<20} {:>9} {:>16}".format(
+                "it changes" if waits_for_change else "every 3 s",
+                renders,
+                # Before, every render was pushed to the tray.
+                changes if waits_for_change else renders,
+            )
+        )
+    renderer = tooltip.ScheduleTooltip(
+        "Gentle Break Reminder", "%-I:%M %p", True, True
+    )
+    durations = _time_calls(
+        lambda break_time: renderer.render(break_time, break_time - 600),
+        lambda: time.time() + 1_800,
+    )
+    print("  {}ns per render (p50)".format(durations.p50))
+
+
+# ##############  Glow box pulse schedules
+def benchmark_pulse_schedules():
+    print("Compiling the early notification's pulses (5 s down to 0.5 s):")
+    print("  length   pulses   keyframes   compile    cached   total")
+    for length in (30, 60, 300):
+        transitions = list(
+            gb.intervals_decreasing_over_total_time(
+                5, 0.5, length, "grey", "lime"
+            )
+        )
+        gb.early_notification_schedule.cache_clear()
+        start = time.perf_counter_ns()
+        schedule = gb.early_notification_schedule(
+            5, 0.5, length, "grey", "lime"
+        )
+        compiled = time.perf_counter_ns()
+        gb.early_notification_schedule(5, 0.5, length, "grey", "lime")
+        cached = time.perf_counter_ns()
+        print(
+            "  {:>4} s {:>8} {:>11} {:>7}us {:>7}ns {:>6}ms".format(
+                length,
+                len(transitions) // 2,
+                len(schedule.keyframes),
+                (compiled - start) // 1_000,
+                cached - compiled,
+                schedule.duration,
+            )
+        )
+    print("Each is played by one animation, with no Python in between pulses.")
+
+
+# ##############  Glow box frames
+class _PaletteGlowBox(QWidget):
+    """Paints its color the way the glow box used to:  with a new palette."""
+
+    color = Property(
+        QColor,
+        lambda self: self.palette().color(QPalette.Window),
+        lambda self, color: self.setPalette(QPalette(color)),
+    )
+
+    def __init__(self):
+        super().__init__()
+        self.setAutoFillBackground(True)
+        QSizeGrip(self).resize(5, 5)
+
+
+def measure_glowbox_frames(uses_color_table, paints=True, frames=2_000):
+    """
+    Shows a glow box, and times `frames` frames of a pulse:  setting the
+    animated property, and (if `paints`) painting the box.
+
+    Returns a histogram of the frame times (in nanoseconds).
+    """
+    app = _get_app()
+    levels = [
+        (1 - math.cos(2 * math.pi * frame / 200)) / 2
+        for frame in range(frames)
+    ]
+    if uses_color_table:
+        box = gb.GlowBox()
+        box.set_main_color("grey")
+        schedule = gb.steady_pulse_schedule(500, "grey", "red")
+        box.show()
+        box.play_schedule(schedule)
+        box.color_animation.stop()
+
+        def draw(level):
+            box.level = level
+            if paints:
+                box.repaint()
+
+    else:
+        box = _PaletteGlowBox()
+        box.setGeometry(0, 0, 100, 100)
+        box.show()
+        # The same colors as the animation would have made.
+        table = gb.color_table("grey", "red")
+        levels = [table[round(level * (len(table) - 1))] for level in levels]
+
+        def draw(color):
+            box.color = color
+            if paints:
+                box.repaint()
+
+    app.processEvents()
+    frame_times = _time_calls(draw, iter(levels).__next__, repeat=frames)
+    box.close()
+    return frame_times
+
+
+def benchmark_glowbox_frames():
+    print("Glow box frames:")
+    print("  painted with     setting p50   frame p50   frame p99")
+    for uses_color_table in (False, True):
+        setting_times = measure_glowbox_frames(uses_color_table, paints=False)
+        frame_times = measure_glowbox_frames(uses_color_table)
+        print(
+            "  {:<16} {:>9}ns {:>9}ns {:>9}ns".format(
+                "color table" if uses_color_table else "palette",
+                setting_times.p50,
+                frame_times.p50,
+                frame_times.p99,
+            )
+        )
+
+
+def measure_glowbox_bandwidth(max_frame_rate, color_steps, seconds=3.0):
+    """
+    Shows the late notification's steady pulse (a second each way) for
+    `seconds`, and returns the glow box's frame stats.
+    """
+    app = _get_app()
+    box = gb.GlowBox(max_frame_rate=max_frame_rate, color_steps=color_steps)
+    box.set_main_color("orchid")
+    box.show()
+    box.play_schedule(gb.steady_pulse_schedule(1_000, "orchid", "yellow"))
+    QTimer.singleShot(round(seconds * 1_000), app.quit)
+    app.exec()
+    # The animation can't outlive the box.
+    box.color_animation.stop()
+    box.close()
+    return box.frame_stats
+
+
+def benchmark_glowbox_bandwidth():
+    print("Glow box steady pulse, for 3 s:")
+    print("  frame cap   shades   frames/s   pixels/s")
+    for max_frame_rate, color_steps in ((0, 256), (0, 16), (8, 256), (8, 16)):
+        stats = measure_glowbox_bandwidth(max_frame_rate, color_steps)
+        seconds = stats.shown_seconds()
+        print(
+            "  {:>9} {:>8} {:>10.1f} {:>10.0f}".format(
+                max_frame_rate or "none",
+                color_steps,
+                stats.frame_count / seconds,
+                stats.painted_area / seconds,
+            )
+        )
+
+
+# ##############  State files
+def measure_state_files(uses_service, disk_latency, saves=200):
+    """
+    Saves the glow box's geometry `saves` times (a few times per change of
+    state, the way gentle.py closes the glow box), with every write to the
+    disk taking `disk_latency` seconds longer, like on a slow network home
+    directory.  Either each save writes the file straight away, the way the
+    glow box used to, or it goes through a PersistenceService.
+
+    Returns a Histogram of how long (in microseconds) each save took on the
+    calling thread, and how many times the file was written.
+    """
+    write_atomically = persistence.write_atomically
+    write_count = 0
+
+    def slow_write(filename, data):
+        nonlocal write_count
+        time.sleep(disk_latency)
+        write_atomically(filename, data)
+        write_count += 1
+
+    durations = Histogram(unit="us")
+    with tempfile.TemporaryDirectory() as directory:
+        persistence.write_atomically = slow_write
+        try:
+            state_files = persistence.PersistenceService(directory)
+            state_files.load(gb.GEOMETRY_FILE)
+            for i in range(saves):
+                # It's only moved once in a while.
+                geometry = {"location_x": i // 20, "location_y": 0}
+                start = time.perf_counter()
+                if uses_service:
+                    state_files.save(gb.GEOMETRY_FILE, geometry)
+                else:
+                    slow_write(
+                        state_files.path(gb.GEOMETRY_FILE),
+                        json.dumps(geometry, indent=2).encode("utf-8"),
+                    )
+                durations.record(round((time.perf_counter() - start) * 1e6))
+            state_files.close()
+        finally:
+            persistence.write_atomically = write_atomically
+    return durations, write_count
+
+
+def benchmark_state_files():
+    print("Saving the glow box's geometry 200 times, 10 distinct values:")
+    print("  disk latency   saved by       p50 us    max us   writes")
+    for disk_latency in (0, 0.02):
+        for uses_service in (False, True):
+            durations, writes = measure_state_files(uses_service, disk_latency)
+            print(
+                "  {:>9.0f} ms   {:<12} {:>8} {:>9} {:>8}".format(
+                    disk_latency * 1_000,
+                    "the service" if uses_service else "writing",
+                    durations.p50,
+                    durations.max,
+                    writes,
+                )
+            )
+
+
+# ##############  Break screen countdown
+class _TickingCountdown:
+    """
+    Counts down the way the break screens used to:  a second off for every
+    tick of a one second timer.
+    """
+
+    def __init__(self, timeout_length, run_on_completion, timer_service=None):
+        self._remaining_seconds = timeout_length
+        self._run_on_completion = run_on_completion
+        if timer_service is not None:
+            self.timer = timer_service.create_timer(self._tick)
+        else:
+            self.timer = QTimer()
+            self.timer.timeout.connect(self._tick)
+
+    def show(self):
+        self.timer.start(1_000)
+
+    def hide(self):
+        self.timer.stop()
+
+    def _tick(self):
+        self._remaining_seconds -= 1
+        if self._remaining_seconds == 0:
+            self.timer.stop()
+            self._run_on_completion()
+
+
+def _busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def measure_break_countdown(uses_deadline, uses_timer_service, length=6):
+    """
+    Counts down a `length` second short break, while the GUI thread is kept
+    busy for 120 ms of every 300 ms, and stalls once for 1.5 s.  The load
+    stops a second before the end, so whatever error is left is the
+    countdown's own.
+
+    Returns how late (in milliseconds) the countdown completed.
+    """
+    app = _get_app()
+    service = ts.TimerService() if uses_timer_service else None
+    completed = []
+
+    def complete():
+        completed.append(time.monotonic())
+        QTimer.singleShot(0, app.quit)
+
+    if uses_deadline:
+        screen = bs.ShortBreakScreen(length, complete, timer_service=service)
+    else:
+        screen = _TickingCountdown(length, complete, timer_service=service)
+
+    def load():
+        if time.monotonic() - start < length - 1:
+            _busy_wait(0.12)
+
+    load_timer = QTimer()
+    load_timer.setTimerType(Qt.PreciseTimer)
+    load_timer.timeout.connect(load)
+    load_timer.start(300)
+    QTimer.singleShot(2_200, lambda: _busy_wait(1.5))
+    give_up_timer = QTimer()
+    give_up_timer.setSingleShot(True)
+    give_up_timer.timeout.connect(app.quit)
+    give_up_timer.start(round((length + 5) * 1_000))
+
+    start = time.monotonic()
+    screen.show()
+    app.exec()
+    load_timer.stop()
+    give_up_timer.stop()
+    screen.hide()
+    if not completed:
+        return float("inf")
+    return (completed[0] - start - length) * 1_000
+
+
+def benchmark_break_countdown():
+    print("A 6 s break counting down on a busy GUI thread:")
+    print("  counted down by          timers           late by")
+    for uses_deadline in (False, True):
+        for uses_timer_service in (False, True):
+            late = measure_break_countdown(uses_deadline, uses_timer_service)
+            print(
+                "  {:<24} {:<14} {:>8.1f} ms".format(
+                    "a deadline" if uses_deadline else "ticks (before)",
+                    "timer service" if uses_timer_service else "QTimers",
+                    late,
+                )
+            )
+    print("  (target:  a few ms, at most)")
+
+
+BENCHMARKS = {
+    "input_signal_queue": benchmark_input_signal_queue,
+    "break_timeline": benchmark_break_timeline,
+    "timer_batching": benchmark_timer_batching,
+    "deadline_jitter": benchmark_deadline_jitter,
+    "event_dispatch": benchmark_event_dispatch,
+    "event_bus": benchmark_event_bus,
+    "low_power": benchmark_low_power,
+    "tooltip": benchmark_tooltip,
+    "pulse_schedules": benchmark_pulse_schedules,
+    "glowbox_frames": benchmark_glowbox_frames,
+    "glowbox_bandwidth": benchmark_glowbox_bandwidth,
+    "state_files": benchmark_state_files,
+    "break_countdown": benchmark_break_countdown,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        metavar="benchmark",
+        help="Which benchmarks to run, out of:  {}.  (Default: all)".format(
+            ", ".join(BENCHMARKS)
+        ),
+    )
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("Unknown benchmark: {}".format(name))
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1267 @@
+"""
+The break schedule and state machine of the Gentle Break Reminder, without
+any Qt.
+
+The engine works out when the next breaks are due, and moves through the
+states of the break cycle.  Everything the user sees (and every timer) is
+left to a `BreakUI`, which the Qt app (in gentle.py) and the simulation
+harness (in simulation.py) each implement.
+
+The break deadlines are kept on a monotonic clock, so that setting the wall
+clock doesn't move them.  They are only turned into wall clock times to be
+shown to the user.
+"""
+
+import math
+import time
+import logging
+from typing import Callable, Iterable, List, NamedTuple, Optional
+
+import stama.stama as sm
+
+from metrics import Histogram
+
+
+# The log level for messages the user should see.  (Named in gentle.py.)
+SUCCESS = 25
+
+# What to do with the time the computer was suspended for:
+#  - "count_as_afk":  count it as time away from the computer, which (if it
+#    was long enough) resets the short or long break.
+#  - "pause":  the break cycle stands still while suspended, so every
+#    deadline moves back by however long the suspend was.
+#  - "wall_clock":  the deadlines stay where they were, so anything that
+#    came due while suspended happens straight away.
+SUSPEND_POLICIES = ("count_as_afk", "pause", "wall_clock")
+
+
+logger = logging.getLogger(__name__)
+
+
+# ##############  Events for the state machine
+# fmt: off
+short_break_due_timeout         = sm.Event("Short break due timeout")
+short_break_early_notif_timeout = sm.Event("Short break early notification timeout")
+long_break_due_timeout          = sm.Event("Long break due timeout")
+long_break_early_notif_timeout  = sm.Event("Long break early notification timeout")
+long_break_finished_timeout     = sm.Event("Long break finished")
+break_started                   = sm.Event("Break started")
+break_ended                     = sm.Event("Break ended")
+afk_short_period_ended          = sm.Event("Short AFK period ended")
+afk_long_period_ended           = sm.Event("Long AFK period ended")
+returned_to_computer            = sm.Event("User returned to computer")
+# fmt: on
+
+EVENTS = (
+    short_break_due_timeout,
+    short_break_early_notif_timeout,
+    long_break_due_timeout,
+    long_break_early_notif_timeout,
+    long_break_finished_timeout,
+    break_started,
+    break_ended,
+    afk_short_period_ended,
+    afk_long_period_ended,
+    returned_to_computer,
+)
+
+# The order to handle events which turn up at the same time in (lowest
+#  first):  what the user clicked, then what the AFK worker noticed, and then
+#  the timers.  A click on a notification beats the notification's own
+#  timeout, and a long AFK period beats a break coming due.
+EVENT_PRIORITIES = {
+    break_started: 0,
+    break_ended: 0,
+    afk_long_period_ended: 1,
+    afk_short_period_ended: 1,
+    returned_to_computer: 1,
+    short_break_due_timeout: 2,
+    short_break_early_notif_timeout: 2,
+    long_break_due_timeout: 2,
+    long_break_early_notif_timeout: 2,
+    long_break_finished_timeout: 2,
+}
+
+
+def ignoring(*events: sm.Event) -> dict:
+    """Returns transitions which ignore `events`, to add to a state's."""
+    return dict.fromkeys(events)
+
+
+class BreakUI:
+    """
+    Everything the break engine needs from a user interface.
+
+    Every method here does nothing, so a subclass only has to implement what
+    it cares about.  The engine sets `engine` on the UI it is given, so that
+    the UI can feed events back to it (with `engine.process_event()`).
+    """
+
+    engine = None
+
+    def start_timer(self, event: sm.Event, delay: float):
+        """
+        Processes `event` in the engine after `delay` seconds.  (If the timer
+        is already running, it is restarted.)
+        """
+
+    def stop_timer(self, event: sm.Event):
+        """Cancels a timer started with `start_timer`."""
+
+    def show_schedule(self):
+        """
+        Shows when the next breaks are due (the engine's
+        `next_short_break_time` and `next_long_break_time`, which
+        `engine.to_wall_time()` turns into Unix times).
+        """
+
+    def show_status(self, text: str):
+        """Shows a fixed status (e.g. "Short break in progress")."""
+
+    def show_early_notification(self, is_long_break: bool):
+        """
+        Shows that a break is coming up.  The UI has to process the short or
+        long break early notification timeout event when the early
+        notification time has passed, and `break_started` if the user wants to
+        take the break.
+        """
+
+    def show_late_notification(self, is_long_break: bool):
+        """Shows that a break is due, until the user takes it."""
+
+    def hide_notification(self):
+        pass
+
+    def show_short_break(self):
+        """
+        Shows the short break screen, which processes `break_ended` when the
+        break is over (or skipped).
+        """
+
+    def hide_short_break(self):
+        pass
+
+    def show_long_break(self):
+        """
+        Shows the long break screen, which processes
+        `long_break_finished_timeout` when the break is over (or
+        `break_ended`, if it is skipped).
+        """
+
+    def show_long_break_finished(self):
+        """
+        Shows that the long break is over, and processes `break_ended` when
+        the user gets back to work.
+        """
+
+    def state_entered(self, state: sm.State):
+        """Called whenever the engine enters a new state."""
+
+
+class EngineState(sm.State):
+    """A state of the break cycle, which knows which engine it belongs to."""
+
+    def __init__(self, engine: "BreakEngine", name: str):
+        super().__init__()
+        self.engine = engine
+        self.name = name
+
+    def on_entry(self):
+        self.engine.state = self
+        self.engine.ui.state_entered(self)
+
+    def on_exit(self):
+        pass
+
+
+# ##############  Short break states
+class WaitingForShortBreak(EngineState):
+    def __init__(self, engine):
+        super().__init__(engine, "Waiting for a short break")
+
+    def on_entry(self):
+        super().on_entry()
+        self.engine.set_timer_for_short_break()
+
+    def on_exit(self):
+        self.engine.stop_timer(short_break_due_timeout)
+
+
+class ShowingShortBreakEarlyNotif(EngineState):
+    def __init__(self, engine):
+        super().__init__(engine, "Showing the short break early notification")
+
+    def on_entry(self):
+        super().on_entry()
+        self.engine.ui.show_early_notification(is_long_break=False)
+
+    # TODO Only hide the short break early notification if the late notification is not the next state....
+    #  This currently shows a blink when transistioning to the late
+    #  notification.  It's not a deal-breaker, but it's a distraction and a
+    #  little detail that makes a difference.
+    def on_exit(self):
+        self.engine.ui.hide_notification()
+
+
+class ShowingShortBreakLateNotif(EngineState):
+    def __init__(self, engine):
+        super().__init__(engine, "Showing the short break late notification")
+
+    def on_entry(self):
+        super().on_entry()
+        self.engine.ui.show_late_notification(is_long_break=False)
+
+    def on_exit(self):
+        self.engine.ui.hide_notification()
+
+
+class ShortBreakInProgress(EngineState):
+    def __init__(self, engine):
+        super().__init__(engine, "Short break in progress")
+
+    def on_entry(self):
+        super().on_entry()
+        self.engine.ui.show_short_break()
+        self.engine.ui.show_status("Short break in progress")
+        logger.log(SUCCESS, "Taking a short break.")
+
+    def on_exit(self):
+        self.engine.ui.hide_short_break()
+        logger.log(SUCCESS, "Short break finished.")
+
+
+class WaitingAfterShortAfk(EngineState):
+    def __init__(self, engine):
+        super().__init__(engine, "Waiting after a short AFK timeout")
+
+    def on_entry(self):
+        super().on_entry()
+        self.engine.ui.show_status("Away from keyboard (short)")
+        logger.log(
+            SUCCESS, "Away from the computer enough to reset the short break."
+        )
+
+
+# ##############  Long break states
+class WaitingForLongBreak(EngineState):
+    def __init__(self, engine):
+        super().__init__(engine, "Waiting for a long break")
+
+    def on_entry(self):
+        super().on_entry()
+        self.engine.set_timer_for_long_break()
+
+    def on_exit(self):
+        self.engine.stop_timer(long_break_due_timeout)
+
+
+class ShowingLongBreakEarlyNotif(EngineState):
+    def __init__(self, engine):
+        super().__init__(engine, "Showing the long break early notification")
+
+    def on_entry(self):
+        super().on_entry()
+        self.engine.ui.show_early_notification(is_long_break=True)
+
+    def on_exit(self):
+        # TODO Only hide the short break early notification if the late notification is not the next state....
+        #  This currently shows a blink when transistioning to the late
+        #  notification.  It's not a deal-breaker, but it's a distraction and a
+        #  little detail that makes a difference.
+        self.engine.ui.hide_notification()
+
+
+class ShowingLongBreakLateNotif(EngineState):
+    def __init__(self, engine):
+        super().__init__(engine, "Showing the long break late notification")
+
+    def on_entry(self):
+        super().on_entry()
+        self.engine.ui.show_late_notification(is_long_break=True)
+
+    def on_exit(self):
+        self.engine.ui.hide_notification()
+
+
+class LongBreakInProgress(EngineState):
+    def __init__(self, engine):
+        super().__init__(engine, "Long break in progress")
+
+    def on_entry(self):
+        super().on_entry()
+        self.engine.ui.show_long_break()
+        self.engine.ui.show_status("Long break in progress")
+        logger.log(SUCCESS, "Taking a long break.")
+
+    def on_exit(self):
+        self.engine.reset_next_long_break_time()
+
+
+class LongBreakFinished(EngineState):
+    def __init__(self, engine):
+        super().__init__(engine, "Long break finished")
+
+    def on_entry(self):
+        super().on_entry()
+        self.engine.ui.show_long_break_finished()
+        self.engine.ui.show_status("Long break finished")
+
+    def on_exit(self):
+        self.engine.reset_next_long_break_time()
+        logger.log(SUCCESS, "Getting back to work!")
+
+
+class WaitingAfterLongAfk(EngineState):
+    def __init__(self, engine):
+        super().__init__(engine, "Waiting after a long AFK timeout")
+
+    def on_entry(self):
+        super().on_entry()
+        self.engine.ui.show_status("Away from keyboard (long)")
+        logger.log(
+            SUCCESS, "Away from the computer enough to reset the long break."
+        )
+
+    def on_exit(self):
+        self.engine.reset_next_long_break_time()
+        logger.log(SUCCESS, "Back at the computer.")
+
+
+# ##############  Junctions
+class TestForNextBreak(sm.ConditionalJunction):
+    def __init__(self, engine):
+        super().__init__(
+            default_state=engine.waiting_for_long_break,
+            name="Testing for next break",
+        )
+        self.add_condition(
+            engine.has_short_break_before_long_break,
+            engine.waiting_for_short_break,
+        )
+
+
+# ##############  Dispatching events
+class DispatchTable:
+    """
+    The transitions of every state, compiled into one flat list, indexed by
+    state and event, so that finding what an event does is a couple of
+    list lookups.
+
+    The table doesn't make the transitions:  the state machine still does
+    that, from the states' own `transitions`.  The engine only uses the
+    table to check them, and to drop the events the current state ignores
+    before they get to the state machine.
+
+    Compiling it checks the transitions:  every state has to handle (or
+    explicitly ignore) every event, and go to a state or junction of the
+    same machine.  Anything missing is a bug, so it raises a ValueError
+    when the engine is created, instead of whenever the event turns up.
+    """
+
+    IGNORED = object()
+
+    def __init__(
+        self,
+        states: Iterable[sm.State],
+        events: Iterable[sm.Event],
+        junctions: Iterable[sm.ConditionalJunction] = (),
+    ):
+        self.states = list(states)
+        self.events = list(events)
+        self._state_indexes = {
+            state: index for index, state in enumerate(self.states)
+        }
+        self._event_indexes = {
+            event: index for index, event in enumerate(self.events)
+        }
+        targets = set(self.states) | set(junctions)
+
+        self._table = []
+        problems = []
+        for state in self.states:
+            for event in self.events:
+                if event not in state.transitions:
+                    problems.append(
+                        "{!r} doesn't handle {!r}".format(
+                            state.name, event.name
+                        )
+                    )
+                    self._table.append(None)
+                    continue
+                target = state.transitions[event]
+                if target is None:
+                    self._table.append(self.IGNORED)
+                elif target in targets:
+                    self._table.append(target)
+                else:
+                    problems.append(
+                        "{!r} goes to an unknown state on {!r}".format(
+                            state.name, event.name
+                        )
+                    )
+                    self._table.append(None)
+            for event in state.transitions:
+                if event not in self._event_indexes:
+                    problems.append(
+                        "{!r} handles an unknown event {!r}".format(
+                            state.name, getattr(event, "name", event)
+                        )
+                    )
+        if problems:
+            raise ValueError("Broken transitions:\n  " + "\n  ".join(problems))
+
+    def target(self, state: sm.State, event: sm.Event):
+        """
+        Returns the state (or junction) `event` leads to from `state`, or
+        `IGNORED`.
+        """
+        return self._table[
+            self._state_indexes[state] * len(self.events)
+            + self._event_indexes[event]
+        ]
+
+
+class TransitionTrace:
+    """
+    How long (in nanoseconds) each transition took, and how much of that was
+    spent in each state's `on_exit()` and `on_entry()`, so that a slow
+    action (like showing a full screen window) stands out.
+    """
+
+    def __init__(self):
+        self.transitions = {}
+        self.entries = {}
+        self.exits = {}
+
+    @staticmethod
+    def _histogram(histograms, name):
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram(name)
+        return histogram
+
+    def _timed(self, histograms, name, action):
+        def timed_action():
+            start = time.perf_counter_ns()
+            try:
+                action()
+            finally:
+                self._histogram(histograms, name).record(
+                    time.perf_counter_ns() - start
+                )
+
+        return timed_action
+
+    def watch(self, state: sm.State):
+        """Times the state's entry and exit actions from now on."""
+        state.on_entry = self._timed(self.entries, state.name, state.on_entry)
+        state.on_exit = self._timed(self.exits, state.name, state.on_exit)
+
+    def record_transition(
+        self,
+        from_state: sm.State,
+        event: sm.Event,
+        to_state: sm.State,
+        nanoseconds: int,
+    ):
+        name = "{} --[{}]--> {}".format(
+            from_state.name, event.name, to_state.name
+        )
+        self._histogram(self.transitions, name).record(nanoseconds)
+        logger.debug("%s took %0.2f ms", name, nanoseconds / 1_000_000)
+
+    def summary(self) -> str:
+        """Returns the histograms, slowest first, one per line."""
+        lines = []
+        for title, histograms in (
+            ("Transitions", self.transitions),
+            ("on_exit()", self.exits),
+            ("on_entry()", self.entries),
+        ):
+            lines.append(title + ":")
+            for histogram in sorted(
+                histograms.values(), key=lambda h: h.max, reverse=True
+            ):
+                lines.append("  " + histogram.summary())
+        return "\n".join(lines)
+
+
+class PlannedBreak(NamedTuple):
+    time: float
+    is_long_break: bool
+
+
+class BreakTimeline:
+    """
+    The short breaks due before the next long break, worked out all at once.
+
+    The time from an anchor (where the user is in the break cycle) to the
+    long break is split into equal segments, no longer than the maximum
+    spacing, with a short break between each of them.  As long as breaks end
+    when they were planned to, moving along the timeline only moves an index.
+    Otherwise (a break taken late or skipped, or a reset after being away),
+    only the breaks from the new anchor onwards are worked out again.
+    """
+
+    def __init__(
+        self,
+        short_break_length: float,
+        max_short_break_spacing: float,
+        long_break_length: float,
+        long_break_spacing: float,
+        tolerance: float = 1,
+    ):
+        """
+        Args:
+            tolerance: How far (in seconds) an anchor can be from where the
+                timeline planned it, and still keep the plan.
+        """
+        self.short_break_length = short_break_length
+        self.max_short_break_spacing = max_short_break_spacing
+        self.long_break_length = long_break_length
+        self.long_break_spacing = long_break_spacing
+        self.tolerance = tolerance
+
+        self.long_break_time = None
+        self.recompute_count = 0
+        # The start of each segment, and the short break at the end of it
+        #  (apart from the last segment, which ends with the long break).
+        self._anchors = []
+        self._short_break_times = []
+        self._index = 0
+        self._cycle_offsets = None
+
+    def _segments(self, secs_to_long_break):
+        """
+        Returns the number of segments, and the length of each one, for the
+        given time to the long break.
+        """
+        length = self.short_break_length
+        num_segments_to_long_break = max(
+            1,
+            math.ceil(
+                (secs_to_long_break + length)
+                / (length + self.max_short_break_spacing)
+            ),
+        )
+        working_secs_to_long_break = (
+            secs_to_long_break - (num_segments_to_long_break - 1) * length
+        )
+        return (
+            num_segments_to_long_break,
+            working_secs_to_long_break / num_segments_to_long_break,
+        )
+
+    def _recompute(self, anchor):
+        num_segments, segment_length = self._segments(
+            self.long_break_time - anchor
+        )
+        logger.debug(
+            "Planning %s short breaks, %0.1fs apart, to the long break",
+            num_segments - 1,
+            segment_length,
+        )
+        step = segment_length + self.short_break_length
+        self._anchors = [anchor + k * step for k in range(num_segments)]
+        self._short_break_times = [
+            segment_anchor + segment_length
+            for segment_anchor in self._anchors[:-1]
+        ]
+        self._index = 0
+        self.recompute_count += 1
+
+    def shift(self, offset: float):
+        """Moves the whole timeline `offset` seconds later."""
+        if self.long_break_time is not None:
+            self.long_break_time += offset
+        self._anchors = [anchor + offset for anchor in self._anchors]
+        self._short_break_times = [
+            short_break_time + offset
+            for short_break_time in self._short_break_times
+        ]
+
+    def update(self, anchor: float, long_break_time: float):
+        """
+        Moves the timeline to a new anchor, and (possibly) a new long break
+        time, working out whatever has changed.
+        """
+        if long_break_time != self.long_break_time:
+            self.long_break_time = long_break_time
+            self._recompute(anchor)
+            return
+
+        for index in range(self._index, len(self._anchors)):
+            if abs(self._anchors[index] - anchor) <= self.tolerance:
+                self._index = index
+                return
+        self._recompute(anchor)
+
+    @property
+    def next_short_break_time(self) -> Optional[float]:
+        if self._index < len(self._short_break_times):
+            return self._short_break_times[self._index]
+        return None
+
+    def next_breaks(self, count: int) -> List[PlannedBreak]:
+        """
+        Returns the next `count` breaks, assuming every break from here on is
+        taken on time.
+        """
+        breaks = [
+            PlannedBreak(short_break_time, False)
+            for short_break_time in self._short_break_times[self._index :]
+        ]
+        if self.long_break_time is None:
+            return breaks[:count]
+        breaks.append(PlannedBreak(self.long_break_time, True))
+
+        # Every later cycle is the same, so they're only worked out once.
+        if self._cycle_offsets is None:
+            num_segments, segment_length = self._segments(
+                self.long_break_spacing
+            )
+            step = segment_length + self.short_break_length
+            self._cycle_offsets = [
+                k * step + segment_length for k in range(num_segments - 1)
+            ]
+        long_break_time = self.long_break_time
+        while len(breaks) < count:
+            anchor = long_break_time + self.long_break_length
+            breaks.extend(
+                PlannedBreak(anchor + offset, False)
+                for offset in self._cycle_offsets
+            )
+            long_break_time = anchor + self.long_break_spacing
+            breaks.append(PlannedBreak(long_break_time, True))
+        return breaks[:count]
+
+
+class BreakEngine:
+    """
+    Schedules short and long breaks, and runs the state machine of the break
+    cycle.
+
+    Short breaks are spaced evenly between long breaks, no further apart than
+    the short break `max_spacing`.  Long breaks are `spacing` seconds after
+    the end of the last long break (or long AFK period).
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        ui: Optional[BreakUI] = None,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+        trace_transitions: bool = False,
+    ):
+        """
+        Args:
+            config: The app's configuration.  Only the "short_break",
+                "long_break", "away_from_keyboard" and "general" sections
+                are used.
+
+            ui: What shows the breaks to the user.  (By default, nothing
+                does.)
+
+            clock: The monotonic clock (in seconds) the break deadlines are
+                kept on.  Ideally it keeps counting while the computer is
+                suspended (like `clock_watcher.elapsed_time`), so that the
+                suspend policy decides what happens to that time.
+
+            wall_clock: Returns the current Unix time, to show the
+                deadlines with.
+
+            trace_transitions: Whether to time every transition (and the
+                entry and exit actions in it), in `trace`.
+        """
+        self.config = config
+        self.ui = ui or BreakUI()
+        self.ui.engine = self
+        self._clock = clock
+        self._wall_clock = wall_clock
+
+        self.suspend_policy = config["general"]["suspend_policy"]
+        if self.suspend_policy not in SUSPEND_POLICIES:
+            raise ValueError(
+                "Unknown suspend policy {!r} (expected one of {})".format(
+                    self.suspend_policy, ", ".join(SUSPEND_POLICIES)
+                )
+            )
+
+        # Times are all on `clock`.
+        self.next_long_break_time = None
+        self.next_short_break_time = None
+        # The deadline of each timer the engine has running.
+        self.timer_deadlines = {}
+        # Where the timeline was anchored for the next short break, and
+        #  where to anchor it when carrying on from a snapshot.
+        self.short_break_anchor = None
+        self._resume_anchor = None
+        self.timeline = BreakTimeline(
+            config["short_break"]["length"],
+            config["short_break"]["max_spacing"],
+            config["long_break"]["length"],
+            config["long_break"]["spacing"],
+        )
+        self.state = None
+        self.machine = None
+
+        # ##############  States
+        # fmt: off
+        self.waiting_for_short_break         = WaitingForShortBreak(self)
+        self.showing_short_break_early_notif = ShowingShortBreakEarlyNotif(self)
+        self.showing_short_break_late_notif  = ShowingShortBreakLateNotif(self)
+        self.short_break_in_progress         = ShortBreakInProgress(self)
+        self.waiting_after_short_afk         = WaitingAfterShortAfk(self)
+
+        self.waiting_for_long_break          = WaitingForLongBreak(self)
+        self.showing_long_break_early_notif  = ShowingLongBreakEarlyNotif(self)
+        self.showing_long_break_late_notif   = ShowingLongBreakLateNotif(self)
+        self.long_break_in_progress          = LongBreakInProgress(self)
+        self.long_break_finished             = LongBreakFinished(self)
+        self.waiting_after_long_afk          = WaitingAfterLongAfk(self)
+
+        self.test_for_next_break             = TestForNextBreak(self)
+        # fmt: on
+
+        self._states_by_name = {
+            state.name: state
+            for state in vars(self).values()
+            if isinstance(state, EngineState)
+        }
+
+        self._set_up_transitions()
+        self.dispatch_table = DispatchTable(
+            self._states_by_name.values(), EVENTS, [self.test_for_next_break]
+        )
+
+        self.trace = None
+        if trace_transitions:
+            self.trace = TransitionTrace()
+            for state in self._states_by_name.values():
+                self.trace.watch(state)
+
+    # pylint: disable=line-too-long
+    def _set_up_transitions(self):
+        # Every state has to say what it does with every event (see
+        #  `DispatchTable`).  The events a state ignores are ones that can
+        #  only turn up late:  from a timer, a click or the AFK worker, after
+        #  the state they were meant for has been left.
+        # fmt: off
+        # ##############  Short break transitions
+        self.waiting_for_short_break.transitions = {
+            short_break_due_timeout:            self.showing_short_break_early_notif,
+            afk_short_period_ended:             self.waiting_after_short_afk,
+            afk_long_period_ended:              self.waiting_after_long_afk,
+            returned_to_computer:               None,
+            **ignoring(
+                short_break_early_notif_timeout,
+                long_break_due_timeout,
+                long_break_early_notif_timeout,
+                long_break_finished_timeout,
+                break_started,
+                break_ended,
+            ),
+        }
+
+        self.showing_short_break_early_notif.transitions = {
+            short_break_early_notif_timeout:    self.showing_short_break_late_notif,
+            break_started:                      self.short_break_in_progress,
+            break_ended:                        self.test_for_next_break,  # Skipping the break
+            afk_short_period_ended:             self.waiting_after_short_afk,
+            afk_long_period_ended:              self.waiting_after_long_afk,
+            returned_to_computer:               None,
+            **ignoring(
+                short_break_due_timeout,
+                long_break_due_timeout,
+                long_break_early_notif_timeout,
+                long_break_finished_timeout,
+            ),
+        }
+
+        self.showing_short_break_late_notif.transitions = {
+            break_started:                      self.short_break_in_progress,
+            break_ended:                        self.test_for_next_break,  # Skipping the break
+            afk_short_period_ended:             self.waiting_after_short_afk,
+            afk_long_period_ended:              self.waiting_after_long_afk,
+            returned_to_computer:               None,
+            **ignoring(
+                short_break_due_timeout,
+                short_break_early_notif_timeout,
+                long_break_due_timeout,
+                long_break_early_notif_timeout,
+                long_break_finished_timeout,
+            ),
+        }
+
+        self.short_break_in_progress.transitions = {
+            break_ended:                        self.test_for_next_break,
+            afk_short_period_ended:             None,
+            afk_long_period_ended:              None,  # TODO
+            returned_to_computer:               None,  # TODO
+            **ignoring(
+                short_break_due_timeout,
+                short_break_early_notif_timeout,
+                long_break_due_timeout,
+                long_break_early_notif_timeout,
+                long_break_finished_timeout,
+                break_started,
+            ),
+        }
+
+        self.waiting_after_short_afk.transitions = {
+            short_break_due_timeout:            None,
+            long_break_due_timeout:             None,
+            afk_long_period_ended:              self.waiting_after_long_afk,
+            returned_to_computer:               self.test_for_next_break,
+            **ignoring(
+                short_break_early_notif_timeout,
+                long_break_early_notif_timeout,
+                long_break_finished_timeout,
+                break_started,
+                break_ended,
+                afk_short_period_ended,
+            ),
+        }
+
+        # ##############  Long break transitions
+        self.waiting_for_long_break.transitions = {
+            long_break_due_timeout:             self.showing_long_break_early_notif,
+            afk_short_period_ended:             None,
+            afk_long_period_ended:              self.waiting_after_long_afk,
+            returned_to_computer:               None,
+            **ignoring(
+                short_break_due_timeout,
+                short_break_early_notif_timeout,
+                long_break_early_notif_timeout,
+                long_break_finished_timeout,
+                break_started,
+                break_ended,
+            ),
+        }
+
+        self.showing_long_break_early_notif.transitions = {
+            long_break_early_notif_timeout:     self.showing_long_break_late_notif,
+            break_started:                      self.long_break_in_progress,
+            break_ended:                        self.test_for_next_break,  # Skipping the break
+            afk_short_period_ended:             None,
+            afk_long_period_ended:              self.waiting_after_long_afk,
+            returned_to_computer:               None,
+            **ignoring(
+                short_break_due_timeout,
+                short_break_early_notif_timeout,
+                long_break_due_timeout,
+                long_break_finished_timeout,
+            ),
+        }
+
+        self.showing_long_break_late_notif.transitions = {
+            break_started:                      self.long_break_in_progress,
+            break_ended:                        self.test_for_next_break,  # Skipping the break
+            afk_short_period_ended:             None,
+            afk_long_period_ended:              self.waiting_after_long_afk,
+            returned_to_computer:               None,
+            **ignoring(
+                short_break_due_timeout,
+                short_break_early_notif_timeout,
+                long_break_due_timeout,
+                long_break_early_notif_timeout,
+                long_break_finished_timeout,
+            ),
+        }
+
+        self.long_break_in_progress.transitions = {
+            long_break_finished_timeout:        self.long_break_finished,
+            break_ended:                        self.test_for_next_break,  # Skipping the break
+            afk_short_period_ended:             None,
+            afk_long_period_ended:              None,
+            # TODO If the user starts uses the computer during a break, pause the break....
+            #  However, this should be handled by the AFK status, not by the
+            #  returned_to_computer State in the general state machine.
+            returned_to_computer:               None,
+            **ignoring(
+                short_break_due_timeout,
+                short_break_early_notif_timeout,
+                long_break_due_timeout,
+                long_break_early_notif_timeout,
+                break_started,
+            ),
+        }
+
+        self.long_break_finished.transitions = {
+            break_ended:                        self.test_for_next_break,
+            afk_short_period_ended:             None,
+            afk_long_period_ended:              None,
+            # TODO If the user starts uses the computer after a break is finished, consider the break as done....
+            #  However, this should probably be handled by the AFK status, not by the
+            #  returned_to_computer State in the general state machine.  (But I see no
+            #  reason why doing both would break anything.  Of course it's the AFK
+            #  state the triggers the returned_to_computer state.  Maybe I could use
+            #  returned_to_computer as a stopgap until I set it up to use the AFK
+            #  status?
+            returned_to_computer:               None,
+            **ignoring(
+                short_break_due_timeout,
+                short_break_early_notif_timeout,
+                long_break_due_timeout,
+                long_break_early_notif_timeout,
+                long_break_finished_timeout,
+                break_started,
+            ),
+        }
+
+        self.waiting_after_long_afk.transitions = {
+            short_break_due_timeout:            None,
+            long_break_due_timeout:             None,
+            returned_to_computer:               self.test_for_next_break,
+            # The AFK timeouts can come again if the user was only in limbo
+            #  (and so didn't count as back at the computer) in between.
+            afk_short_period_ended:             None,
+            afk_long_period_ended:              None,
+            **ignoring(
+                short_break_early_notif_timeout,
+                long_break_early_notif_timeout,
+                long_break_finished_timeout,
+                break_started,
+                break_ended,
+            ),
+        }
+        # fmt: on
+
+    # ##############  Running the machine
+    def start(self, snapshot: Optional[dict] = None):
+        """
+        Starts the break cycle, with a full spacing to the long break, or
+        carries on from a `snapshot()` (if it is still usable).
+        """
+        state = None
+        if snapshot is not None:
+            try:
+                state = self._restore(snapshot)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning("Couldn't use the snapshot:  %r", e)
+        if state is None:
+            self.reset_next_long_break_time()
+            if self.has_short_break_before_long_break():
+                state = self.waiting_for_short_break
+            else:
+                state = self.waiting_for_long_break
+        self.machine = sm.StateMachine(state)
+
+    def process_event(self, event: sm.Event):
+        deadline = self.timer_deadlines.get(event)
+        if deadline is not None and deadline > self._clock() + 0.5:
+            # The timer went off, but was started again while its event was
+            #  waiting to be processed (in the event bus).
+            logger.debug("Dropping an out of date %r", event.name)
+            return
+        # If this is a timer going off, it isn't running anymore.
+        self.timer_deadlines.pop(event, None)
+        # The state machine would ignore it too, but not as quickly.
+        if self.is_ignored(event):
+            return
+        if self.trace is None:
+            self.machine.process_event(event)
+            return
+
+        from_state = self.state
+        start = time.perf_counter_ns()
+        self.machine.process_event(event)
+        self.trace.record_transition(
+            from_state, event, self.state, time.perf_counter_ns() - start
+        )
+
+    def is_ignored(self, event: sm.Event) -> bool:
+        """Whether the current state ignores `event`."""
+        return (
+            self.dispatch_table.target(self.state, event)
+            is DispatchTable.IGNORED
+        )
+
+    # ##############  Snapshots
+    def snapshot(self) -> dict:
+        """
+        Returns where the engine is in the break cycle, with the times as
+        Unix times, so that `start()` can carry on from there (even after a
+        reboot).
+        """
+
+        def to_wall_time(clock_time):
+            if clock_time is None:
+                return None
+            return self.to_wall_time(clock_time)
+
+        return {
+            "saved_at": self._wall_clock(),
+            "state": self.state.name,
+            "next_long_break_time": to_wall_time(self.next_long_break_time),
+            "next_short_break_time": to_wall_time(self.next_short_break_time),
+            "short_break_anchor": to_wall_time(self.short_break_anchor),
+        }
+
+    def _restore(self, snapshot):
+        """
+        Takes the schedule from a snapshot, and returns the state to carry on
+        in, or None if the snapshot is no use.
+
+        The time since the user was last at the computer counts as time away
+        from it, the same as if the app had been running.  That's the time
+        since the snapshot was saved, or since `away_since` (a Unix time),
+        if the snapshot has it.
+        """
+        wall_now = self._wall_clock()
+        now = self._clock()
+
+        def to_clock_time(wall_time):
+            return now - (wall_now - wall_time)
+
+        saved_at = snapshot["saved_at"]
+        state = self._states_by_name.get(snapshot["state"])
+        next_long_break_time = to_clock_time(snapshot["next_long_break_time"])
+        if state is None:
+            logger.info("Not resuming from an unknown state:  %r", snapshot)
+            return None
+        # A little leeway, for the wall clock being corrected.
+        if saved_at > wall_now + 60 or next_long_break_time > (
+            now + self.config["long_break"]["spacing"] + 60
+        ):
+            logger.info("Not resuming from a snapshot from the future")
+            return None
+
+        away_since = snapshot.get("away_since") or saved_at
+        secs_away = wall_now - away_since
+        timeouts = self.config["away_from_keyboard"]
+        if state in (
+            self.long_break_in_progress,
+            self.long_break_finished,
+            self.waiting_after_long_afk,
+        ) or (0 < timeouts["long_break_timeout"] <= secs_away):
+            # The long break would have been reset.
+            logger.info("Away %0.0f seconds, starting afresh", secs_away)
+            return None
+
+        self.next_long_break_time = next_long_break_time
+        logger.log(
+            SUCCESS,
+            "Carrying on from where we were, %0.0f seconds ago.",
+            wall_now - saved_at,
+        )
+        if state in (
+            self.short_break_in_progress,
+            self.waiting_after_short_afk,
+        ) or (0 < timeouts["short_break_timeout"] <= secs_away):
+            # Only the short break would have been reset.
+            pass
+        elif snapshot["next_short_break_time"] is None:
+            return self.waiting_for_long_break
+        else:
+            self._resume_anchor = to_clock_time(snapshot["short_break_anchor"])
+            return self.waiting_for_short_break
+
+        if self.has_short_break_before_long_break():
+            return self.waiting_for_short_break
+        return self.waiting_for_long_break
+
+    # ##############  Timers
+    def start_timer(self, event: sm.Event, delay: float):
+        """
+        Starts the UI's timer for `event`, keeping its deadline, so that it
+        can be started again if the timer couldn't keep up with the clock.
+        """
+        self.timer_deadlines[event] = self._clock() + delay
+        self.ui.start_timer(event, delay)
+
+    def stop_timer(self, event: sm.Event):
+        self.timer_deadlines.pop(event, None)
+        self.ui.stop_timer(event)
+
+    def reschedule(self):
+        """Restarts every running timer, from its deadline."""
+        now = self._clock()
+        for event, deadline in list(self.timer_deadlines.items()):
+            self.ui.start_timer(event, max(deadline - now, 0))
+
+    # ##############  Suspends and clock changes
+    def handle_suspend(self, duration: float):
+        """
+        Catches up after the computer was suspended for `duration` seconds,
+        according to the suspend policy, and restarts the timers (which
+        stood still while the computer was suspended).
+        """
+        logger.info(
+            "Suspended for %0.0f seconds (suspend policy: %s)",
+            duration,
+            self.suspend_policy,
+        )
+        if self.suspend_policy == "pause":
+            self._shift_deadlines(duration)
+        elif self.suspend_policy == "count_as_afk":
+            timeouts = self.config["away_from_keyboard"]
+            for timeout, event in (
+                (timeouts["long_break_timeout"], afk_long_period_ended),
+                (timeouts["short_break_timeout"], afk_short_period_ended),
+            ):
+                if 0 < timeout <= duration:
+                    self.process_event(event)
+                    self.process_event(returned_to_computer)
+                    break
+        self.reschedule()
+
+    def handle_clock_step(self, offset: float):
+        """
+        Updates what's shown after the wall clock was moved by `offset`
+        seconds.  (The deadlines themselves don't move.)
+        """
+        logger.info("Wall clock moved by %+0.1f seconds", offset)
+        self.ui.show_schedule()
+
+    def _shift_deadlines(self, offset):
+        self.next_long_break_time += offset
+        if self.next_short_break_time is not None:
+            self.next_short_break_time += offset
+        self.timeline.shift(offset)
+        for event in self.timer_deadlines:
+            self.timer_deadlines[event] += offset
+        self._log_next_breaks()
+        self.ui.show_schedule()
+
+    # ##############  Scheduling
+    def to_wall_time(self, clock_time: float) -> float:
+        """Converts a time on the engine's clock to a Unix time."""
+        return self._wall_clock() - (self._clock() - clock_time)
+
+    def _format_time(self, clock_time):
+        return time.strftime(
+            self.config["general"]["time_format"],
+            time.localtime(self.to_wall_time(clock_time)),
+        )
+
+    def reset_next_long_break_time(self):
+        self.next_long_break_time = (
+            self._clock() + self.config["long_break"]["spacing"]
+        )
+        logger.debug(
+            "Resetting next long break to:  %s",
+            self._format_time(self.next_long_break_time),
+        )
+
+    def has_short_break_before_long_break(self) -> bool:
+        short_break = self.config["short_break"]
+        secs_to_long_break = self.next_long_break_time - self._clock()
+        if short_break["max_spacing"] < secs_to_long_break:
+            logger.debug(
+                "has_short_break_before_long_break is True: %s < %s",
+                short_break["max_spacing"],
+                secs_to_long_break,
+            )
+            return True
+        logger.debug(
+            "has_short_break_before_long_break is False: %s >= %s",
+            short_break["max_spacing"],
+            secs_to_long_break,
+        )
+        return False
+
+    def next_breaks(self, count: int) -> List[PlannedBreak]:
+        """Returns the next `count` breaks, if all are taken on time."""
+        return self.timeline.next_breaks(count)
+
+    def _log_next_breaks(self):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Next breaks:  %s",
+                ", ".join(
+                    "{} ({})".format(
+                        self._format_time(planned.time),
+                        "long" if planned.is_long_break else "short",
+                    )
+                    for planned in self.next_breaks(5)
+                ),
+            )
+
+    def set_timer_for_short_break(self):
+        now = self._clock()
+        anchor = now if self._resume_anchor is None else self._resume_anchor
+        self._resume_anchor = None
+        self.short_break_anchor = anchor
+        self.timeline.update(anchor, self.next_long_break_time)
+        self.next_short_break_time = self.timeline.next_short_break_time
+        if self.next_short_break_time is None:
+            # The long break is no more than the maximum spacing away, so
+            #  there's no short break planned before it.  (This can happen
+            #  when carrying on from a snapshot taken with other settings.)
+            #  The short break is due with the long break, as it always was.
+            self.next_short_break_time = self.next_long_break_time
+        secs_to_short_break = self.next_short_break_time - now
+
+        secs_to_notification = (
+            secs_to_short_break
+            - self.config["short_break"]["early_notification"]
+        )
+        logger.debug("secs_to_notification:  %s", secs_to_notification)
+
+        # I had some situations where all the stuff above would sometimes
+        #  return a negative time.  (This mostly/always happened when testing
+        #  with very short timings.)  It turns out that QT -- not having a time
+        #  machine built in -- did not like that.  Setting the
+        #  secs_to_notification to a minimum of 0 was the easiest way to fix
+        #  it.
+        secs_to_notification = max(secs_to_notification, 0)
+
+        # ##############  Convey information
+        logger.debug(
+            "%dm%0.1fs to next short break",
+            int(secs_to_short_break // 60),
+            secs_to_short_break % 60,
+        )
+        logger.debug(
+            "%dm%0.1fs to notification",
+            int(secs_to_notification // 60),
+            secs_to_notification % 60,
+        )
+        logger.log(
+            SUCCESS,
+            "Next break (short): %s",
+            self._format_time(self.next_short_break_time),
+        )
+        logger.log(
+            SUCCESS,
+            "Next long break: %s",
+            self._format_time(self.next_long_break_time),
+        )
+
+        self._log_next_breaks()
+        self.ui.show_schedule()
+        self.start_timer(short_break_due_timeout, secs_to_notification)
+
+    def set_timer_for_long_break(self):
+        now = self._clock()
+        self.short_break_anchor = None
+        self.timeline.update(now, self.next_long_break_time)
+        secs_to_long_break = self.next_long_break_time - now
+        secs_to_notification = (
+            secs_to_long_break
+            - self.config["long_break"]["early_notification"]
+        )
+        secs_to_notification = max(secs_to_notification, 0)
+
+        logger.debug(
+            "%dm%0.1fs to next long break",
+            int(secs_to_long_break // 60),
+            secs_to_long_break % 60,
+        )
+        logger.debug(
+            "%dm%0.1fs to notification",
+            int(secs_to_notification // 60),
+            secs_to_notification % 60,
+        )
+        logger.log(
+            SUCCESS,
+            "Next break (long): %s",
+            self._format_time(self.next_long_break_time),
+        )
+
+        self.next_short_break_time = None
+        self._log_next_breaks()
+        self.ui.show_schedule()
+        self.start_timer(long_break_due_timeout, secs_to_notification)
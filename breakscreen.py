@@ -1,16 +1,18 @@
+import math
+import time
 import logging
 
 # pylint: disable=import-error
 from PySide6.QtCore import (
     Qt,
     QTimer,
-    QTime,
 )
 
 # pylint: disable=import-error
 from PySide6.QtGui import (
     QColor,
     QPalette,
+    QPixmap,
 )
 
 # pylint: disable=import-error
@@ -22,12 +24,36 @@ from PySide6.QtWidgets import (
     QStackedLayout,
 )
 
+from metrics import Histogram
+
 
 logger = logging.getLogger(__name__)
 
 
+# How long after each whole second (in seconds) to update the countdown, so
+#  that it has surely changed.
+_TICK_MARGIN = 0.001
+
+
 class BaseBreakScreen(QWidget):
-    def __init__(self, timeout_length, run_on_completion):
+    def __init__(
+        self,
+        timeout_length,
+        run_on_completion,
+        timer_service=None,
+        clock=time.monotonic,
+    ):
+        """
+        Args:
+            timeout_length: How long the countdown is, in seconds.
+
+            run_on_completion: Run when the countdown gets to zero.
+
+            timer_service: The TimerService to run the timers on.  (Without
+                one, they're QTimers.)
+
+            clock: The monotonic clock the countdown is timed with.
+        """
         super().__init__()
 
         self.FONT_SIZE = 72
@@ -38,12 +64,39 @@ class BaseBreakScreen(QWidget):
         self._run_on_completion = run_on_completion
 
         # #############   Initialize the countdown timer
-        self._remaining_time = QTime(0, 0)
-
-        self.countdown_timer = QTimer()
-        self.countdown_timer.timeout.connect(self.update_countdown)
+        # The countdown ends at a fixed time on the clock, and the time left
+        #  is worked out from that, so late timers can't stretch the break.
+        #  The completion timer goes off at the end (even while the
+        #  countdown's updates are paused), and the countdown timer goes off
+        #  just after each whole second left, to show it.
+        self._clock = clock
+        self._end_time = None
+        self._shown_seconds = timeout_length
+        if timer_service is not None:
+            self.countdown_timer = timer_service.create_timer(
+                self.update_countdown, single_shot=True
+            )
+            self.completion_timer = timer_service.create_timer(
+                self._complete_countdown, single_shot=True, slack=0
+            )
+        else:
+            self.countdown_timer = QTimer()
+            self.countdown_timer.setSingleShot(True)
+            self.countdown_timer.setTimerType(Qt.PreciseTimer)
+            self.countdown_timer.timeout.connect(self.update_countdown)
+            self.completion_timer = QTimer()
+            self.completion_timer.setSingleShot(True)
+            self.completion_timer.setTimerType(Qt.PreciseTimer)
+            self.completion_timer.timeout.connect(self._complete_countdown)
         self._timeout_length = timeout_length
 
+        # #############   Measure how quickly the screen comes up
+        self._prewarmed_geometry = None
+        self._requested_time = None
+        self.paint_latency = Histogram(
+            "{} first paint".format(type(self).__name__), unit="us"
+        )
+
         self.setWindowFlag(Qt.WindowStaysOnTopHint, True)
         self.setWindowFlag(Qt.FramelessWindowHint, True)
 
@@ -58,27 +111,130 @@ class BaseBreakScreen(QWidget):
     def showEvent(self, event):
         super().showEvent(event)
 
-        # Start the timer when the window is shown.
-        self._remaining_time = QTime(
-            0, self._timeout_length // 60, self._timeout_length % 60
-        )
-        self.countdown_timer.start(1_000)
+        # Start the countdown when the window is shown.
+        self._end_time = self._clock() + self._timeout_length
+        self.completion_timer.start(self._timeout_length * 1_000)
+        self.update_countdown()
 
     # pylint: disable=invalid-name
     def hideEvent(self, event):
         super().hideEvent(event)
         self.countdown_timer.stop()
+        self.completion_timer.stop()
+        self._requested_time = None
+
+    # pylint: disable=invalid-name
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self._requested_time is not None and self.isVisible():
+            latency = time.perf_counter() - self._requested_time
+            self._requested_time = None
+            self.paint_latency.record(round(latency * 1_000_000))
+            logger.info(
+                "%s first painted %0.1f ms after it was asked for",
+                type(self).__name__,
+                latency * 1_000,
+            )
+
+    # ##############  Showing the screen quickly
+    def prewarm(self):
+        """
+        Does ahead of time what showing the screen full screen for the first
+        time would:  creates its native window, lays it out at the size of
+        the screen, and paints it once offscreen (which shapes the text, and
+        fills the font caches).  Call it while nothing much is going on,
+        before a break is due.
+
+        Only does anything the first time, and when the screen's size has
+        changed since.
+        """
+        geometry = self.screen().geometry()
+        if self.isVisible() or geometry == self._prewarmed_geometry:
+            return
+        start = time.perf_counter()
+
+        self.winId()
+        self.setGeometry(geometry)
+        for widget in [self] + self.findChildren(QWidget):
+            widget.ensurePolished()
+        # (ShortBreakScreen keeps its layout in `self.layout`.)
+        QWidget.layout(self).activate()
+        self.prewarm_pages(QPixmap(geometry.size()))
+
+        self._prewarmed_geometry = geometry
+        logger.debug(
+            "Prewarmed the %s in %0.1f ms",
+            type(self).__name__,
+            (time.perf_counter() - start) * 1_000,
+        )
+
+    def prewarm_pages(self, pixmap):
+        """Paints everything that might be shown into `pixmap`."""
+        self.render(pixmap)
+
+    def time_first_paint(self, since):
+        """
+        Logs (and records in `paint_latency`) how long after `since` (a
+        `time.perf_counter()` time, like when the glow box was clicked) the
+        screen is next painted.  If `since` is None, nothing is timed.
+        """
+        self._requested_time = since
+
+    def remaining_seconds(self):
+        """Returns how long is left in the countdown, in seconds."""
+        if self._end_time is None:
+            return self._timeout_length
+        return max(0, self._end_time - self._clock())
 
     def update_countdown(self):
-        self._remaining_time = self._remaining_time.addSecs(-1)
-        if self._remaining_time == QTime(0, 0, 0):
-            self.countdown_timer.stop()
-            self._run_on_completion()
+        """
+        Shows the whole seconds left (rounded up, so it only shows zero at
+        the end), if they've changed, and waits for them to change again.
+        """
+        remaining = self.remaining_seconds()
+        seconds = math.ceil(remaining)
+        if seconds != self._shown_seconds:
+            self._shown_seconds = seconds
+            self.show_remaining_time()
+        if seconds > 0:
+            wait = remaining - (seconds - 1) + _TICK_MARGIN
+            self.countdown_timer.start(math.ceil(wait * 1_000))
+
+    def _complete_countdown(self):
+        self.countdown_timer.stop()
+        if self._shown_seconds != 0:
+            self._shown_seconds = 0
+            self.show_remaining_time()
+        self._run_on_completion()
+
+    def pause_countdown_updates(self):
+        """
+        Stops updating the countdown, while nobody is looking at it.  It
+        still completes on time.
+        """
+        self.countdown_timer.stop()
+
+    def resume_countdown_updates(self):
+        """Catches the countdown up, and updates it every second again."""
+        if self.completion_timer.isActive():
+            self.update_countdown()
+
+    def show_remaining_time(self):
+        """Shows `self._shown_seconds`, which have just changed."""
 
 
 class ShortBreakScreen(BaseBreakScreen):
-    def __init__(self, timeout_length, run_on_completion, run_on_skip=None):
-        super().__init__(timeout_length, run_on_completion)
+    def __init__(
+        self,
+        timeout_length,
+        run_on_completion,
+        run_on_skip=None,
+        timer_service=None,
+        clock=time.monotonic,
+    ):
+        super().__init__(
+            timeout_length, run_on_completion, timer_service, clock
+        )
 
         # ##############  Create the layout
         self.layout = QVBoxLayout()
@@ -116,8 +272,12 @@ class LongBreakScreen(BaseBreakScreen):
         run_on_completion,
         run_on_finish,
         run_on_skip=None,
+        timer_service=None,
+        clock=time.monotonic,
     ):
-        super().__init__(timeout_length, run_on_completion)
+        super().__init__(
+            timeout_length, run_on_completion, timer_service, clock
+        )
 
         # ##############  Create the countdown layout
         self.countdown_layout_widget = QWidget()
@@ -130,14 +290,22 @@ class LongBreakScreen(BaseBreakScreen):
         font = self.countdown_label.font()
         font.setPointSize(self.FONT_SIZE)
         self.countdown_label.setFont(font)
-        self._remaining_time = QTime(
-            0, self._timeout_length // 60, self._timeout_length % 60
+        self.countdown_label.setText(
+            "Get away from the computer for a bit.<hr>"
         )
+        self.countdown_layout.addWidget(self.countdown_label)
+
+        # Only the time remaining changes, so it's a label of its own, of
+        #  plain text, which is quicker to set.
+        self.remaining_time_label = QLabel()
+        self.remaining_time_label.setAlignment(Qt.AlignCenter)
+        self.remaining_time_label.setTextFormat(Qt.PlainText)
+        self.remaining_time_label.setFont(font)
         logger.debug(
-            "Setting countdown timer to %s", self._remaining_time.toString()
+            "Setting countdown timer to %s", self.get_remaining_time_text()
         )
-        self.countdown_label.setText(self.get_countdown_label_text())
-        self.countdown_layout.addWidget(self.countdown_label)
+        self.show_remaining_time()
+        self.countdown_layout.addWidget(self.remaining_time_label)
 
         if run_on_skip is not None:
             skip_button = QPushButton("Skip this break.  :-(")
@@ -175,24 +343,142 @@ class LongBreakScreen(BaseBreakScreen):
 
         self.setLayout(self.stacked_layout)
 
-    # pylint: disable=invalid-name
-    def showEvent(self, event):
-        super().showEvent(event)
-        self.countdown_label.setText(self.get_countdown_label_text())
-
-    def get_countdown_label_text(self):
-        LABEL_TEXT = (
-            "Get away from the computer for a bit.<hr>Time remaining: "
+    def get_remaining_time_text(self):
+        return "Time remaining: {}:{:02}".format(
+            *divmod(self._shown_seconds, 60)
         )
-        count_down_text = self._remaining_time.toString("m:ss")
-        return LABEL_TEXT + count_down_text
 
-    def update_countdown(self):
-        super().update_countdown()
-        self.countdown_label.setText(self.get_countdown_label_text())
+    def show_remaining_time(self):
+        self.remaining_time_label.setText(self.get_remaining_time_text())
+
+    def prewarm_pages(self, pixmap):
+        self.countdown_layout_widget.render(pixmap)
+        self.finished_layout_widget.resize(self.size())
+        self.finished_layout_widget.render(pixmap)
 
     def set_layout_to_countdown(self):
         self.stacked_layout.setCurrentIndex(0)
 
     def set_layout_to_finished(self):
         self.stacked_layout.setCurrentIndex(1)
+
+
+if __name__ == "__main__":
+    import os
+    import random
+
+    # pylint: disable=import-error
+    from PySide6.QtWidgets import QApplication
+
+    class VirtualTimers:
+        """
+        A stand-in for a TimerService, on a virtual monotonic clock, whose
+        timers go off a little late (and now and then, a lot late, as if
+        the GUI thread were busy).
+        """
+
+        def __init__(self, seed=1):
+            self.time = 1_000.0
+            self.random = random.Random(seed)
+            self.stalls_until = float("inf")
+            self._timers = []
+
+        def __call__(self):
+            return self.time
+
+        def create_timer(self, callback, single_shot=False, slack=None):
+            timer = VirtualTimer(callback)
+            self._timers.append(timer)
+            return timer
+
+        def start(self, timer, msecs):
+            timer.deadline = self.time + msecs / 1_000
+
+        def run_until(self, end):
+            while True:
+                active = [t for t in self._timers if t.deadline is not None]
+                if not active:
+                    return
+                timer = min(active, key=lambda t: t.deadline)
+                if timer.deadline > end:
+                    self.time = end
+                    return
+                late = self.random.uniform(0, 0.002)
+                if (
+                    self.time < self.stalls_until
+                    and self.random.random() < 0.2
+                ):
+                    late += self.random.uniform(0, 0.9)
+                self.time = max(self.time, timer.deadline + late)
+                timer.deadline = None
+                timer.callback()
+
+    class VirtualTimer:
+        def __init__(self, callback):
+            self.callback = callback
+            self.deadline = None
+
+        def start(self, msecs):
+            timers.start(self, msecs)
+
+        def stop(self):
+            self.deadline = None
+
+        # pylint: disable=invalid-name
+        def isActive(self):
+            return self.deadline is not None
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication([])
+
+    for seed in range(5):
+        timers = VirtualTimers(seed)
+        completed = []
+        screen = LongBreakScreen(
+            600,
+            lambda: completed.append(timers()),
+            lambda: None,
+            timer_service=timers,
+            clock=timers,
+        )
+        shown = []
+        screen.show_remaining_time = lambda s=screen: shown.append(
+            s._shown_seconds
+        )
+
+        start = timers()
+        # The load stops a second before the end, so whatever error is left
+        #  is the countdown's own.
+        timers.stalls_until = start + 599
+        screen.show()
+        timers.run_until(start + 700)
+
+        assert len(completed) == 1, completed
+        error = completed[0] - (start + 600)
+        assert 0 <= error < 0.005, error
+        # Every whole second is shown once, in order.
+        assert shown == list(range(599, -1, -1)), shown[:10]
+        screen.hide()
+
+    # Pausing the updates doesn't move the end.
+    timers = VirtualTimers()
+    completed = []
+    screen = ShortBreakScreen(
+        20,
+        lambda: completed.append(timers()),
+        timer_service=timers,
+        clock=timers,
+    )
+    start = timers()
+    screen.show()
+    timers.run_until(start + 5.5)
+    screen.pause_countdown_updates()
+    assert screen._shown_seconds == 15
+    timers.run_until(start + 12.25)
+    assert screen._shown_seconds == 15
+    screen.resume_countdown_updates()
+    assert screen._shown_seconds == 8
+    timers.run_until(start + 30)
+    assert len(completed) == 1 and completed[0] - (start + 20) < 0.005
+
+    print("All break screen countdown checks passed.")
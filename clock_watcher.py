@@ -0,0 +1,158 @@
+"""Notices when the computer has been suspended, or the wall clock was set."""
+
+import sys
+import time
+import logging
+from typing import Callable, Optional
+
+# pylint: disable=import-error
+from PySide6.QtCore import QObject, QTimer, Signal, Slot
+
+from timer_service import TimerService
+
+
+logger = logging.getLogger(__name__)
+
+
+# time.monotonic() stops while the computer is suspended on Linux and macOS
+#  (but not on Windows), and so do Qt's timers.  These clocks keep counting.
+if hasattr(time, "CLOCK_BOOTTIME"):
+    _ELAPSED_CLOCK_ID = time.CLOCK_BOOTTIME
+elif sys.platform == "darwin":
+    _ELAPSED_CLOCK_ID = time.CLOCK_MONOTONIC
+else:
+    _ELAPSED_CLOCK_ID = None
+
+
+def elapsed_time() -> float:
+    """
+    Returns a monotonic time (in seconds), which keeps counting while the
+    computer is suspended, where the OS has such a clock.  It doesn't jump
+    when the wall clock is set.
+    """
+    if _ELAPSED_CLOCK_ID is None:
+        return time.monotonic()
+    return time.clock_gettime(_ELAPSED_CLOCK_ID)
+
+
+class ClockWatcher(QObject):
+    """
+    Compares the clocks every `interval` seconds, to notice when the
+    computer has been suspended (or the app was otherwise stopped), and when
+    the wall clock was set (by NTP, or by hand).
+
+    A suspend shows up as more elapsed time than the timers saw go by, or (on
+    systems where the timers keep counting during a suspend) as a check that
+    came far later than it was due.
+    """
+
+    # How long (in seconds) the timers were stopped for.
+    suspended = Signal(float)
+    # How far (in seconds) the wall clock was moved.
+    clock_stepped = Signal(float)
+
+    def __init__(
+        self,
+        interval: float = 2,
+        threshold: float = 5,
+        timer_service: Optional[TimerService] = None,
+        clock: Callable[[], float] = time.monotonic,
+        elapsed_clock: Callable[[], float] = elapsed_time,
+        wall_clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            interval: How often (in seconds) to compare the clocks.  A
+                suspend is noticed at most this long after resuming.
+
+            threshold: How far (in seconds) the clocks have to disagree to
+                count as a suspend or a step of the wall clock.
+
+            timer_service: If given, the checks run on this service, instead
+                of on a QTimer of their own.
+
+            clock: The monotonic clock the timers run on.
+
+            elapsed_clock: A monotonic clock which keeps counting while the
+                computer is suspended.
+
+            wall_clock: Returns the current Unix time.
+        """
+        super().__init__()
+        self.interval = interval
+        self.threshold = threshold
+        self._clock = clock
+        self._elapsed_clock = elapsed_clock
+        self._wall_clock = wall_clock
+
+        if timer_service is not None:
+            self._timer = timer_service.create_timer(self.check)
+        else:
+            self._timer = QTimer(self)
+            self._timer.timeout.connect(self.check)
+
+        self.suspend_count = 0
+        self.step_count = 0
+        self._is_paused = False
+        self._take_sample()
+
+    def _take_sample(self):
+        self._last_time = self._clock()
+        self._last_elapsed_time = self._elapsed_clock()
+        self._last_wall_time = self._wall_clock()
+
+    def start(self):
+        self._take_sample()
+        self._timer.start(round(self.interval * 1_000))
+
+    def stop(self):
+        self._timer.stop()
+
+    def pause(self):
+        """
+        Stops checking (to save power) until `resume()`, without forgetting
+        the last sample.
+        """
+        self._timer.stop()
+        self._is_paused = True
+
+    def resume(self):
+        """Checks straight away, and then every interval again."""
+        if not self._is_paused:
+            return
+        self.check()
+        self._is_paused = False
+        self._timer.start(round(self.interval * 1_000))
+
+    @Slot()
+    def check(self):
+        """Compares the clocks with the last time they were checked."""
+        last_time = self._last_time
+        last_elapsed_time = self._last_elapsed_time
+        last_wall_time = self._last_wall_time
+        self._take_sample()
+
+        timer_seconds = self._last_time - last_time
+        elapsed_seconds = self._last_elapsed_time - last_elapsed_time
+        wall_seconds = self._last_wall_time - last_wall_time
+
+        # No check was due while paused, so then all of the time the timers
+        #  saw go by is expected.
+        if self._is_paused:
+            expected_seconds = timer_seconds
+        else:
+            expected_seconds = min(timer_seconds, self.interval)
+        stopped_time = elapsed_seconds - expected_seconds
+        if stopped_time > self.threshold:
+            self.suspend_count += 1
+            logger.info(
+                "The computer was suspended for about %0.0f seconds",
+                stopped_time,
+            )
+            self.suspended.emit(stopped_time)
+
+        step = wall_seconds - elapsed_seconds
+        if abs(step) > self.threshold:
+            self.step_count += 1
+            logger.info("The wall clock was moved by %+0.1f seconds", step)
+            self.clock_stepped.emit(step)
@@ -0,0 +1,117 @@
+"""Funnels events from everywhere into the break engine, a batch at a time."""
+
+import itertools
+import threading
+import time
+import logging
+from typing import Callable, Dict, Hashable, Optional
+
+# pylint: disable=import-error
+from PySide6.QtCore import Qt, QObject, Signal, Slot
+
+from metrics import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus(QObject):
+    """
+    Collects events posted from anywhere (timers, clicks, the AFK worker, in
+    any thread), and hands them to `handler` on the next turn of the event
+    loop of the thread the bus lives in.
+
+    Everything posted during one turn is handled together:  an event posted
+    more than once is only handled once (where it was first posted), and
+    the events are handled in order of priority (lowest first), then in the
+    order they were posted.  Events posted while handling a batch go in the
+    next one.
+    """
+
+    _flush_signal = Signal()
+
+    def __init__(
+        self,
+        handler: Callable[[Hashable], None],
+        priorities: Optional[Dict[Hashable, int]] = None,
+        default_priority: int = 0,
+    ):
+        """
+        Args:
+            handler: Handles one event.
+
+            priorities: The priority of each event.  Events which aren't in
+                here have the `default_priority`.
+        """
+        super().__init__()
+        self._handler = handler
+        self._priorities = priorities or {}
+        self._default_priority = default_priority
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._sequence = itertools.count()
+        self._flush_signal.connect(self.flush, Qt.QueuedConnection)
+
+        self.posted_count = 0
+        self.coalesced_count = 0
+        self.queue_depths = Histogram("Events per batch", unit="")
+        self.handling_times = {}
+
+    def post(self, event: Hashable):
+        """Queues `event` to be handled on the next turn of the event loop."""
+        with self._lock:
+            self.posted_count += 1
+            if event in self._pending:
+                self.coalesced_count += 1
+                return
+            is_first = not self._pending
+            self._pending[event] = (
+                self._priorities.get(event, self._default_priority),
+                next(self._sequence),
+            )
+        if is_first:
+            self._flush_signal.emit()
+
+    @Slot()
+    def flush(self):
+        """Handles every event posted so far."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        self.queue_depths.record(len(pending))
+
+        for event in sorted(pending, key=pending.get):
+            start = time.perf_counter_ns()
+            try:
+                self._handler(event)
+            except Exception:  # pylint: disable=broad-exception-caught
+                # Carry on with the rest of the batch.
+                logger.exception("Failed to handle %r", event)
+            self._handling_time(event).record(time.perf_counter_ns() - start)
+
+    def _handling_time(self, event):
+        histogram = self.handling_times.get(event)
+        if histogram is None:
+            histogram = self.handling_times[event] = Histogram(
+                getattr(event, "name", str(event))
+            )
+        return histogram
+
+    def summary(self) -> str:
+        lines = [
+            "{} events posted, {} coalesced".format(
+                self.posted_count, self.coalesced_count
+            ),
+            self.queue_depths.summary(),
+        ]
+        lines.extend(
+            histogram.summary()
+            for histogram in sorted(
+                self.handling_times.values(),
+                key=lambda h: h.max,
+                reverse=True,
+            )
+        )
+        return "\n".join(lines)
@@ -1,6 +1,5 @@
 # coding: utf-8
 
-import math
 import time
 import logging
 from logging.handlers import SocketHandler
@@ -8,7 +7,7 @@ import sys
 import tomlkit
 
 # pylint: disable=import-error
-from PySide6.QtCore import QTimer, QUrl, QThread
+from PySide6.QtCore import QUrl
 
 # pylint: disable=import-error
 from PySide6.QtGui import QAction, QIcon, QPixmap
@@ -29,15 +28,28 @@ from PySide6.QtWidgets import (
 # pylint: disable=import-error
 from PySide6.QtMultimedia import QSoundEffect
 
-import stama.stama as sm
+import break_engine as be
+import clock_watcher as cw
+import event_bus as eb
 import glowbox as gb
 import breakscreen as bs
 import afk_worker as aw
+import low_power as lp
+import persistence
+import presence
+import screen_lock
+import timer_service as ts
+import tooltip
 
 
 TIME_FORMAT = "%-I:%M:%S %p"
 TOOLTIP_TITLE = "Gentle Break Reminder"
-TOOLTIP_TIMER_INTERVAL = 3000  # in ms
+# Saving the snapshot now and then keeps its time close to when the app
+#  stopped, if it crashes.
+SNAPSHOT_TIMER_INTERVAL = 60_000  # in ms
+# How long after a notification comes up to get the break screen ready, so
+#  that it doesn't hold up the glow box's first frames.
+PREWARM_DELAY = 1  # in seconds
 
 
 # ##############  Logging
@@ -64,633 +76,245 @@ logger.addHandler(socket_handler)
 logger.debug("Logging initialized")
 
 
-# ##############  Events for the state machine
-# fmt: off
-short_break_due_timeout         = sm.Event("Short break due timeout")
-short_break_early_notif_timeout = sm.Event("Short break early notification timeout")
-long_break_due_timeout          = sm.Event("Long break due timeout")
-long_break_early_notif_timeout  = sm.Event("Long break early notification timeout")
-long_break_finished_timeout     = sm.Event("Long break finished")
-break_started                   = sm.Event("Break started")
-break_ended                     = sm.Event("Break ended")
-afk_short_period_ended          = sm.Event("Short AFK period ended")
-afk_long_period_ended           = sm.Event("Long AFK period ended")
-returned_to_computer            = sm.Event("User returned to computer")
-# fmt: on
-
-
-# ##############  Short break state actions
-def set_timer_for_short_break():
-    # TODO This function (and probably others) is too long.  It needs to be refactored.
-    global next_long_break_unix_time
-    secs_to_long_break = next_long_break_unix_time - time.time()
-    logger.debug("secs_to_long_break:  %s", secs_to_long_break)
-
-    num_segments_to_long_break = math.ceil(
-        (secs_to_long_break + config["short_break"]["length"])
-        / (
-            config["short_break"]["length"]
-            + config["short_break"]["max_spacing"]
-        )
-    )
-    logger.debug("num_segments_to_long_break:  %s", num_segments_to_long_break)
-
-    num_short_breaks_to_long_break = num_segments_to_long_break - 1
-    logger.debug(
-        "num_short_breaks_to_long_break:  %s", num_short_breaks_to_long_break
-    )
-
-    total_short_break_secs_to_long_break = (
-        num_short_breaks_to_long_break * config["short_break"]["length"]
-    )
-    logger.debug(
-        "total_short_break_secs_to_long_break:  %s",
-        total_short_break_secs_to_long_break,
-    )
-
-    working_secs_to_long_break = (
-        secs_to_long_break - total_short_break_secs_to_long_break
-    )
-    logger.debug("working_secs_to_long_break:  %s", working_secs_to_long_break)
-
-    secs_to_short_break = (
-        working_secs_to_long_break / num_segments_to_long_break
-    )
-    logger.debug("secs_to_short_break:  %s", secs_to_short_break)
-
-    global next_short_break_unix_time
-    next_short_break_unix_time = time.time() + secs_to_short_break
-
-    secs_to_notification = (
-        secs_to_short_break - config["short_break"]["early_notification"]
-    )
-    logger.debug("secs_to_notification:  %s", secs_to_notification)
-
-    # I had some situations where all the stuff above would sometimes return a
-    #  negative time.  (This mostly/always happened when testing with very short
-    #  timings.)  It turns out that QT -- not having a time machine built in --
-    #  did not like that.  Setting the secs_to_notification to a minimum of 0
-    #  was the easiest way to fix it.
-    secs_to_notification = max(secs_to_notification, 0)
-
-    # ##############  Convey information
-    logger.debug(
-        "%dm%0.1fs to next short break",
-        int(secs_to_short_break // 60),
-        secs_to_short_break % 60,
-    )
-    logger.debug(
-        "%dm%0.1fs to notification",
-        int(secs_to_notification // 60),
-        secs_to_notification % 60,
-    )
-
-    next_short_break_per_clock = time.strftime(
-        config["general"]["time_format"],
-        time.localtime(next_short_break_unix_time),
-    )
-    next_long_break_per_clock = time.strftime(
-        config["general"]["time_format"],
-        time.localtime(next_long_break_unix_time),
-    )
-
-    logger.log(SUCCESS, "Next break (short): %s", next_short_break_per_clock)
-    logger.log(SUCCESS, "Next long break: %s", next_long_break_per_clock)
-
-    # ##############  Set system tray tool tip
-    set_system_tray_tool_tip_text()
-    global tooltip_update_timer
-    tooltip_update_timer.start(TOOLTIP_TIMER_INTERVAL)
-
-    # ##############  Start timer
-    global short_break_timer
-    short_break_timer.start(secs_to_notification * 1000)
-
-
-def show_short_break_early_notification():
-    global glowy
-    glowy.set_main_color(config["colors"]["short"])
-    glowy.run_on_click = lambda: machine.process_event(break_started)
-
-    # TODO Should this include the color to show it as?
-    glowy.show()
-
-    ending_fade_interval = config["general"]["steady_pulse_period"] / 2 / 1_000
-    logger.debug("ending_fade_interval: %s", ending_fade_interval)
-    starting_fade_multiplier = 5
-
-    my_iterable = gb.intervals_decreasing_over_total_time(
-        starting_fade_multiplier,
-        ending_fade_interval,
-        config["short_break"]["early_notification"],
-        config["colors"]["short"],
-        config["colors"]["early"],
-    )
-
-    global machine
-    glowy.transition_color_over_iterable(
-        my_iterable,
-        lambda: machine.process_event(short_break_early_notif_timeout),
-    )
-
-
-def show_short_break_late_notification():
-    glowy.set_main_color(config["colors"]["short"])
-    glowy.run_on_click = lambda: machine.process_event(break_started)
-
-    glowy.show()
-
-    my_iterable = gb.steady_pulse(
-        config["general"]["steady_pulse_period"] / 2,
-        config["colors"]["short"],
-        config["colors"]["late"],
-    )
-    glowy.transition_color_over_iterable(my_iterable, None)
-
-
-# ##############  Long break state actions
-def set_timer_for_long_break():
-    global next_long_break_unix_time
-    secs_to_long_break = next_long_break_unix_time - time.time()
-    secs_to_notification = (
-        secs_to_long_break - config["long_break"]["early_notification"]
-    )
-
-    secs_to_notification = max(secs_to_notification, 0)
-
-    logger.debug(
-        "%dm%0.1fs to next long break",
-        int(secs_to_long_break // 60),
-        secs_to_long_break % 60,
-    )
-    logger.debug(
-        "%dm%0.1fs to notification",
-        int(secs_to_notification // 60),
-        secs_to_notification % 60,
-    )
-
-    next_long_break_per_clock = time.strftime(
-        config["general"]["time_format"],
-        time.localtime(next_long_break_unix_time),
-    )
-
-    logger.log(SUCCESS, "Next break (long): %s", next_long_break_per_clock)
-
-    global tooltip_update_timer, next_short_break_unix_time
-    next_short_break_unix_time = None
-    set_system_tray_tool_tip_text()
-    tooltip_update_timer.start(TOOLTIP_TIMER_INTERVAL)
-
-    global long_break_timer
-    long_break_timer.start(secs_to_notification * 1000)
-
-
-def show_long_break_early_notification():
-    # TODO Should this be a setter?
-    glowy.set_main_color(config["colors"]["regular"])
-    glowy.run_on_click = lambda: machine.process_event(break_started)
-
-    glowy.show()
-
-    ending_fade_interval = config["general"]["steady_pulse_period"] / 2 / 1_000
-    logger.debug("ending_fade_interval: %s", ending_fade_interval)
-    starting_fade_multiplier = 5
-
-    my_iterable = gb.intervals_decreasing_over_total_time(
-        starting_fade_multiplier,
-        ending_fade_interval,
-        config["long_break"]["early_notification"],
-        config["colors"]["regular"],
-        config["colors"]["early"],
-    )
-
-    glowy.transition_color_over_iterable(
-        my_iterable,
-        lambda: machine.process_event(long_break_early_notif_timeout),
-    )
-
-
-def show_long_break_late_notification():
-    glowy.set_main_color(config["colors"]["regular"])
-    glowy.run_on_click = lambda: machine.process_event(break_started)
-
-    glowy.show()
-
-    my_iterable = gb.steady_pulse(
-        config["general"]["steady_pulse_period"] / 2,
-        config["colors"]["regular"],
-        config["colors"]["late"],
-    )
-    glowy.transition_color_over_iterable(my_iterable, None)
-
-
-def reset_next_long_break_time():
-    global next_long_break_unix_time
-    global config
-    next_long_break_unix_time = time.time() + config["long_break"]["spacing"]
-    logger.debug(
-        "Resetting next long break to:  %s",
-        time.strftime(
-            config["general"]["time_format"],
-            time.localtime(next_long_break_unix_time),
-        ),
-    )
-
-
-# ##############  Generic state actions
-def set_static_tool_tip_text(text):
-    global tray_icon, tooltip_update_timer
-    tooltip_update_timer.stop()
-    tray_icon.setToolTip("<b>" + TOOLTIP_TITLE + "</b><br>" + text)
-
-
-# ##############  Set up short break state sub-classes
-class WaitingForShortBreak(sm.State):
-    def __init__(self):
-        super().__init__()
-        self.name = "Waiting for a short break"
-
-    def on_entry(self):
-        set_timer_for_short_break()
-
-    def on_exit(self):
-        short_break_timer.stop()
-
-
-class ShowingShortBreakEarlyNotif(sm.State):
-    def __init__(self):
-        super().__init__()
-        self.name = "Showing the short break early notification"
-
-    def on_entry(self):
-        show_short_break_early_notification()
+# ##############  Showing breaks with Qt
+class QtBreakUI(be.BreakUI):
+    """
+    Shows the break engine's breaks with the glow box, the break screens and
+    the system tray icon, and runs its timers on the timer service.
+    """
 
-    # TODO Only hide the short break early notification if the late notification is not the next state....
-    #  This currently shows a blink when transistioning to the late
-    #  notification.  It's not a deal-breaker, but it's a distraction and a
-    #  little detail that makes a difference.
-    def on_exit(self):
-        glowy.close_and_save_geometry()
-
-
-class ShowingShortBreakLateNotif(sm.State):
     def __init__(self):
         super().__init__()
-        self.name = "Showing the short break late notification"
+        self._timers = {}
 
-    def on_entry(self):
-        show_short_break_late_notification()
+    def start_timer(self, event, delay):
+        if event not in self._timers:
+            self._timers[event] = timer_service.create_timer(
+                lambda: event_bus.post(event), single_shot=True
+            )
+        self._timers[event].start(int(delay * 1000))
 
-    def on_exit(self):
-        glowy.close_and_save_geometry()
+    def stop_timer(self, event):
+        if event in self._timers:
+            self._timers[event].stop()
 
+    def show_schedule(self):
+        global is_showing_schedule
+        is_showing_schedule = True
+        set_system_tray_tool_tip_text()
+        save_snapshot()
 
-class ShortBreakInProgress(sm.State):
-    def __init__(self):
-        super().__init__()
-        self.name = "Short break in progress"
+    def state_entered(self, state):
+        save_snapshot()
 
-    def on_entry(self):
-        global shorty
-        shorty.showFullScreen()
-        set_static_tool_tip_text("Short break in progress")
-        logger.log(SUCCESS, "Taking a short break.")
+    def show_status(self, text):
+        set_static_tool_tip_text(text)
 
-    def on_exit(self):
-        shorty.hide()
-        logger.log(SUCCESS, "Short break finished.")
+    def show_early_notification(self, is_long_break):
+        if is_long_break:
+            main_color = config["colors"]["regular"]
+            early_notification = config["long_break"]["early_notification"]
+            early_notif_timeout = be.long_break_early_notif_timeout
+        else:
+            main_color = config["colors"]["short"]
+            early_notification = config["short_break"]["early_notification"]
+            early_notif_timeout = be.short_break_early_notif_timeout
 
+        # TODO Should this be a setter?
+        glowy.set_main_color(main_color)
+        glowy.run_on_click = start_break_from_click
 
-class WaitingAfterShortAfk(sm.State):
-    def __init__(self):
-        super().__init__()
-        self.name = "Waiting after a short AFK timeout"
+        # TODO Should this include the color to show it as?
+        glowy.show()
+        prewarm_break_screen(is_long_break)
 
-    def on_entry(self):
-        global tray_icon
-        set_static_tool_tip_text("Away from keyboard (short)")
-        logger.log(
-            SUCCESS, "Away from the computer enough to reset the short break."
+        ending_fade_interval = (
+            config["general"]["steady_pulse_period"] / 2 / 1_000
+        )
+        logger.debug("ending_fade_interval: %s", ending_fade_interval)
+        starting_fade_multiplier = 5
+
+        schedule = gb.early_notification_schedule(
+            starting_fade_multiplier,
+            ending_fade_interval,
+            early_notification,
+            main_color,
+            config["colors"]["early"],
         )
 
-    def on_exit(self):
-        pass
-
-
-# ##############  Set up long break state sub-classes
-class WaitingForLongBreak(sm.State):
-    def __init__(self):
-        super().__init__()
-        self.name = "Waiting for a long break"
-
-    def on_entry(self):
-        set_timer_for_long_break()
-
-    def on_exit(self):
-        long_break_timer.stop()
-
-
-class ShowingLongBreakEarlyNotif(sm.State):
-    def __init__(self):
-        super().__init__()
-        self.name = "Showing the long break early notification"
-
-    def on_entry(self):
-        show_long_break_early_notification()
-
-    def on_exit(self):
-        # TODO Only hide the short break early notification if the late notification is not the next state....
-        #  This currently shows a blink when transistioning to the late
-        #  notification.  It's not a deal-breaker, but it's a distraction and a
-        #  little detail that makes a difference.
-        glowy.close_and_save_geometry()
+        glowy.play_schedule(
+            schedule,
+            lambda: event_bus.post(early_notif_timeout),
+        )
+        screen_watcher.set_polling(True)
 
+    def show_late_notification(self, is_long_break):
+        main_color = config["colors"]["regular" if is_long_break else "short"]
+        glowy.set_main_color(main_color)
+        glowy.run_on_click = start_break_from_click
 
-class ShowingLongBreakLateNotif(sm.State):
-    def __init__(self):
-        super().__init__()
-        self.name = "Showing the long break late notification"
+        glowy.show()
+        prewarm_break_screen(is_long_break)
 
-    def on_entry(self):
-        show_long_break_late_notification()
+        schedule = gb.steady_pulse_schedule(
+            config["general"]["steady_pulse_period"] / 2,
+            main_color,
+            config["colors"]["late"],
+        )
+        glowy.play_schedule(schedule)
+        screen_watcher.set_polling(True)
 
-    def on_exit(self):
+    def hide_notification(self):
+        screen_watcher.set_polling(False)
         glowy.close_and_save_geometry()
 
+    def show_short_break(self):
+        shorty.time_first_paint(take_clicked_time())
+        shorty.showFullScreen()
+        if low_power_mode.is_active:
+            shorty.pause_countdown_updates()
 
-class LongBreakInProgress(sm.State):
-    def __init__(self):
-        super().__init__()
-        self.name = "Long break in progress"
+    def hide_short_break(self):
+        shorty.hide()
 
-    def on_entry(self):
-        global longy
+    def show_long_break(self):
         longy.set_layout_to_countdown()
+        longy.time_first_paint(take_clicked_time())
         longy.showFullScreen()
-        set_static_tool_tip_text("Long break in progress")
-        logger.log(SUCCESS, "Taking a long break.")
-
-    def on_exit(self):
-        reset_next_long_break_time()
-
-
-class LongBreakFinished(sm.State):
-    def __init__(self):
-        super().__init__()
-        self.name = "Long break finished"
+        if low_power_mode.is_active:
+            longy.pause_countdown_updates()
 
-    def on_entry(self):
-        global long_break_chime
+    def show_long_break_finished(self):
         longy.set_layout_to_finished()
         longy.showFullScreen()
         long_break_chime.play()
-        set_static_tool_tip_text("Long break finished")
 
-    def on_exit(self):
-        reset_next_long_break_time()
-        logger.log(SUCCESS, "Getting back to work!")
 
+# ##############  Showing the break screens quickly
+def prewarm_break_screen(is_long_break):
+    """Gets the break screen ready, while the notification is up."""
+    global clicked_time
+    clicked_time = None
+    timer_service.call_later(
+        PREWARM_DELAY, (longy if is_long_break else shorty).prewarm, slack=1
+    )
 
-class WaitingAfterLongAfk(sm.State):
-    def __init__(self):
-        super().__init__()
-        self.name = "Waiting after a long AFK timeout"
 
-    def on_entry(self):
-        set_static_tool_tip_text("Away from keyboard (long)")
-        logger.log(
-            SUCCESS, "Away from the computer enough to reset the long break."
-        )
+def start_break_from_click():
+    global clicked_time
+    clicked_time = time.perf_counter()
+    event_bus.post(be.break_started)
 
-    def on_exit(self):
-        reset_next_long_break_time()
-        logger.log(SUCCESS, "Back at the computer.")
 
+def take_clicked_time():
+    """
+    Returns when the glow box was clicked to start the break being shown
+    (or None, if it wasn't), so that the break screen can time how long it
+    takes to come up.
+    """
+    global clicked_time
+    since, clicked_time = clicked_time, None
+    return since
 
-# ##############  Set up conditional junction boolean
-def has_short_break_before_long_break():
-    global next_long_break_unix_time
-    secs_to_long_break = next_long_break_unix_time - time.time()
-    if config["short_break"]["max_spacing"] < secs_to_long_break:
-        logger.debug(
-            "has_short_break_before_long_break is True: %s < %s",
-            config["short_break"]["max_spacing"],
-            secs_to_long_break,
+
+# ##############  Snapshots of the break cycle
+def save_snapshot():
+    if config["snapshot"]["file"]:
+        persistence.save_snapshot(
+            state_files,
+            config["snapshot"]["file"],
+            dict(engine.snapshot(), away_since=away_since),
         )
-        return True
-    logger.debug(
-        "has_short_break_before_long_break is False: %s >= %s",
-        config["short_break"]["max_spacing"],
-        secs_to_long_break,
-    )
-    return False
 
 
-# ##############  Set up junctions
-class TestForNextBreak(sm.ConditionalJunction):
-    def __init__(self):
-        super().__init__(
-            default_state=waiting_for_long_break, name="Testing for next break"
-        )
-        self.add_condition(
-            has_short_break_before_long_break, waiting_for_short_break
-        )
+def set_away_since(since):
+    """Keeps the time the user went AFK (or None) for the snapshots."""
+    global away_since
+    if since != away_since:
+        away_since = since
+        save_snapshot()
 
 
-# ##############  States
-# fmt: off
-waiting_for_short_break         = WaitingForShortBreak()
-showing_short_break_early_notif = ShowingShortBreakEarlyNotif()
-showing_short_break_late_notif  = ShowingShortBreakLateNotif()
-short_break_in_progress         = ShortBreakInProgress()
-waiting_after_short_afk         = WaitingAfterShortAfk()
-
-waiting_for_long_break          = WaitingForLongBreak()
-showing_long_break_early_notif  = ShowingLongBreakEarlyNotif()
-showing_long_break_late_notif   = ShowingLongBreakLateNotif()
-long_break_in_progress          = LongBreakInProgress()
-long_break_finished             = LongBreakFinished()
-waiting_after_long_afk          = WaitingAfterLongAfk()
-
-test_for_next_break             = TestForNextBreak()
-
-
-# ##############  Short break transitions
-waiting_for_short_break.transitions = {
-    short_break_due_timeout:            showing_short_break_early_notif,
-    afk_short_period_ended:             waiting_after_short_afk,
-    afk_long_period_ended:              waiting_after_long_afk,
-    returned_to_computer:               None,
-}
-
-showing_short_break_early_notif.transitions = {
-    short_break_early_notif_timeout:    showing_short_break_late_notif,
-    break_started:                      short_break_in_progress,
-    break_ended:                        test_for_next_break,  # Skipping the break
-    afk_short_period_ended:             waiting_after_short_afk,
-    afk_long_period_ended:              waiting_after_long_afk,
-    returned_to_computer:               None,
-}
-
-showing_short_break_late_notif.transitions = {
-    break_started:                      short_break_in_progress,
-    break_ended:                        test_for_next_break,  # Skipping the break
-    afk_short_period_ended:             waiting_after_short_afk,
-    afk_long_period_ended:              waiting_after_long_afk,
-    returned_to_computer:               None,
-}
-
-short_break_in_progress.transitions = {
-    break_ended:                        test_for_next_break,
-    afk_short_period_ended:             None,
-    afk_long_period_ended:              None,  # TODO
-    returned_to_computer:               None,  # TODO
-}
-
-waiting_after_short_afk.transitions = {
-    short_break_due_timeout:            None,
-    long_break_due_timeout:             None,
-    afk_long_period_ended:              waiting_after_long_afk,
-    returned_to_computer:               test_for_next_break,
-}
-
-
-# ##############  Long break transitions
-waiting_for_long_break.transitions = {
-    long_break_due_timeout:             showing_long_break_early_notif,
-    afk_short_period_ended:             None,
-    afk_long_period_ended:              waiting_after_long_afk,
-    returned_to_computer:               None,
-}
-
-showing_long_break_early_notif.transitions = {
-    long_break_early_notif_timeout:     showing_long_break_late_notif,
-    break_started:                      long_break_in_progress,
-    break_ended:                        test_for_next_break,  # Skipping the break
-    afk_short_period_ended:             None,
-    afk_long_period_ended:              waiting_after_long_afk,
-    returned_to_computer:               None,
-}
-
-showing_long_break_late_notif.transitions = {
-    break_started:                      long_break_in_progress,
-    break_ended:                        test_for_next_break,  # Skipping the break
-    afk_short_period_ended:             None,
-    afk_long_period_ended:              waiting_after_long_afk,
-    returned_to_computer:               None,
-}
-
-long_break_in_progress.transitions = {
-    long_break_finished_timeout:        long_break_finished,
-    break_ended:                        test_for_next_break,  # Skipping the break
-    afk_short_period_ended:             None,
-    afk_long_period_ended:              None,
-    # TODO If the user starts uses the computer during a break, pause the break....
-    #  However, this should be handled by the AFK status, not by the
-    #  returned_to_computer State in the general state machine.
-    returned_to_computer:               None,
-}
-
-long_break_finished.transitions = {
-    break_ended:                        test_for_next_break,
-    afk_short_period_ended:             None,
-    afk_long_period_ended:              None,
-    # TODO If the user starts uses the computer after a break is finished, consider the break as done....
-    #  However, this should probably be handled by the AFK status, not by the
-    #  returned_to_computer State in the general state machine.  (But I see no
-    #  reason why doing both would break anything.  Of course it's the AFK
-    #  state the triggers the returned_to_computer state.  Maybe I could use
-    #  returned_to_computer as a stopgap until I set it up to use the AFK
-    #  status?
-    returned_to_computer:               None,
-}
-
-waiting_after_long_afk.transitions = {
-    short_break_due_timeout:            None,
-    long_break_due_timeout:             None,
-    returned_to_computer:               test_for_next_break,
-}
-# fmt:on
-
-
-# ##############  Functions repeating on a timed interval
-def get_relative_due_time(seconds):
-    # TODO Use doc tests in this function.
-    closest_minute = (seconds + 30) // 60
-    if closest_minute == 0:
-        return "Due right now"
-    elif closest_minute == -1:
-        return "Past due by about 1 minute"
-    elif closest_minute < -1:
-        return "Past due by about {:.0f} minutes".format(-closest_minute)
-    elif closest_minute == 1:
-        return "In about 1 minute"
-    elif closest_minute > 1:
-        return "In about {:.0f} minutes".format(closest_minute)
-
-
-def get_tooltip_break_message(
-    next_break_unix_time, time_format, show_clock_times, show_relative_times
-):
-    secs_to_break = next_break_unix_time - time.time()
-
-    if show_clock_times:
-        next_break_per_clock = time.strftime(
-            time_format,
-            time.localtime(next_break_unix_time),
-        )
-        if show_relative_times:
-            next_break_relative = get_relative_due_time(secs_to_break)
-            return "<br>{}<br>({})".format(
-                next_break_relative, next_break_per_clock
-            )
-        else:
-            return "<br>{}".format(next_break_per_clock)
-    else:
-        if show_relative_times:
-            next_break_relative = get_relative_due_time(secs_to_break)
-            return "<br>{}".format(next_break_relative)
-        else:
-            return ""
+# ##############  Low power mode
+def enter_low_power_mode(clock_watcher, snapshot_timer):
+    """
+    Stops everything that's only there for the user to look at, and
+    everything that can wait until they're back.
+    """
+    tooltip_update_timer.stop()
+    glowy.set_obscured("low power mode", True)
+    shorty.pause_countdown_updates()
+    longy.pause_countdown_updates()
+    screen_watcher.pause()
+    clock_watcher.pause()
+    if snapshot_timer is not None:
+        # From here on, the snapshot is only saved on each change of state.
+        save_snapshot()
+        snapshot_timer.stop()
+    socket_handler.setLevel(logging.WARNING)
+
+
+def exit_low_power_mode(clock_watcher, snapshot_timer):
+    socket_handler.setLevel(0)
+    # Any suspend while in low power mode is caught up on before anything
+    #  is shown.
+    clock_watcher.resume()
+    if snapshot_timer is not None:
+        snapshot_timer.start(SNAPSHOT_TIMER_INTERVAL)
+    shorty.resume_countdown_updates()
+    longy.resume_countdown_updates()
+    screen_watcher.resume()
+    glowy.set_obscured("low power mode", False)
+    if is_showing_schedule:
+        set_system_tray_tool_tip_text()
 
 
-def set_system_tray_tool_tip_text():
-    global next_long_break_unix_time, next_short_break_unix_time
+# ##############  Generic state actions
+def show_tool_tip(text):
+    """Shows `text` on the system tray icon, if it isn't showing already."""
+    global shown_tool_tip
+    if text != shown_tool_tip:
+        shown_tool_tip = text
+        tray_icon.show()
+        tray_icon.setToolTip(text)
 
-    next_long_break_message = get_tooltip_break_message(
-        next_long_break_unix_time,
-        config["general"]["time_format"],
-        config["general"]["show_clock_times"],
-        config["general"]["show_relative_times"],
-    )
 
-    tooltip_message = ""
+def set_static_tool_tip_text(text):
+    global is_showing_schedule
+    is_showing_schedule = False
+    tooltip_update_timer.stop()
+    show_tool_tip("<b>" + TOOLTIP_TITLE + "</b><br>" + text)
 
-    if not (
-        config["general"]["show_clock_times"]
-        or config["general"]["show_relative_times"]
-    ):
-        tooltip_message = ""
-    elif next_short_break_unix_time is not None:
-        next_short_break_message = get_tooltip_break_message(
-            next_short_break_unix_time,
-            config["general"]["time_format"],
-            config["general"]["show_clock_times"],
-            config["general"]["show_relative_times"],
-        )
 
-        tooltip_message += "<br><u>Next break (short):</u>"
-        tooltip_message += next_short_break_message
+# ##############  Functions repeating when the tool tip changes
+def set_system_tray_tool_tip_text():
+    next_short_break_time = engine.next_short_break_time
+    if next_short_break_time is not None:
+        next_short_break_time = engine.to_wall_time(next_short_break_time)
+    # The breaks after the next short and long ones, if they were all taken
+    #  on time.
+    shown_break_times = (
+        engine.next_short_break_time,
+        engine.next_long_break_time,
+    )
+    later_breaks = [
+        planned._replace(time=engine.to_wall_time(planned.time))
+        for planned in engine.next_breaks(
+            config["general"]["later_breaks_shown"] + len(shown_break_times)
+        )
+        if planned.time not in shown_break_times
+    ][: config["general"]["later_breaks_shown"]]
+    text, wait = schedule_tooltip.render(
+        engine.to_wall_time(engine.next_long_break_time),
+        next_short_break_time,
+        later_breaks,
+    )
+    show_tool_tip(text)
 
-        tooltip_message += "<br><u>Next long break:</u>"
-        tooltip_message += next_long_break_message
+    if low_power_mode.is_active:
+        tooltip_update_timer.stop()
     else:
-        tooltip_message += "<br><u>Next break (long):</u>"
-        tooltip_message += next_long_break_message
-
-    global tray_icon
-    tray_icon.show()
-    tray_icon.setToolTip("<b>" + TOOLTIP_TITLE + "</b>" + tooltip_message)
+        tooltip_update_timer.start(wait * 1_000)
 
 
 # ##############  Functions used in __main__
@@ -710,7 +334,7 @@ def show_splash_screen(image, timeout=3000):
     pixmap = QPixmap(image)
     splash = QSplashScreen(pixmap)
     splash.show()
-    QTimer.singleShot(timeout, lambda: splash.close())
+    timer_service.call_later(timeout / 1_000, splash.close)
 
 
 class AboutWindow(QDialog):
@@ -746,7 +370,13 @@ def main():
             "time_format": TIME_FORMAT,
             "show_relative_times": True,
             "show_clock_times": False,
+            "later_breaks_shown": 3,
             "splash_screen_timeout": 5_000,
+            "timer_slack": 50,
+            "suspend_policy": "count_as_afk",
+            "trace_transitions": False,
+            "low_power_mode": True,
+            "state_directory": "",
         },
         "long_break": {
             "spacing": 50 * 60,
@@ -768,6 +398,17 @@ def main():
             "late": "yellow",
         },
         "afk_options": {},
+        "glowbox": {
+            "max_frame_rate": 0,
+            "color_steps": 256,
+        },
+        "presence": {
+            "window": 4 * 60 * 60,
+            "file": "presence.bin",
+        },
+        "snapshot": {
+            "file": "snapshot.json",
+        },
     }
 
     # ##############  Load configuration from file
@@ -788,6 +429,14 @@ def main():
             CONFIGURATION_FILE,
         )
 
+    # ##############  Check the configuration
+    # Anything here would otherwise only go wrong once a break is due.
+    if config["general"]["steady_pulse_period"] < 1:
+        raise ValueError(
+            "steady_pulse_period has to be at least 1 millisecond, "
+            "not {}".format(config["general"]["steady_pulse_period"])
+        )
+
     # ##############  Adjust console logger with configured time format
     console_formatter = logging.Formatter(
         fmt="%(asctime)s - %(message)s",
@@ -795,53 +444,119 @@ def main():
     )
     console_handler.setFormatter(console_formatter)
 
-    # ##############  Set up concurrent timers
-    global short_break_timer
-    short_break_timer = QTimer(
-        singleShot=True,
-        timeout=lambda: machine.process_event(short_break_due_timeout),
+    # ##############  Load the app's state files
+    # They're all read here, once, and written later on another thread, so
+    #  the GUI never waits for the disk.
+    global state_files
+    state_files = persistence.PersistenceService(
+        config["general"]["state_directory"]
+        or persistence.default_state_directory()
     )
-    global long_break_timer
-    long_break_timer = QTimer(
-        singleShot=True,
-        timeout=lambda: machine.process_event(long_break_due_timeout),
+    logger.debug("Keeping state files in %s", state_files.directory)
+
+    load_start = time.perf_counter()
+    state_files.load(gb.GEOMETRY_FILE)
+    snapshot = None
+    if config["snapshot"]["file"]:
+        snapshot = persistence.load_snapshot(
+            state_files, config["snapshot"]["file"]
+        )
+    logger.debug(
+        "Loaded the state files in %0.0f microseconds",
+        (time.perf_counter() - load_start) * 1_000_000,
     )
 
-    reset_next_long_break_time()
+    # ##############  Track time spent at the computer
+    # This comes before anything that can show the tool tip (which reads
+    #  it), and needs nothing but the state directory.
+    global presence_tracker
+    presence_tracker = None
+    if config["presence"]["window"] > 0:
+        presence_tracker = presence.PresenceTracker(
+            state_files.path(config["presence"]["file"])
+        )
+        # The AFK worker starts out assuming the user is at the computer.
+        presence_tracker.mark_present(time.time())
 
     # ##############  Set up Qt
     app = QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(False)
 
+    # ##############  Set up the timer service all the timers run on
+    global timer_service
+    timer_service = ts.TimerService(
+        slack=config["general"]["timer_slack"] / 1_000
+    )
+
+    global low_power_mode
+    low_power_mode = lp.LowPowerMode(timer_service)
+
+    # ##############  Set up the event bus, which feeds the break engine
+    # Every event goes through here, so that a burst of them (from the AFK
+    #  worker, say) turns into as few changes of state as possible.
+    global event_bus
+    event_bus = eb.EventBus(
+        lambda event: engine.process_event(event), be.EVENT_PRIORITIES
+    )
+
     if config["general"]["splash_screen_timeout"] > 0:
         show_splash_screen(
             "splash_screen.png", config["general"]["splash_screen_timeout"]
         )
 
     global glowy
-    glowy = gb.GlowBox()
+    glowy = gb.GlowBox(
+        max_frame_rate=config["glowbox"]["max_frame_rate"],
+        color_steps=config["glowbox"]["color_steps"],
+        state_files=state_files,
+    )
+
+    # ##############  Pause the glow box while it can't be seen
+    # (While a notification is showing, the X server is also asked every
+    #  so often whether the screens are off.)
+    global screen_watcher
+    screen_watcher = screen_lock.X11ScreenWatcher(timer_service=timer_service)
+    screen_watcher.screensaver_changed.connect(
+        lambda is_on: glowy.set_obscured("screensaver", is_on)
+    )
+    screen_watcher.screens_off_changed.connect(
+        lambda are_off: glowy.set_obscured("screens off", are_off)
+    )
+    screen_watcher.start()
+
+    lock_watcher = screen_lock.ScreenLockWatcher()
+    lock_watcher.locked_changed.connect(
+        lambda is_locked: glowy.set_obscured("screen locked", is_locked)
+    )
+    lock_watcher.start()
 
     global shorty
     if config["general"]["allow_skipping_short_breaks"]:
         shorty = bs.ShortBreakScreen(
             config["short_break"]["length"],
-            lambda: machine.process_event(break_ended),
-            lambda: machine.process_event(break_ended),
+            lambda: event_bus.post(be.break_ended),
+            lambda: event_bus.post(be.break_ended),
+            timer_service=timer_service,
         )
     else:
         shorty = bs.ShortBreakScreen(
             config["short_break"]["length"],
-            lambda: machine.process_event(break_ended),
+            lambda: event_bus.post(be.break_ended),
+            timer_service=timer_service,
         )
 
     global longy
     longy = bs.LongBreakScreen(
         config["long_break"]["length"],
-        lambda: machine.process_event(long_break_finished_timeout),
-        lambda: machine.process_event(break_ended),
-        lambda: machine.process_event(break_ended),
+        lambda: event_bus.post(be.long_break_finished_timeout),
+        lambda: event_bus.post(be.break_ended),
+        lambda: event_bus.post(be.break_ended),
+        timer_service=timer_service,
     )
 
+    global clicked_time
+    clicked_time = None
+
     # ##############  Add chime
     # TODO Stop the chime when the user clicks "Let me get back to work".
     long_break_chime_file = config["long_break"]["chime"]
@@ -869,28 +584,61 @@ def main():
 
     tray_icon.setContextMenu(tray_menu)
 
+    global shown_tool_tip
+    shown_tool_tip = TOOLTIP_TITLE
     tray_icon.setToolTip(TOOLTIP_TITLE)
 
     tray_icon.show()
 
     # ##############  Set up system tray icon tool tip timer
-    global tooltip_update_timer, next_short_break_unix_time
-    next_short_break_unix_time = None
-    tooltip_update_timer = QTimer(timeout=set_system_tray_tool_tip_text)
-    tooltip_update_timer.start(TOOLTIP_TIMER_INTERVAL)
+    # The tool tip is only rendered again when its text changes.  It can be
+    #  a second late.
+    global tooltip_update_timer, is_showing_schedule
+    tooltip_update_timer = timer_service.create_timer(
+        set_system_tray_tool_tip_text, single_shot=True, slack=1
+    )
+    is_showing_schedule = False
+
+    global schedule_tooltip
+    schedule_tooltip = tooltip.ScheduleTooltip(
+        TOOLTIP_TITLE,
+        config["general"]["time_format"],
+        config["general"]["show_clock_times"],
+        config["general"]["show_relative_times"],
+        fraction_present=(
+            presence_tracker.fraction_present
+            if presence_tracker is not None
+            else None
+        ),
+        presence_window=config["presence"]["window"],
+    )
 
     # ##############  Start state machine
     logger.log(SUCCESS, "Welcome to the Gentle Break Reminder!")
 
-    global machine
-    machine = sm.StateMachine(waiting_for_short_break)
+    global away_since
+    away_since = None
+
+    global engine
+    engine = be.BreakEngine(
+        config,
+        QtBreakUI(),
+        clock=cw.elapsed_time,
+        trace_transitions=config["general"]["trace_transitions"],
+    )
+    engine.start(snapshot)
 
     # ##############  Set up AFK listener
-    # TODO The afk periods need to be longer than the "limbo" to "back at computer" timeout....
-    #  Otherwise we end up in a situation where we can be in a "Waiting after
-    #  AFK for long duration" state when we receive a "Short AFK period ended"
-    #  event, which the first is not set up to handle.
-    scheduled_events = {}
+    # The afk periods need to be longer than the "limbo" to "back at
+    #  computer" timeout.  Otherwise the "Short AFK period ended" event can
+    #  come again while "Waiting after AFK for long duration", which ignores
+    #  it.
+    # The worker only wakes up when the AFK status could change, so it runs
+    #  in this thread, with its timer batched with all the others.
+    afk_worker = aw.AFKWorker(
+        timer_service=timer_service, **config["afk_options"]
+    )
+
     if (
         config["away_from_keyboard"]["short_break_timeout"]
         >= config["away_from_keyboard"]["long_break_timeout"]
@@ -899,40 +647,77 @@ def main():
             "The short break AFK timeout is set to be the same as or longer than the long break AFK timeout.  This makes no sense, and the AFK short break timeout will not be set."
         )
     elif config["away_from_keyboard"]["short_break_timeout"] > 0:
-        scheduled_events[
-            config["away_from_keyboard"]["short_break_timeout"]
-        ] = lambda: machine.process_event(afk_short_period_ended)
+        afk_worker.add_scheduled_timeout(
+            config["away_from_keyboard"]["short_break_timeout"],
+            lambda: event_bus.post(be.afk_short_period_ended),
+        )
 
     if config["away_from_keyboard"]["long_break_timeout"] > 0:
-        scheduled_events[
-            config["away_from_keyboard"]["long_break_timeout"]
-        ] = lambda: machine.process_event(afk_long_period_ended)
+        afk_worker.add_scheduled_timeout(
+            config["away_from_keyboard"]["long_break_timeout"],
+            lambda: event_bus.post(be.afk_long_period_ended),
+        )
 
-    afk_thread = QThread()
-    afk_worker = aw.AFKWorker(
-        scheduled_timeouts=list(scheduled_events.keys()),
-        **config["afk_options"],
+    afk_worker.at_computer_signal.connect(
+        lambda t: event_bus.post(be.returned_to_computer)
     )
 
-    afk_worker.scheduled_signal.connect(lambda t: scheduled_events[t]())
+    if presence_tracker is not None:
+        afk_worker.at_computer_signal.connect(presence_tracker.mark_present)
+        afk_worker.afk_signal.connect(presence_tracker.mark_away)
 
-    afk_worker.at_computer_signal.connect(
-        lambda t: machine.process_event(returned_to_computer)
-    )
+    afk_worker.afk_signal.connect(set_away_since)
+    afk_worker.at_computer_signal.connect(lambda t: set_away_since(None))
 
-    afk_worker.moveToThread(afk_thread)
-    afk_thread.started.connect(afk_worker.start_worker)
-    afk_thread.start()
+    afk_worker.start_worker()
+
+    # ##############  Watch for suspends, and the wall clock being set
+    clock_watcher = cw.ClockWatcher(timer_service=timer_service)
+    clock_watcher.suspended.connect(engine.handle_suspend)
+    clock_watcher.clock_stepped.connect(engine.handle_clock_step)
+    clock_watcher.start()
+
+    # ##############  Keep the snapshot's time fresh
+    snapshot_timer = None
+    if config["snapshot"]["file"]:
+        snapshot_timer = timer_service.create_timer(save_snapshot, slack=5)
+        snapshot_timer.start(SNAPSHOT_TIMER_INTERVAL)
+
+    # ##############  Save power while nobody is using the computer
+    if config["general"]["low_power_mode"]:
+        afk_worker.afk_signal.connect(low_power_mode.mark_away)
+        afk_worker.at_computer_signal.connect(low_power_mode.mark_present)
+        lock_watcher.locked_changed.connect(low_power_mode.set_screen_locked)
+
+    low_power_mode.entered.connect(
+        lambda: enter_low_power_mode(clock_watcher, snapshot_timer)
+    )
+    low_power_mode.exited.connect(
+        lambda: exit_low_power_mode(clock_watcher, snapshot_timer)
+    )
 
-    # ##############  Clean up AFK thread on exit
+    # ##############  Clean up on exit
     def cleanup():
         """
-        Stop timers and threads before exiting the application.  (Otherwise we
-        get errors complaining that we didn't.)
+        Stop timers and input listeners before exiting the application.
+        (Otherwise we get errors complaining that we didn't.)
         """
         afk_worker.stopTimerSignal.emit()
-        afk_thread.quit()
-        afk_thread.wait()
+        clock_watcher.stop()
+        screen_watcher.stop()
+        save_snapshot()
+        state_files.close()
+        if presence_tracker is not None:
+            presence_tracker.close()
+        logger.info(timer_service.summary())
+        logger.info(event_bus.summary())
+        logger.info(low_power_mode.summary())
+        logger.info(glowy.frame_stats.summary())
+        logger.info(state_files.summary())
+        logger.info(shorty.paint_latency.summary())
+        logger.info(longy.paint_latency.summary())
+        if engine.trace is not None:
+            logger.info(engine.trace.summary())
 
     app.aboutToQuit.connect(cleanup)
 
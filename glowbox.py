@@ -1,19 +1,25 @@
 """Creates a pulsing box on the screen that can execute actions when it's clicked"""
 
-import json
-import shutil
+import bisect
+import functools
+import itertools
+import math
+import time
 import logging
+from typing import NamedTuple, Tuple
 
 # pylint: disable=import-error
 from PySide6.QtCore import (
     Qt,
+    QEvent,
     QPropertyAnimation,
     Property,
     QEasingCurve,
+    QTimer,
 )
 
 # pylint: disable=import-error
-from PySide6.QtGui import QColor, QPalette  # , QAction
+from PySide6.QtGui import QColor, QPainter  # , QAction
 
 # pylint: disable=import-error
 from PySide6.QtWidgets import (
@@ -27,19 +33,66 @@ from PySide6.QtWidgets import (
 logger = logging.getLogger(__name__)
 
 
+# Where the glow box's size and position are kept, in its state files.
+GEOMETRY_FILE = "geometry.json"
+
+
 class GlowBox(QWidget):
     """Creates a pulsing box on the screen that can execute actions when it's clicked"""
 
-    color = Property(
-        QColor,
-        lambda self: self.palette().color(QPalette.Window),
-        lambda self, color: self.setPalette(QPalette(color)),
-    )
-
-    def __init__(self, run_on_click=None):
+    # The glow box paints itself, with one fill of `_color`.  While a pulse
+    #  is playing, the animation only moves `level` (from 0 at the main
+    #  color, to 1 at the other color), and the color is looked up in the
+    #  pulse's table of colors, so nothing is allocated on each frame, and
+    #  the box is only repainted when the color actually changes.
+    def _get_level(self):
+        return self._level
+
+    def _set_level(self, level):
+        self._level = level
+        last_index = len(self._color_table) - 1
+        index = min(last_index, max(0, round(level * last_index)))
+        if index != self._color_index:
+            self._color_index = index
+            self._color = self._color_table[index]
+            self.update()
+
+    level = Property(float, _get_level, _set_level)
+
+    def _set_color(self, color):
+        self._color = QColor(color)
+        self._color_table = (self._color,)
+        self._color_index = None
+        self.update()
+
+    color = Property(QColor, lambda self: QColor(self._color), _set_color)
+
+    def __init__(
+        self,
+        run_on_click=None,
+        max_frame_rate=0,
+        color_steps=None,
+        state_files=None,
+    ):
+        """
+        Args:
+            run_on_click: Run when the glow box is clicked.
+
+            max_frame_rate: The most frames per second to draw, or 0 to draw
+                as many as Qt animates (about 60).  Over a remote desktop,
+                every frame is sent over the network.
+
+            color_steps: How many shades to fade between two colors with.
+                (By default, `COLOR_TABLE_SIZE`.)
+
+            state_files: The PersistenceService to keep the glow box's size
+                and position in.  Without one, it starts in the middle of
+                the screen every time.
+        """
         super().__init__()
 
         self.run_on_click = run_on_click
+        self.state_files = state_files
 
         self.setWindowTitle("Gentle break reminder")
 
@@ -60,7 +113,7 @@ class GlowBox(QWidget):
         # TODO Magic number
         self.setWindowOpacity(0.7)
 
-        self.setAutoFillBackground(True)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
 
         grip_size = 5
         self.grip = QSizeGrip(self)
@@ -85,11 +138,62 @@ class GlowBox(QWidget):
         self.previous_position = None
 
         self._color_main = QColor("grey")
-
-        self.color_animation = QPropertyAnimation(self, b"color")
+        self._level = 0.0
+        self._set_color(self._color_main)
+
+        # Whole pulse schedules are played by this one animation, as
+        #  keyframes, so nothing runs in Python from one pulse to the next.
+        self.color_animation = QPropertyAnimation(self, b"level")
+        self.color_animation.finished.connect(self._on_animation_finished)
+        self._run_on_completion = None
+        self._color_steps = max(2, color_steps or COLOR_TABLE_SIZE)
+
+        # With a frame rate cap, schedules are played by this timer instead
+        #  of the animation, and moving the window waits for it too.
+        self._frame_timer = None
+        if max_frame_rate > 0:
+            self._frame_timer = QTimer(self)
+            self._frame_timer.setInterval(round(1_000 / max_frame_rate))
+            self._frame_timer.timeout.connect(self._on_frame)
+        self._schedule = None
+        self._schedule_start_time = None
+        self._pending_position = None
+
+        # While the glow box can't be seen, this ends the schedule instead.
+        self._end_timer = QTimer(self)
+        self._end_timer.setSingleShot(True)
+        self._end_timer.setTimerType(Qt.PreciseTimer)
+        self._end_timer.timeout.connect(self._finish_schedule)
+        self._obscured_by = set()
+        self._is_watching_exposure = False
+
+        self.frame_stats = FrameStats()
 
     # # # # # # # #   QT QWidget overrides
 
+    # pylint: disable=invalid-name
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), self._color)
+        painter.end()
+        self.frame_stats.record(event.rect())
+
+    # pylint: disable=invalid-name
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.frame_stats.shown()
+        # The window is covered, or minimized, or on a screen that's off.
+        if not self._is_watching_exposure and self.windowHandle() is not None:
+            self.windowHandle().installEventFilter(self)
+            self._is_watching_exposure = True
+
+    # pylint: disable=invalid-name
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.frame_stats.hidden()
+        # Whatever's shown next will play a schedule of its own.
+        self._stop_schedule()
+
     # pylint: disable=invalid-name
     def mousePressEvent(self, event):
         self.offset = event.position().toPoint()
@@ -99,10 +203,19 @@ class GlowBox(QWidget):
     # pylint: disable=invalid-name
     def mouseMoveEvent(self, event):
         if self.is_moving:
-            self.move(event.globalPosition().toPoint() - self.offset)
+            position = event.globalPosition().toPoint() - self.offset
+            if self._frame_timer is None:
+                self.move(position)
+            else:
+                self._pending_position = position
+                if not self._frame_timer.isActive():
+                    self._frame_timer.start()
 
     # pylint: disable=invalid-name
     def mouseReleaseEvent(self, event):
+        if self._pending_position is not None:
+            self.move(self._pending_position)
+            self._pending_position = None
         if event.globalPosition().toPoint() == self.previous_position:
             if self.run_on_click is not None:
                 logger.info("Glowbox clicked!  Running: %s", self.run_on_click)
@@ -132,54 +245,169 @@ class GlowBox(QWidget):
     def set_main_color(self, color=None):
         if color is not None:
             self._color_main = color
-        palette = self.palette()
-        palette.setColor(QPalette.Window, QColor(self._color_main))
-        self.setPalette(palette)
-
-    def transition_to_color(self, transition, on_transition_done=None):
+        self._set_color(self._color_main)
+
+    def play_schedule(self, schedule, run_on_completion=None):
+        """
+        Plays a compiled `PulseSchedule` on the glow box, and then runs
+        `run_on_completion` (unless the schedule loops forever, or the glow
+        box has been hidden by then).
+        """
         # TODO If a person really wants to transition the color when the window
         #  is hidden, I could add an option for that here.
-        if self.isVisible():
-            logger.debug("Transitioning color to %s", transition)
-            self.color_animation.setEndValue(QColor(transition["new_color"]))
-            self.color_animation.setDuration(transition["duration"])
-            # TODO Do I want to change the default easing curve?
-            default_easing_curve = QEasingCurve.InOutSine
-            if "easing curve" in transition:
-                self.color_animation.setEasingCurve(transition["easing curve"])
-            else:
-                self.color_animation.setEasingCurve(default_easing_curve)
+        if not self.isVisible():
+            return
+        logger.debug(
+            "Playing a %s ms schedule of %s keyframes",
+            schedule.duration,
+            len(schedule.keyframes),
+        )
+        self._stop_schedule()
+        self._schedule = schedule
+        self._schedule_start_time = time.monotonic()
+        self._run_on_completion = run_on_completion
+        self._color_table = color_table(
+            schedule.main_color, schedule.secondary_color, self._color_steps
+        )
+        self._color_index = None
+        if self._frame_timer is None:
+            self.color_animation.setKeyValues(list(schedule.keyframes))
+            self.color_animation.setDuration(schedule.duration)
+            self.color_animation.setLoopCount(-1 if schedule.loops else 1)
+        self._play_from_now()
+
+    def _elapsed_time(self):
+        """Returns how far (in milliseconds) the schedule should be by now."""
+        elapsed = (time.monotonic() - self._schedule_start_time) * 1_000
+        if self._schedule.loops and self._schedule.duration > 0:
+            elapsed %= self._schedule.duration
+        return elapsed
+
+    def _play_from_now(self):
+        """Plays the schedule from wherever it should be by now."""
+        if self._obscured_by:
+            self._wait_for_schedule_end()
+        elif self._frame_timer is not None:
+            self._on_frame()
+        elif (
+            not self._schedule.loops
+            and self._elapsed_time() >= self._schedule.duration
+        ):
+            self._finish_schedule()
+        else:
             self.color_animation.start()
-            if on_transition_done:
-                try:
-                    self.color_animation.finished.disconnect()
-                except RuntimeError as e:
-                    logger.info(
-                        # pylint: disable=line-too-long
-                        "%s -- There was probably nothing previously connected to the animation finishing, and probably nothing to worry about.",
-                        e,
-                    )
-                self.color_animation.finished.connect(on_transition_done)
-
-    def transition_color_over_iterable(self, transitions, run_on_completion):
-        def handle_next_transition():
-            try:
-                self.transition_to_color(
-                    next(transitions), handle_next_transition
+            self.color_animation.setCurrentTime(round(self._elapsed_time()))
+
+    def _wait_for_schedule_end(self):
+        """While nothing is played, ends the schedule on time anyway."""
+        if not self._schedule.loops:
+            self._end_timer.start(
+                max(
+                    0,
+                    math.ceil(self._schedule.duration - self._elapsed_time()),
                 )
-            except StopIteration:
-                # We don't want the run_on_completion event to run if the
-                #  window has already been clicked and hidden.
-                # TODO Is there a better way to handle this?
-                if not self.isHidden():
-                    if run_on_completion:
-                        run_on_completion()
+            )
 
-        handle_next_transition()
+    def _on_frame(self):
+        if self._pending_position is not None:
+            self.move(self._pending_position)
+            self._pending_position = None
+
+        is_playing = self._schedule is not None and not self._obscured_by
+        if is_playing:
+            is_playing = self._play_frame()
+        if is_playing and not self._frame_timer.isActive():
+            self._frame_timer.start()
+        elif not is_playing:
+            self._frame_timer.stop()
+
+    def _play_frame(self):
+        """Shows the schedule as of now, and returns whether it goes on."""
+        schedule = self._schedule
+        elapsed = self._elapsed_time()
+        if not schedule.loops and elapsed >= schedule.duration:
+            self._finish_schedule()
+            return False
+        self.level = level_at(schedule.keyframes, elapsed / schedule.duration)
+        return True
+
+    def _on_animation_finished(self):
+        # Stopping the animation (to pause it, or for another schedule) says
+        #  it finished too, so only go on if it really got to the end.
+        schedule = self._schedule
+        if (
+            schedule is not None
+            and not schedule.loops
+            and self.color_animation.currentTime() >= schedule.duration
+        ):
+            self._finish_schedule()
+
+    def _finish_schedule(self):
+        schedule = self._schedule
+        if schedule is None:
+            return
+        self._stop_schedule()
+        self.level = schedule.keyframes[-1][1]
+        # We don't want the run_on_completion event to run if the
+        #  window has already been clicked and hidden.
+        # TODO Is there a better way to handle this?
+        if not self.isHidden() and self._run_on_completion is not None:
+            self._run_on_completion()
+
+    def _stop_schedule(self):
+        self.color_animation.stop()
+        if self._frame_timer is not None:
+            self._frame_timer.stop()
+        self._end_timer.stop()
+        self._schedule = None
+
+    # # # # # # # #   Pausing while the glow box can't be seen
+
+    def set_obscured(self, reason, is_obscured):
+        """
+        Records whether the glow box can't be seen, for `reason` (like
+        "screen locked").  While there's any reason, nothing is animated or
+        painted.  Afterwards, the schedule carries on from where it would
+        have been by then, so it still ends on time.
+        """
+        was_obscured = bool(self._obscured_by)
+        if is_obscured:
+            self._obscured_by.add(reason)
+        else:
+            self._obscured_by.discard(reason)
+        if bool(self._obscured_by) == was_obscured:
+            return
+
+        logger.debug(
+            "Glow box %s",
+            (
+                "obscured by " + ", ".join(sorted(self._obscured_by))
+                if self._obscured_by
+                else "can be seen again"
+            ),
+        )
+        if self._schedule is None:
+            return
+        if self._obscured_by:
+            self.color_animation.stop()
+            if self._frame_timer is not None:
+                self._frame_timer.stop()
+            self._wait_for_schedule_end()
+        else:
+            self._end_timer.stop()
+            self._play_from_now()
+
+    # pylint: disable=invalid-name
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Expose:
+            self.set_obscured("not exposed", not watched.isExposed())
+        return False
 
     # # # # # # # #   Window geometry
 
-    def save_window_geometry(self, filename="geometry.json"):
+    def save_window_geometry(self, name=GEOMETRY_FILE):
+        if self.state_files is None:
+            return
         rect = self.geometry()
         # logger.info(rect)
 
@@ -198,8 +426,9 @@ class GlowBox(QWidget):
         ):
             # logger.info("Saving window geometry")
             # logger.info(geometry)
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(geometry, f, indent=2)
+            # (This is written later, on another thread, and only if it
+            #  changed since the last time.)
+            self.state_files.save(name, geometry)
         else:
             # logger.info("Window not moved")
             pass
@@ -209,11 +438,12 @@ class GlowBox(QWidget):
         self.save_window_geometry()
         self.hide()
 
-    def use_saved_window_geometry(self, filename="geometry.json"):
-        # logger.info("Setting geometry", filename)
+    def use_saved_window_geometry(self, name=GEOMETRY_FILE):
+        # logger.info("Setting geometry", name)
         try:
-            with open(filename, "r", encoding="utf-8") as f:
-                geometry = json.load(f)
+            if self.state_files is None:
+                raise KeyError("nowhere to keep the geometry")
+            geometry = self.state_files.load(name, {})
             # logger.info(geometry)
             self.setGeometry(
                 geometry["location_x"],
@@ -221,12 +451,8 @@ class GlowBox(QWidget):
                 geometry["width"],
                 geometry["height"],
             )
-        except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
-            logger.info("Could not parse file: %s  (%s)", filename, e)
-            try:
-                shutil.copy2(filename, filename + ".backup")
-            except FileNotFoundError as e2:
-                logger.info("Could not make a backup  (%s)", e2)
+        except (KeyError, TypeError) as e:
+            logger.info("Could not use the saved %s  (%s)", name, e)
             zsize = QApplication.screens()[0].size()
             # TODO Magic numbers
             logger.info(zsize)
@@ -238,6 +464,52 @@ class GlowBox(QWidget):
             self.setGeometry(x, y, glowbox_width, glowbox_height)
 
 
+class FrameStats:
+    """
+    Counts the frames the glow box paints, and how many pixels, to see how
+    much it sends over a remote desktop while it's shown.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self.frame_count = 0
+        self.painted_area = 0  # in pixels
+        self._shown_seconds = 0.0
+        self._shown_time = None
+
+    def record(self, rect):
+        self.frame_count += 1
+        self.painted_area += rect.width() * rect.height()
+
+    def shown(self):
+        if self._shown_time is None:
+            self._shown_time = self._clock()
+
+    def hidden(self):
+        if self._shown_time is not None:
+            self._shown_seconds += self._clock() - self._shown_time
+            self._shown_time = None
+
+    def shown_seconds(self) -> float:
+        seconds = self._shown_seconds
+        if self._shown_time is not None:
+            seconds += self._clock() - self._shown_time
+        return seconds
+
+    def summary(self) -> str:
+        seconds = self.shown_seconds()
+        return (
+            "Glow box painted {} frames ({:.1f} per second) and {} pixels "
+            "({:.0f} per second), in {:.0f} seconds shown".format(
+                self.frame_count,
+                self.frame_count / seconds if seconds else 0,
+                self.painted_area,
+                self.painted_area / seconds if seconds else 0,
+                seconds,
+            )
+        )
+
+
 def nearest_even(n):
     if n % 2 == 1:
         return n - 1
@@ -278,6 +550,10 @@ def intervals_decreasing_over_total_time(
     ) - ending_interval
     logger.debug("New starting interval: %s", new_starting_interval)
 
+    # The durations are the differences between the rounded times that the
+    #  intervals end, so that they add up to exactly `total_time`.
+    elapsed_time = 0
+    previous_end = 0
     for i in range(final_number_of_intervals):
         slope = (
             ending_interval - new_starting_interval
@@ -288,9 +564,12 @@ def intervals_decreasing_over_total_time(
         #  the interval is the time at the midpoint of the interval...
         # I dunno how exactly to say what I was saying there.  Imma come
         #  back to it.  TODO.
-        next_duration = new_starting_interval + ((i + 0.5) * slope)
-        next_duration *= 1_000
-        next_duration = int(next_duration)
+        elapsed_time += new_starting_interval + ((i + 0.5) * slope)
+        if i == final_number_of_intervals - 1:
+            elapsed_time = total_time
+        end = round(elapsed_time * 1_000)
+        next_duration = end - previous_end
+        previous_end = end
 
         # logger.info("i: %s", i)
         if i % 2 == 0:
@@ -316,3 +595,177 @@ def steady_pulse(interval, main_color, secondary_color):
         on_main_color = not on_main_color
 
         yield {"new_color": color, "duration": interval}
+
+
+# # # # # # # #   Compiled pulse schedules
+
+
+class PulseSchedule(NamedTuple):
+    """
+    A run of color transitions back and forth between two colors, compiled
+    into keyframes for one animation.
+    """
+
+    duration: int  # in milliseconds
+    # (step from 0 to 1, level) pairs, as QVariantAnimation.setKeyValues()
+    #  takes them, where the level goes from 0 at the main color to 1 at
+    #  the secondary color.
+    keyframes: Tuple[Tuple[float, float], ...]
+    loops: bool
+    # As "#AARRGGBB", to look up the `color_table()`.
+    main_color: str
+    secondary_color: str
+
+
+# Keyframes are interpolated linearly, so each transition's easing curve is
+#  followed with this many keyframes.
+EASING_KEYFRAMES = 8
+
+# The number of colors in each color table.  That's as many as there are
+#  shades between black and white.
+COLOR_TABLE_SIZE = 256
+
+
+def _mix_colors(from_color, to_color, amount):
+    return QColor.fromRgbF(
+        from_color.redF() + (to_color.redF() - from_color.redF()) * amount,
+        from_color.greenF()
+        + (to_color.greenF() - from_color.greenF()) * amount,
+        from_color.blueF() + (to_color.blueF() - from_color.blueF()) * amount,
+        from_color.alphaF()
+        + (to_color.alphaF() - from_color.alphaF()) * amount,
+    )
+
+
+@functools.lru_cache(maxsize=16)
+def color_table(main_color, secondary_color, size=COLOR_TABLE_SIZE):
+    """
+    Returns `size` colors, evenly spaced from `main_color` to
+    `secondary_color`.
+    """
+    main_color = QColor(main_color)
+    secondary_color = QColor(secondary_color)
+    return tuple(
+        _mix_colors(main_color, secondary_color, i / (size - 1))
+        for i in range(size)
+    )
+
+
+def compile_pulse_schedule(main_color, transitions, loops=False):
+    """
+    Compiles `transitions` (like those from `steady_pulse()` or
+    `intervals_decreasing_over_total_time()`), which go back and forth
+    between `main_color` and one other color, starting from `main_color`,
+    into a `PulseSchedule`.  If `loops`, the schedule is played over and
+    over, so it should end on `main_color`.
+    """
+    transitions = [t for t in transitions if t["duration"] > 0]
+    total_duration = sum(t["duration"] for t in transitions)
+    if loops and round(total_duration) <= 0:
+        # It would have to be played over and over in no time at all.
+        raise ValueError(
+            "A looping pulse schedule has to last at least a millisecond, "
+            "not {} ms".format(total_duration)
+        )
+
+    main_color = QColor(main_color).name(QColor.HexArgb)
+    secondary_color = main_color
+    level = 0.0
+    keyframes = [(0.0, level)]
+    start = 0
+    for transition in transitions:
+        new_color = QColor(transition["new_color"]).name(QColor.HexArgb)
+        if new_color == main_color:
+            new_level = 0.0
+        elif secondary_color in (main_color, new_color):
+            secondary_color = new_color
+            new_level = 1.0
+        else:
+            raise ValueError(
+                "A pulse schedule can only go between two colors, not {}, "
+                "{} and {}".format(main_color, secondary_color, new_color)
+            )
+
+        easing_curve = QEasingCurve(
+            transition.get("easing curve", QEasingCurve.InOutSine)
+        )
+        for i in range(1, EASING_KEYFRAMES + 1):
+            progress = i / EASING_KEYFRAMES
+            keyframes.append(
+                (
+                    (start + progress * transition["duration"])
+                    / total_duration,
+                    level
+                    + (new_level - level)
+                    * easing_curve.valueForProgress(progress),
+                )
+            )
+        start += transition["duration"]
+        level = new_level
+    if len(keyframes) > 1:
+        keyframes[-1] = (1.0, level)
+    else:
+        keyframes.append((1.0, level))
+
+    return PulseSchedule(
+        round(total_duration),
+        tuple(keyframes),
+        loops,
+        main_color,
+        secondary_color,
+    )
+
+
+def level_at(keyframes, step):
+    """
+    Returns the level at `step` (from 0 to 1) through a schedule's
+    `keyframes`, as the animation would interpolate it.
+    """
+    index = bisect.bisect_right(keyframes, (step, math.inf))
+    if index == 0:
+        return keyframes[0][1]
+    if index == len(keyframes):
+        return keyframes[-1][1]
+    start_step, start_level = keyframes[index - 1]
+    end_step, end_level = keyframes[index]
+    return start_level + (end_level - start_level) * (step - start_step) / (
+        end_step - start_step
+    )
+
+
+# The same few schedules are shown over and over, so they're only compiled
+#  the first time.
+@functools.lru_cache(maxsize=16)
+def early_notification_schedule(
+    rough_starting_interval,
+    ending_interval,
+    total_time,
+    main_color,
+    secondary_color,
+):
+    """
+    Compiles `intervals_decreasing_over_total_time()`, starting from (and
+    ending on) `main_color`.
+    """
+    return compile_pulse_schedule(
+        main_color,
+        intervals_decreasing_over_total_time(
+            rough_starting_interval,
+            ending_interval,
+            total_time,
+            main_color,
+            secondary_color,
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=16)
+def steady_pulse_schedule(interval, main_color, secondary_color):
+    """Compiles one pulse of `steady_pulse()`, to loop forever."""
+    return compile_pulse_schedule(
+        main_color,
+        itertools.islice(
+            steady_pulse(interval, main_color, secondary_color), 2
+        ),
+        loops=True,
+    )
@@ -0,0 +1,618 @@
+"""Sources of keyboard and mouse activity, used to detect AFK status."""
+
+import ctypes
+import errno
+import glob
+import os
+import select
+import threading
+import time
+import logging
+from typing import Callable, Optional
+
+from metrics import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+
+class InputSource:
+    """
+    Base class for the ways an AFKWorker can find out about user input.
+
+    A source either pushes input as it happens, storing the time of the latest
+    input and waking anybody waiting for it, or it is polled for the time of
+    the latest input whenever that is needed.  All times come from
+    `time.monotonic()`.
+    """
+
+    # Whether this source calls `_on_input` for every input event.  Sources
+    #  that don't are polled (every `poll_interval_after()` seconds) while
+    #  somebody is waiting for input.
+    pushes_input = True
+    poll_interval: Optional[float] = None
+
+    def __init__(self, measures_latency: bool = False):
+        """
+        Args:
+            measures_latency: Whether to time every call of the input
+                callback, and record its duration (in nanoseconds) in
+                `latency_histogram`.
+        """
+        self._last_input_time = time.monotonic()
+        # These are replaced rather than changed in place, so the input
+        #  callback can check for them without a lock.  Replacing them (and
+        #  taking the wake callbacks) is done under `_callback_lock`, since
+        #  the input thread and every subscriber's thread can do it at once.
+        self._wake_callbacks = ()
+        self._input_callbacks = ()
+        self._callback_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._start_count = 0
+
+        self.latency_histogram = None
+        if measures_latency:
+            latency_histogram = Histogram("Input callback latency")
+            untimed_on_input = self._on_input
+
+            def on_input(*args):
+                start = time.perf_counter_ns()
+                untimed_on_input(*args)
+                latency_histogram.record(time.perf_counter_ns() - start)
+
+            self._on_input = on_input
+            self.latency_histogram = latency_histogram
+
+    def start(self):
+        """
+        Starts listening for input, if this is the first of its users to start.
+        """
+        with self._start_lock:
+            self._start_count += 1
+            if self._start_count == 1:
+                self._start()
+
+    def stop(self):
+        """
+        Stops listening for input, if this is the last of its users to stop.
+        """
+        with self._start_lock:
+            self._start_count -= 1
+            if self._start_count == 0:
+                self._stop()
+
+    def _start(self):
+        """Actually starts listening for input."""
+
+    def _stop(self):
+        """Actually stops listening for input."""
+
+    def last_input_time(self) -> float:
+        """Returns the time of the latest input."""
+        return self._last_input_time
+
+    def poll_interval_after(self, idle_time: float) -> float:
+        """
+        Returns how long to wait before polling for input again, once there
+        has been none for `idle_time` seconds.
+        """
+        return self.poll_interval
+
+    def wake_on_input(self, callback: Callable[[], None]) -> bool:
+        """
+        Calls `callback` once, from whichever thread notices it, on the next
+        input.
+
+        Returns False if this source can't do that, in which case it has to
+        be polled instead.
+        """
+        if not self.pushes_input:
+            return False
+        with self._callback_lock:
+            self._wake_callbacks += (callback,)
+        return True
+
+    def add_input_callback(self, callback: Callable[[], None]):
+        """
+        Calls `callback` on every input, from whichever thread notices it.
+        """
+        if not self.pushes_input:
+            raise ValueError(
+                "{} can't call back on every input.".format(
+                    type(self).__name__
+                )
+            )
+        with self._callback_lock:
+            self._input_callbacks += (callback,)
+
+    def remove_callback(self, callback: Callable[[], None]):
+        """Stops calling `callback`, to wake or on every input."""
+        with self._callback_lock:
+            self._wake_callbacks = tuple(
+                c for c in self._wake_callbacks if c != callback
+            )
+            self._input_callbacks = tuple(
+                c for c in self._input_callbacks if c != callback
+            )
+
+    # pylint: disable=unused-argument, method-hidden
+    def _on_input(self, *args):
+        """
+        Runs whenever mouse or keyboard activity is detected.
+
+        This is the hot path:  usually it does nothing but store a timestamp.
+        """
+        self._last_input_time = time.monotonic()
+        if self._wake_callbacks or self._input_callbacks:
+            self._run_callbacks()
+
+    def _run_callbacks(self):
+        if self._wake_callbacks:
+            with self._callback_lock:
+                callbacks, self._wake_callbacks = self._wake_callbacks, ()
+            for callback in callbacks:
+                callback()
+        for callback in self._input_callbacks:
+            callback()
+
+
+class PynputInputSource(InputSource):
+    """Listens to every keyboard and mouse event, using `pynput`."""
+
+    def __init__(self, measures_latency: bool = False):
+        super().__init__(measures_latency)
+
+        # pylint: disable=import-error, import-outside-toplevel
+        import pynput
+
+        self.kb_listener = pynput.keyboard.Listener(on_press=self._on_input)
+        self.mouse_listener = pynput.mouse.Listener(
+            on_move=self._on_input,
+            on_click=self._on_input,
+            on_scroll=self._on_input,
+        )
+
+    def _start(self):
+        self.kb_listener.start()
+        self.mouse_listener.start()
+
+    def _stop(self):
+        self.kb_listener.stop()
+        self.mouse_listener.stop()
+
+
+class X11IdleInputSource(InputSource):
+    """
+    Asks the X server how long the user has been idle, only when it's needed.
+
+    This uses the MIT-SCREEN-SAVER extension, so nothing at all runs on each
+    input event.  It can't wake anybody on input, so while waiting for the
+    user to come back it is polled:  every `poll_interval` seconds at first,
+    backing off to every `max_poll_interval` seconds the longer the user has
+    been away.  (So, the longer they've been away, the longer it can take to
+    notice they're back.)
+    """
+
+    pushes_input = False
+
+    # The idle time is reported in milliseconds, and reading it takes a round
+    #  trip to the X server, so the input time we work out from it jitters a
+    #  little.  Anything smaller than this isn't counted as new input.
+    _JITTER = 0.02  # in seconds
+
+    def __init__(
+        self,
+        measures_latency: bool = False,
+        poll_interval: float = 1,
+        max_poll_interval: float = 30,
+    ):
+        """
+        Args:
+            poll_interval: How often (in seconds) to poll, at first.
+
+            max_poll_interval: How often (in seconds) to poll, at least,
+                however long the user has been away.
+        """
+        super().__init__(measures_latency)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+
+        # pylint: disable=import-error, import-outside-toplevel
+        from Xlib import display
+
+        self._display = display.Display()
+        if not self._display.has_extension("MIT-SCREEN-SAVER"):
+            raise RuntimeError(
+                "The X server doesn't support the MIT-SCREEN-SAVER extension."
+            )
+        self._root = self._display.screen().root
+
+    # Polls stay this fraction of the time the user has been idle apart, so
+    #  that noticing they're back takes at most about that much longer.
+    _BACKOFF = 0.1
+
+    def poll_interval_after(self, idle_time: float) -> float:
+        return min(
+            self.max_poll_interval,
+            max(self.poll_interval, idle_time * self._BACKOFF),
+        )
+
+    def last_input_time(self) -> float:
+        info = self._root.screensaver_query_info()
+        input_time = time.monotonic() - info.idle / 1_000
+        if input_time - self._last_input_time > self._JITTER:
+            self._last_input_time = input_time
+        return self._last_input_time
+
+    def _stop(self):
+        self._display.close()
+
+
+# pylint: disable=too-many-instance-attributes
+class EvdevInputSource(InputSource):
+    """
+    Reads every input device straight from the kernel, from a single thread.
+
+    All the `/dev/input/event*` devices are watched with one epoll object.
+    Whenever any of them are readable, all their pending events are drained
+    as raw bytes (without decoding them), and one timestamp is stored for the
+    whole batch.  Devices are picked up and dropped as they are plugged in and
+    unplugged.
+
+    This doesn't depend on the display server, so it also works on Wayland.
+    The user needs to be able to read the input devices, though, which usually
+    means being in the `input` group.
+    """
+
+    # From <sys/inotify.h>
+    _IN_ATTRIB = 0x00000004
+    _IN_CREATE = 0x00000100
+    _IN_DELETE = 0x00000200
+
+    def __init__(
+        self,
+        measures_latency: bool = False,
+        device_glob: str = "/dev/input/event*",
+        checks_capabilities: bool = True,
+        rescan_interval: float = 60,
+    ):
+        """
+        Args:
+            device_glob: Which device files to read from.  For testing, this
+                can point at a uinput device, or at a directory of FIFOs that
+                stand in for devices.
+
+            checks_capabilities: Whether to skip devices which don't report
+                any keys, buttons or relative movement (e.g. accelerometers and
+                lid switches).  This has to be turned off for FIFOs.
+
+            rescan_interval: How often (in seconds) to look for new devices,
+                if the directory can't be watched with inotify.
+        """
+        super().__init__(measures_latency)
+
+        self._device_glob = device_glob
+        self._checks_capabilities = checks_capabilities
+        self._rescan_interval = rescan_interval
+
+        self._epoll = select.epoll()
+        self._fds_by_path = {}
+        self._paths_by_fd = {}
+        self._stop_read_fd, self._stop_write_fd = os.pipe()
+        self._epoll.register(self._stop_read_fd, select.EPOLLIN)
+        self._inotify_fd = self._watch_device_directory()
+        self._thread = threading.Thread(
+            target=self._run, name="evdev input", daemon=True
+        )
+
+    def _watch_device_directory(self):
+        """
+        Returns an inotify file descriptor watching for devices being added or
+        removed, or None if inotify isn't available.
+        """
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            watch = libc.inotify_add_watch(
+                fd,
+                os.path.dirname(self._device_glob).encode(),
+                self._IN_CREATE | self._IN_ATTRIB | self._IN_DELETE,
+            )
+            if watch < 0:
+                os.close(fd)
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        except (OSError, AttributeError) as e:
+            logger.info(
+                "Can't watch for new input devices (%s).  Rescanning every %s"
+                " seconds instead.",
+                e,
+                self._rescan_interval,
+            )
+            return None
+        self._epoll.register(fd, select.EPOLLIN)
+        return fd
+
+    def _is_input_device(self, path):
+        if not self._checks_capabilities:
+            return True
+        # pylint: disable=import-error, import-outside-toplevel
+        import evdev
+
+        try:
+            device = evdev.InputDevice(path)
+        except OSError as e:
+            logger.debug("Can't open %s: %s", path, e)
+            return False
+        try:
+            capabilities = device.capabilities()
+        finally:
+            device.close()
+        return any(
+            event_type in capabilities
+            for event_type in (evdev.ecodes.EV_KEY, evdev.ecodes.EV_REL)
+        )
+
+    def _scan_devices(self):
+        """Opens any devices that we aren't reading from yet."""
+        for path in glob.glob(self._device_glob):
+            if path in self._fds_by_path or not self._is_input_device(path):
+                continue
+            try:
+                fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK | os.O_CLOEXEC)
+            except OSError as e:
+                logger.debug("Can't open %s: %s", path, e)
+                continue
+            self._fds_by_path[path] = fd
+            self._paths_by_fd[fd] = path
+            self._epoll.register(fd, select.EPOLLIN)
+            logger.debug("Reading input from %s", path)
+
+    def _close_device(self, fd):
+        path = self._paths_by_fd.pop(fd)
+        del self._fds_by_path[path]
+        self._epoll.unregister(fd)
+        os.close(fd)
+        logger.debug("Stopped reading input from %s", path)
+
+    def _drain(self, fd):
+        """
+        Reads everything pending from a device, and returns whether there was
+        anything.
+        """
+        had_input = False
+        while True:
+            try:
+                data = os.read(fd, 4096)
+            except BlockingIOError:
+                return had_input
+            except OSError as e:
+                if e.errno != errno.ENODEV:
+                    logger.warning("Error reading input: %s", e)
+                self._close_device(fd)
+                return had_input
+            if not data:
+                # End of file:  the device is gone.
+                self._close_device(fd)
+                return had_input
+            had_input = True
+
+    def _run(self):
+        self._scan_devices()
+        last_scan_time = time.monotonic()
+        timeout = -1 if self._inotify_fd is not None else self._rescan_interval
+        while True:
+            had_input = False
+            needs_scan = False
+            for fd, _ in self._epoll.poll(timeout):
+                if fd == self._stop_read_fd:
+                    return
+                if fd == self._inotify_fd:
+                    try:
+                        while os.read(fd, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    needs_scan = True
+                elif self._drain(fd):
+                    had_input = True
+            if had_input:
+                self._on_input()
+            if needs_scan or (
+                self._inotify_fd is None
+                and time.monotonic() - last_scan_time >= self._rescan_interval
+            ):
+                self._scan_devices()
+                last_scan_time = time.monotonic()
+
+    def _start(self):
+        self._thread.start()
+
+    def _stop(self):
+        os.write(self._stop_write_fd, b"\0")
+        if self._thread.is_alive():
+            self._thread.join()
+        for fd in list(self._paths_by_fd):
+            self._close_device(fd)
+        for fd in (self._stop_read_fd, self._stop_write_fd, self._inotify_fd):
+            if fd is not None:
+                os.close(fd)
+        self._epoll.close()
+
+
+class ReplayInputSource(InputSource):
+    """
+    Input played back from a recording (see `afk_trace`), on a virtual clock.
+
+    Nothing is listened to.  Whoever drives the replay calls `feed` with each
+    recorded input time, in order.
+    """
+
+    def __init__(self, measures_latency: bool = False, start_time: float = 0):
+        super().__init__(measures_latency)
+        self._last_input_time = start_time
+
+    def feed(self, input_time: float):
+        self._last_input_time = input_time
+        if self._wake_callbacks or self._input_callbacks:
+            self._run_callbacks()
+
+
+INPUT_BACKENDS = {
+    "pynput": PynputInputSource,
+    "x11": X11IdleInputSource,
+    "evdev": EvdevInputSource,
+    "replay": ReplayInputSource,
+}
+
+
+def create_input_source(backend: str, **options) -> InputSource:
+    """Creates the input source for the named backend."""
+    try:
+        source_class = INPUT_BACKENDS[backend]
+    except KeyError as e:
+        raise ValueError(
+            "Unknown input backend: {!r}  (Choose from: {})".format(
+                backend, ", ".join(INPUT_BACKENDS)
+            )
+        ) from e
+    logger.debug("Using the %s input backend", backend)
+    return source_class(**options)
+
+
+class InputHub:
+    """
+    Shares input sources between all the AFKWorkers in a process.
+
+    Every worker subscribing to the same backend (with the same options) gets
+    the same source, so there is only ever one set of OS-level hooks, and one
+    timestamp stored per input event, however many workers there are.  Each
+    worker still keeps its own timeouts, limbo settings and status.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}
+        self._subscriber_counts = {}
+
+    @staticmethod
+    def _key(backend, options):
+        return backend, repr(sorted(options.items()))
+
+    def subscribe(
+        self, backend: str, measures_latency: bool = False, **options
+    ) -> InputSource:
+        """
+        Returns the shared input source for the backend, creating it if this
+        is its first subscriber.
+
+        Latency is only measured if the first subscriber asks for it.
+        """
+        key = self._key(backend, options)
+        with self._lock:
+            source = self._sources.get(key)
+            if source is None:
+                source = create_input_source(
+                    backend, measures_latency=measures_latency, **options
+                )
+                self._sources[key] = source
+                self._subscriber_counts[key] = 0
+            elif measures_latency and source.latency_histogram is None:
+                logger.info(
+                    "The %s input backend is already running without measuring"
+                    " latency.",
+                    backend,
+                )
+            self._subscriber_counts[key] += 1
+        return source
+
+    def unsubscribe(self, source: InputSource):
+        """
+        Gives up a subscription.  Once a source has no subscribers left, the
+        next subscriber gets a new one.
+        """
+        with self._lock:
+            for key, subscribed_source in self._sources.items():
+                if subscribed_source is source:
+                    break
+            else:
+                return
+            self._subscriber_counts[key] -= 1
+            if self._subscriber_counts[key] == 0:
+                del self._sources[key]
+                del self._subscriber_counts[key]
+
+
+# The hub that AFKWorkers use, unless they are given another one.
+default_input_hub = InputHub()
+
+
+if __name__ == "__main__":
+    # Checks the evdev backend without any real hardware, by using FIFOs in a
+    #  temporary directory as stand-ins for input devices.
+    import tempfile
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    def wait_for(condition, timeout=2.0):
+        end = time.monotonic() + timeout
+        while not condition() and time.monotonic() < end:
+            time.sleep(0.01)
+        return condition()
+
+    with tempfile.TemporaryDirectory() as device_directory:
+        first_device = os.path.join(device_directory, "event0")
+        os.mkfifo(first_device)
+
+        source = EvdevInputSource(
+            device_glob=os.path.join(device_directory, "event*"),
+            checks_capabilities=False,
+        )
+        source.start()
+        woken = threading.Event()
+        inputs = []
+        source.wake_on_input(woken.set)
+        source.add_input_callback(lambda: inputs.append(time.monotonic()))
+        start_time = source.last_input_time()
+        time.sleep(0.1)
+        assert not woken.is_set() and not inputs
+
+        # Open the write ends non-blocking, so this fails if the source
+        #  isn't reading the device.
+        writer = os.open(first_device, os.O_WRONLY | os.O_NONBLOCK)
+        os.write(writer, bytes(24 * 100))
+        assert woken.wait(2), "No wake on input from event0"
+        assert wait_for(lambda: source.last_input_time() > start_time)
+        assert inputs, "No input callback for event0"
+
+        # Wake callbacks only run once.
+        woken.clear()
+        input_count = len(inputs)
+        os.write(writer, bytes(24))
+        assert wait_for(lambda: len(inputs) > input_count)
+        assert not woken.is_set()
+
+        hot_plugged_device = os.path.join(device_directory, "event1")
+        os.mkfifo(hot_plugged_device)
+        # The source opens it once inotify (or the rescan) tells it to.
+        assert wait_for(lambda: hot_plugged_device in source._fds_by_path)
+        previous_input_time = source.last_input_time()
+        input_count = len(inputs)
+        source.wake_on_input(woken.set)
+        hot_plugged_writer = os.open(
+            hot_plugged_device, os.O_WRONLY | os.O_NONBLOCK
+        )
+        os.write(hot_plugged_writer, bytes(24))
+        assert woken.wait(2), "No wake on input from hot-plugged event1"
+        assert wait_for(lambda: source.last_input_time() > previous_input_time)
+        assert len(inputs) > input_count
+
+        # Unplugging a device (closing the FIFO's write end) drops it.
+        os.close(hot_plugged_writer)
+        assert wait_for(lambda: hot_plugged_device not in source._fds_by_path)
+
+        os.close(writer)
+        source.stop()
+
+    print("All evdev input checks passed.")
@@ -0,0 +1,137 @@
+"""Puts the app to sleep, as far as it can, while nobody is using it."""
+
+import time
+import logging
+from typing import Callable, Optional
+
+# pylint: disable=import-error
+from PySide6.QtCore import QObject, Signal, Slot
+
+from timer_service import TimerService
+
+
+logger = logging.getLogger(__name__)
+
+
+class LowPowerMode(QObject):
+    """
+    Decides when the app should save power:  while the user is away from the
+    computer, or the screen is locked.
+
+    Anything that does periodic work only for the user to look at connects
+    to `entered` (to stop it) and `exited` (to catch up, straight away).  The
+    deadlines that matter (the break engine's timers, and the AFK worker's)
+    are left running.
+
+    The timer wakeups while in low power mode are counted, to see how close
+    to asleep the app really is.
+    """
+
+    entered = Signal()
+    exited = Signal()
+
+    def __init__(
+        self,
+        timer_service: Optional[TimerService] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            timer_service: The service whose wakeups are counted.
+
+            clock: A monotonic clock, to time how long low power mode lasts.
+        """
+        super().__init__()
+        self._timer_service = timer_service
+        self._clock = clock
+
+        self.is_active = False
+        self._is_away = False
+        self._is_screen_locked = False
+
+        self.entered_count = 0
+        self._seconds = 0.0
+        self._wakeups = 0
+        self._entered_time = None
+        self._entered_wakeups = None
+
+    # ##############  Deciding when to save power
+    @Slot()
+    def mark_away(self, *_):
+        self._is_away = True
+        self._update()
+
+    @Slot()
+    def mark_present(self, *_):
+        self._is_away = False
+        self._update()
+
+    @Slot(bool)
+    def set_screen_locked(self, is_locked: bool):
+        self._is_screen_locked = is_locked
+        self._update()
+
+    def _update(self):
+        should_be_active = self._is_away or self._is_screen_locked
+        if should_be_active == self.is_active:
+            return
+        self.is_active = should_be_active
+        if should_be_active:
+            self._enter()
+        else:
+            self._exit()
+
+    def _wakeup_count(self):
+        if self._timer_service is None:
+            return 0
+        return self._timer_service.wakeup_count
+
+    def _enter(self):
+        logger.debug("Entering low power mode")
+        self.entered_count += 1
+        self.entered.emit()
+        # Whatever was done on the way in doesn't count.
+        self._entered_time = self._clock()
+        self._entered_wakeups = self._wakeup_count()
+
+    def _exit(self):
+        seconds = self._clock() - self._entered_time
+        wakeups = self._wakeup_count() - self._entered_wakeups
+        self._seconds += seconds
+        self._wakeups += wakeups
+        logger.debug(
+            "Leaving low power mode after %0.0f seconds, with %d timer "
+            "wakeups (%0.1f per hour)",
+            seconds,
+            wakeups,
+            wakeups / seconds * 3_600 if seconds else 0,
+        )
+        self.exited.emit()
+
+    # ##############  Metrics
+    def totals(self):
+        """
+        Returns the total seconds spent in low power mode, and the timer
+        wakeups in that time (including any low power mode still going on).
+        """
+        seconds, wakeups = self._seconds, self._wakeups
+        if self.is_active:
+            seconds += self._clock() - self._entered_time
+            wakeups += self._wakeup_count() - self._entered_wakeups
+        return seconds, wakeups
+
+    def wakeups_per_hour(self) -> float:
+        seconds, wakeups = self.totals()
+        return wakeups / seconds * 3_600 if seconds else 0
+
+    def summary(self) -> str:
+        seconds, wakeups = self.totals()
+        return (
+            "{} times in low power mode, for {:.0f} minutes, with {} timer "
+            "wakeups ({:.1f} per hour)".format(
+                self.entered_count,
+                seconds / 60,
+                wakeups,
+                self.wakeups_per_hour(),
+            )
+        )
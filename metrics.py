@@ -0,0 +1,87 @@
+"""Lightweight metrics for measuring the cost of hot code paths."""
+
+
+class Histogram:
+    """
+    A fixed-bucket histogram of non-negative integer samples (e.g.
+    nanoseconds).
+
+    Buckets are spaced logarithmically, with four buckets per power of two,
+    so the reported percentiles are accurate to within about 25%.  Recording
+    a sample is a few integer operations on a preallocated list, which makes
+    it cheap enough to use inside input hooks and event handlers.
+
+    Recording is not synchronized.  If several threads record into the same
+    histogram, a sample may very occasionally be lost, which is fine for the
+    statistics this is meant for.
+    """
+
+    _NUM_BUCKETS = 256
+
+    def __init__(self, name: str = "", unit: str = "ns"):
+        self.name = name
+        self.unit = unit
+        self._counts = [0] * self._NUM_BUCKETS
+        self.count = 0
+        self.max = 0
+
+    @staticmethod
+    def _bucket_index(value: int) -> int:
+        bit_length = value.bit_length()
+        if bit_length <= 3:
+            return value
+        return (bit_length - 3) * 4 + (value >> (bit_length - 3))
+
+    @staticmethod
+    def _bucket_upper_bound(index: int) -> int:
+        if index < 8:
+            return index
+        bit_length = index // 4 + 2
+        mantissa = index % 4 + 4
+        return ((mantissa + 1) << (bit_length - 3)) - 1
+
+    def record(self, value: int):
+        """Adds a sample to the histogram."""
+        self._counts[self._bucket_index(value)] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> int:
+        """
+        Returns the upper bound of the bucket holding the given percentile,
+        or 0 if nothing has been recorded yet.
+        """
+        if self.count == 0:
+            return 0
+        threshold = self.count * percent / 100
+        running_total = 0
+        for index, bucket_count in enumerate(self._counts):
+            running_total += bucket_count
+            if running_total >= threshold and bucket_count:
+                return min(self._bucket_upper_bound(index), self.max)
+        return self.max
+
+    @property
+    def p50(self) -> int:
+        return self.percentile(50)
+
+    @property
+    def p99(self) -> int:
+        return self.percentile(99)
+
+    def reset(self):
+        self._counts = [0] * self._NUM_BUCKETS
+        self.count = 0
+        self.max = 0
+
+    def summary(self) -> str:
+        """Returns a one-line, human readable summary of the histogram."""
+        return "{}: n={}, p50={}{unit}, p99={}{unit}, max={}{unit}".format(
+            self.name or "histogram",
+            self.count,
+            self.p50,
+            self.p99,
+            self.max,
+            unit=self.unit,
+        )
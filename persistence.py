@@ -0,0 +1,318 @@
+"""Keeps the app's state on disk, without the GUI thread waiting for it."""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import logging
+from typing import Any, Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+SNAPSHOT_VERSION = 1
+
+
+def write_atomically(filename: str, data: bytes):
+    """
+    Replaces the contents of `filename` with `data`, so that anyone reading
+    the file sees either the old contents or the new, never part of each.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temporary_filename = tempfile.mkstemp(
+        dir=directory, prefix="." + os.path.basename(filename) + "."
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_filename, filename)
+    except BaseException:
+        os.unlink(temporary_filename)
+        raise
+
+
+def default_state_directory() -> str:
+    """Returns where to keep the app's state, by default."""
+    state_home = os.environ.get("XDG_STATE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".local", "state"
+    )
+    return os.path.join(state_home, "gentle")
+
+
+class PersistenceService:
+    """
+    Owns the app's state files (small JSON files, kept in one directory),
+    so that the GUI thread never waits for the disk.
+
+    Each file is read once, when it's loaded (at startup), and kept in
+    memory from then on.  It has to be loaded before it's saved, so that
+    saving never reads the disk.  Saving only changes what's in memory,
+    and marks the file as dirty (unless nothing changed), and a background
+    thread writes it `delay` seconds later, with whatever it holds by then.
+    So a burst of saves costs one write, and saving the same thing again
+    costs none.
+
+    Files are written atomically, so a crash (or a full disk) leaves either
+    the old contents or the new.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        delay: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            directory: Where the files are kept.  (It's made absolute
+                straight away, so changing the working directory later
+                doesn't move them.)
+
+            delay: How long (in seconds) after a file is first changed to
+                write it, by default.
+
+            clock: The monotonic clock the delays are measured with.
+        """
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.delay = delay
+        self._clock = clock
+
+        # The JSON (as bytes) each file holds, or will once it's written, or
+        #  None if there's no such file.
+        self._contents = {}
+        # The files waiting to be written, and when to write them by.
+        self._dirty = {}
+        self._writing_count = 0
+        self._is_closing = False
+        self._condition = threading.Condition()
+
+        self.save_count = 0
+        self.unchanged_count = 0
+        self.write_count = 0
+
+        self._thread = threading.Thread(
+            target=self._run, name="PersistenceService", daemon=True
+        )
+        self._thread.start()
+
+    def path(self, name: str) -> str:
+        """Returns where the file called `name` is kept."""
+        return os.path.join(self.directory, name)
+
+    # ##############  Loading and saving
+    def load(self, name: str, default: Any = None) -> Any:
+        """
+        Returns what was last saved as `name` (or `default`, if nothing
+        usable was).  It's a new copy each time, so it can be changed.
+        """
+        with self._condition:
+            if name not in self._contents:
+                self._contents[name] = self._read(name)
+            data = self._contents[name]
+        return default if data is None else json.loads(data)
+
+    def _read(self, name):
+        filename = self.path(name)
+        try:
+            with open(filename, "rb") as f:
+                data = f.read()
+            json.loads(data)
+            return data
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Couldn't read %s:  %s", filename, e)
+            # It will be written over, so keep what was there.
+            try:
+                shutil.copy2(filename, filename + ".backup")
+            except OSError as e2:
+                logger.info("Could not make a backup  (%s)", e2)
+            return None
+
+    def save(self, name: str, value: Any, delay: Optional[float] = None):
+        """
+        Saves `value` (anything which can be turned into JSON) as `name`,
+        to be written `delay` seconds from now (or `self.delay`) at the
+        latest.  It is turned into JSON straight away, so it can be changed
+        as soon as this returns.
+
+        Returns whether it was any different from what was saved before.
+        """
+        data = json.dumps(value, indent=2).encode("utf-8")
+        deadline = self._clock() + (self.delay if delay is None else delay)
+        with self._condition:
+            if name not in self._contents:
+                raise ValueError(
+                    "{} has to be loaded before it's saved.".format(name)
+                )
+            if data == self._contents[name]:
+                self.unchanged_count += 1
+                return False
+            self.save_count += 1
+            self._contents[name] = data
+            if name not in self._dirty or deadline < self._dirty[name]:
+                self._dirty[name] = deadline
+                self._condition.notify_all()
+        return True
+
+    def flush(self):
+        """Writes every dirty file now, and waits until they're written."""
+        with self._condition:
+            for name in self._dirty:
+                self._dirty[name] = float("-inf")
+            self._condition.notify_all()
+            while self._dirty or self._writing_count:
+                self._condition.wait()
+
+    def close(self):
+        """Writes every dirty file now, and stops."""
+        with self._condition:
+            self._is_closing = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    # ##############  Writing, on the background thread
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = self._clock()
+                    due = [
+                        name
+                        for name, deadline in self._dirty.items()
+                        if deadline <= now or self._is_closing
+                    ]
+                    if due:
+                        break
+                    if self._is_closing:
+                        return
+                    timeout = None
+                    if self._dirty:
+                        timeout = min(self._dirty.values()) - now
+                    self._condition.wait(timeout)
+                writes = [(name, self._contents[name]) for name in due]
+                for name in due:
+                    del self._dirty[name]
+                self._writing_count += 1
+
+            for name, data in writes:
+                try:
+                    write_atomically(self.path(name), data)
+                    self.write_count += 1
+                except OSError as e:
+                    logger.warning(
+                        "Couldn't write %s:  %s", self.path(name), e
+                    )
+
+            with self._condition:
+                self._writing_count -= 1
+                self._condition.notify_all()
+
+    # ##############  Metrics
+    def summary(self) -> str:
+        return "{} state saves ({} unchanged) in {} writes".format(
+            self.save_count + self.unchanged_count,
+            self.unchanged_count,
+            self.write_count,
+        )
+
+
+# ##############  Snapshots of the break cycle
+def load_snapshot(
+    state_files: PersistenceService, name: str
+) -> Optional[dict]:
+    """
+    Returns the snapshot saved as `name`, or None if there isn't a usable
+    one.
+    """
+    snapshot = state_files.load(name)
+    if snapshot is None:
+        return None
+    if (
+        not isinstance(snapshot, dict)
+        or snapshot.get("version") != SNAPSHOT_VERSION
+    ):
+        logger.info("Ignoring an old or unknown snapshot in %s", name)
+        return None
+    return snapshot
+
+
+def save_snapshot(state_files: PersistenceService, name: str, snapshot: dict):
+    """
+    Saves `snapshot` as `name` (which has to have been loaded, with
+    `load_snapshot`).  The time in a snapshot goes stale, so it's
+    written straight away.
+    """
+    state_files.save(name, dict(snapshot, version=SNAPSHOT_VERSION), delay=0)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        state_files = PersistenceService(directory, delay=0.2)
+        assert load_snapshot(state_files, "snapshot.json") is None
+        assert state_files.load("geometry.json", {}) == {}
+
+        # A burst of saves is written once, after the delay.
+        start = time.perf_counter()
+        for i in range(1_000):
+            state_files.save("geometry.json", {"width": i})
+        print(
+            "Saved 1000 times in {:.0f} microseconds each.".format(
+                (time.perf_counter() - start) * 1_000
+            )
+        )
+        assert not os.path.exists(state_files.path("geometry.json"))
+        time.sleep(0.5)
+        assert state_files.write_count == 1
+        assert not state_files.save("geometry.json", {"width": 999})
+
+        # Snapshots are written straight away, and only the last one
+        #  matters.
+        for i in range(1_000):
+            save_snapshot(state_files, "snapshot.json", {"count": i})
+        state_files.flush()
+        assert 2 <= state_files.write_count <= 1_001
+        state_files.save("geometry.json", {"width": 1_000}, delay=60)
+        state_files.close()
+        print(state_files.summary())
+        assert sorted(os.listdir(directory)) == [
+            "geometry.json",
+            "snapshot.json",
+        ]
+
+        state_files = PersistenceService(directory)
+        assert state_files.load("geometry.json") == {"width": 1_000}
+        assert load_snapshot(state_files, "snapshot.json")["count"] == 999
+
+        with open(state_files.path("bad.json"), "w", encoding="utf-8") as f:
+            f.write('{"version": 1, "state": "Wait')
+        assert load_snapshot(state_files, "bad.json") is None
+        assert os.path.exists(state_files.path("bad.json.backup"))
+        with open(state_files.path("old.json"), "w", encoding="utf-8") as f:
+            f.write('{"version": 0}')
+        assert load_snapshot(state_files, "old.json") is None
+
+        # Saving never reads the disk, so what's saved has to be loaded.
+        try:
+            state_files.save("unloaded.json", {})
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Saved a file that wasn't loaded")
+        state_files.close()
+
+        # The state directory is made, if it isn't there.
+        nested = os.path.join(directory, "state", "gentle")
+        PersistenceService(nested).close()
+        assert os.path.isdir(nested)
+
+    os.environ["XDG_STATE_HOME"] = "/xdg/state"
+    assert default_state_directory() == "/xdg/state/gentle"
+
+    print("All persistence checks passed.")
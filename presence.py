@@ -0,0 +1,274 @@
+"""Keeps track of how much of the time the user has been at the computer."""
+
+import mmap
+import os
+import struct
+import threading
+import time
+import logging
+from typing import Callable
+
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+    """
+    Records, for each minute of the last week, whether the user was at the
+    computer at any point during that minute.
+
+    The minutes are kept as a ring of bits, packed into 64 bit words, in a
+    memory mapped file, so they survive restarts without having to be parsed
+    (and are only a little over a kilobyte on disk).  Nothing is stored about
+    individual input events, only the AFK worker's transitions:  feed
+    `mark_present()` from `at_computer_signal`, and `mark_away()` from
+    `afk_signal`.
+
+    Updating a transition is constant time (apart from catching up on
+    however many minutes have passed since the last update, a word at a
+    time), and counting the minutes present in a window is proportional to
+    the window's length divided by 64.
+
+    All of the methods can safely be called from different threads.
+    """
+
+    MINUTES = 7 * 24 * 60
+    _WORDS = (MINUTES + 63) // 64
+    _ALL_BITS = (1 << 64) - 1
+
+    _MAGIC = b"GPRS"
+    _VERSION = 1
+    # Magic, version, the first minute ever tracked, and the last minute that
+    #  is up to date in the ring.  Minutes are counted from the Unix epoch.
+    _HEADER = struct.Struct("<4sIqq")
+
+    def __init__(self, filename: str, clock: Callable[[], float] = time.time):
+        """
+        Args:
+            filename: Where to keep the minutes.  It is created if it doesn't
+                exist (or isn't a presence file).
+            clock: Returns the current (wall clock) time, in seconds.
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._present_since = None
+
+        size = self._HEADER.size + self._WORDS * 8
+        self._file = open(  # pylint: disable=consider-using-with
+            filename, "a+b"
+        )
+        self._file.seek(0)
+        header = self._file.read(self._HEADER.size)
+        is_valid = (
+            os.fstat(self._file.fileno()).st_size == size
+            and header[:4] == self._MAGIC
+            and self._HEADER.unpack(header)[1] == self._VERSION
+        )
+        if not is_valid:
+            logger.info("Starting a new presence file at %s", filename)
+            self._file.truncate(0)
+            self._file.write(bytes(size))
+            self._file.flush()
+
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        words_offset = self._HEADER.size
+        self._words = memoryview(self._mmap)[words_offset:].cast("Q")
+
+        if is_valid:
+            _, _, self._first_minute, self._marked_minute = (
+                self._HEADER.unpack_from(self._mmap)
+            )
+        else:
+            self._first_minute = self._marked_minute = self._minute(
+                self._clock()
+            )
+            self._write_header()
+
+    @staticmethod
+    def _minute(unix_time):
+        return int(unix_time // 60)
+
+    def _write_header(self):
+        self._HEADER.pack_into(
+            self._mmap,
+            0,
+            self._MAGIC,
+            self._VERSION,
+            self._first_minute,
+            self._marked_minute,
+        )
+
+    # ##############  Bit twiddling
+    def _ring_ranges(self, first_minute, last_minute):
+        """
+        Splits a range of minutes (inclusive) into at most two ranges of
+        indexes into the ring, which don't wrap around.
+        """
+        if last_minute - first_minute + 1 >= self.MINUTES:
+            return [(0, self.MINUTES - 1)]
+        first = first_minute % self.MINUTES
+        last = last_minute % self.MINUTES
+        if first <= last:
+            return [(first, last)]
+        return [(first, self.MINUTES - 1), (0, last)]
+
+    def _set_minutes(self, first_minute, last_minute, is_present):
+        if first_minute > last_minute:
+            return
+        words = self._words
+        for first, last in self._ring_ranges(first_minute, last_minute):
+            for word in range(first // 64, last // 64 + 1):
+                low = max(first - word * 64, 0)
+                high = min(last - word * 64, 63)
+                mask = (self._ALL_BITS >> (63 - high + low)) << low
+                if is_present:
+                    words[word] |= mask
+                else:
+                    words[word] &= ~mask & self._ALL_BITS
+
+    def _count_minutes(self, first_minute, last_minute):
+        if first_minute > last_minute:
+            return 0
+        words = self._words
+        count = 0
+        for first, last in self._ring_ranges(first_minute, last_minute):
+            for word in range(first // 64, last // 64 + 1):
+                low = max(first - word * 64, 0)
+                high = min(last - word * 64, 63)
+                mask = (self._ALL_BITS >> (63 - high + low)) << low
+                count += (words[word] & mask).bit_count()
+        return count
+
+    # ##############  Updates
+    def _catch_up(self, now):
+        """Brings the ring up to date, through the current minute."""
+        minute = self._minute(now)
+        if minute <= self._marked_minute:
+            return
+        # Anything older than a week in these minutes is being overwritten.
+        first = max(self._marked_minute + 1, minute - self.MINUTES + 1)
+        if self._present_since is None:
+            self._set_minutes(first, minute, False)
+        else:
+            present_from = max(first, self._minute(self._present_since))
+            self._set_minutes(first, present_from - 1, False)
+            self._set_minutes(present_from, minute, True)
+        self._marked_minute = minute
+        self._write_header()
+
+    def mark_present(self, since: float):
+        """The user has been at the computer since `since` (a Unix time)."""
+        with self._lock:
+            self._catch_up(self._clock())
+            self._present_since = since
+            self._set_minutes(
+                max(
+                    self._minute(since),
+                    self._marked_minute - self.MINUTES + 1,
+                ),
+                self._marked_minute,
+                True,
+            )
+
+    def mark_away(self, since: float):
+        """The user has been away from the computer since `since`."""
+        with self._lock:
+            self._catch_up(self._clock())
+            self._present_since = None
+            # The minutes since the last input were counted as present, until
+            #  the AFK worker noticed that they weren't.
+            self._set_minutes(
+                max(
+                    self._minute(since) + 1,
+                    self._marked_minute - self.MINUTES + 1,
+                ),
+                self._marked_minute,
+                False,
+            )
+
+    # ##############  Queries
+    def minutes_present(self, window: float) -> int:
+        """
+        Returns how many minutes in the last `window` seconds (counting the
+        current minute) the user was at the computer.
+        """
+        with self._lock:
+            self._catch_up(self._clock())
+            first = self._marked_minute - self._window_minutes(window) + 1
+            return self._count_minutes(first, self._marked_minute)
+
+    def fraction_present(self, window: float) -> float:
+        """
+        Returns the fraction (from 0 to 1) of the minutes in the last
+        `window` seconds that the user was at the computer.  Only minutes
+        since tracking started are taken into account.
+        """
+        with self._lock:
+            self._catch_up(self._clock())
+            minutes = max(
+                1,
+                min(
+                    self._window_minutes(window),
+                    self._marked_minute - self._first_minute + 1,
+                ),
+            )
+            first = self._marked_minute - minutes + 1
+            return self._count_minutes(first, self._marked_minute) / minutes
+
+    def _window_minutes(self, window):
+        return max(1, min(self.MINUTES, -int(-window // 60)))
+
+    def close(self):
+        """Writes out the current time at the computer, and closes the file."""
+        with self._lock:
+            if self._mmap.closed:
+                return
+            self._catch_up(self._clock())
+            self._words.release()
+            self._mmap.flush()
+            self._mmap.close()
+            self._file.close()
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    class FakeClock:
+        def __init__(self):
+            self.time = 1_700_000_000.0
+
+        def __call__(self):
+            return self.time
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "presence.bin")
+        clock = FakeClock()
+        start = clock.time
+
+        tracker = PresenceTracker(filename, clock)
+        tracker.mark_present(start)
+        clock.time += 3_600
+        # Input stopped at 50 minutes in; the AFK worker noticed at 60.
+        tracker.mark_away(start + 3_000)
+        clock.time += 3_600
+        assert tracker.minutes_present(7_200) in (50, 51)
+        assert abs(tracker.fraction_present(7_200) - 50 / 120) < 0.02
+        # Tracking only started two hours ago.
+        assert abs(tracker.fraction_present(24 * 3_600) - 50 / 120) < 0.02
+        tracker.close()
+
+        # Survives a restart.
+        tracker = PresenceTracker(filename, clock)
+        assert tracker.minutes_present(7_200) in (50, 51)
+
+        # A whole week at the computer, then the ring wraps around.
+        tracker.mark_present(clock.time)
+        clock.time += 8 * 24 * 3_600
+        assert tracker.minutes_present(10**9) == PresenceTracker.MINUTES
+        tracker.mark_away(clock.time)
+        clock.time += 24 * 3_600
+        assert tracker.fraction_present(7 * 24 * 3_600) < 6 / 7 + 0.01
+        assert tracker.minutes_present(23 * 3_600) == 0
+        tracker.close()
+
+    print("All presence checks passed.")
@@ -0,0 +1,227 @@
+"""Notices when the screen is locked or blanked, or the screens turned off."""
+
+import logging
+from typing import Optional
+
+# pylint: disable=import-error
+from PySide6.QtCore import (
+    QObject,
+    QSocketNotifier,
+    QTimer,
+    Signal,
+    Slot,
+    SLOT,
+)
+
+from timer_service import TimerService
+
+
+logger = logging.getLogger(__name__)
+
+
+# The screensavers which tell the session bus when they come on and go off,
+#  as (service, object path).  The interface has the same name as the
+#  service.
+SCREENSAVERS = (
+    ("org.freedesktop.ScreenSaver", "/org/freedesktop/ScreenSaver"),
+    ("org.gnome.ScreenSaver", "/org/gnome/ScreenSaver"),
+)
+
+
+class ScreenLockWatcher(QObject):
+    """
+    Listens on the D-Bus session bus for the screensaver (which is also what
+    locks the screen, on most desktops) coming on and going off.
+
+    Where there is no session bus, or no screensaver on it, this never
+    signals anything.
+    """
+
+    # Whether the screen is now locked.
+    locked_changed = Signal(bool)
+
+    def __init__(self):
+        super().__init__()
+        self.is_locked = False
+
+    def start(self) -> bool:
+        """
+        Starts listening.  Returns whether there was a session bus to listen
+        on.
+        """
+        try:
+            # pylint: disable=import-outside-toplevel
+            from PySide6.QtDBus import QDBusConnection
+        except ImportError:
+            logger.info("No QtDBus, so the screen lock can't be watched")
+            return False
+
+        bus = QDBusConnection.sessionBus()
+        if not bus.isConnected():
+            logger.info("No session bus, so the screen lock can't be watched")
+            return False
+
+        for service, path in SCREENSAVERS:
+            bus.connect(
+                service,
+                path,
+                service,
+                "ActiveChanged",
+                self,
+                SLOT("_on_active_changed(bool)"),
+            )
+        return True
+
+    @Slot(bool)
+    def _on_active_changed(self, is_active):
+        # With more than one screensaver interface, each change can come
+        #  more than once.
+        if is_active != self.is_locked:
+            self.is_locked = is_active
+            logger.info(
+                "The screen was %s", "locked" if is_active else "unlocked"
+            )
+            self.locked_changed.emit(is_active)
+
+
+class X11ScreenWatcher(QObject):
+    """
+    Asks the X server whether its screensaver is on (which is how most X
+    screen lockers blank the screen), and whether the screens have been
+    powered down (by DPMS).
+
+    The X server tells us when the screensaver comes on or goes off, but the
+    screens' power has to be asked for, so that's only polled (every
+    `poll_interval` seconds) while `set_polling(True)`, and not while
+    `pause()`d.
+
+    Without python-xlib, or an X server, this never signals anything.
+    """
+
+    # Whether the screensaver is now on.
+    screensaver_changed = Signal(bool)
+    # Whether the screens are now off (or in standby, or suspended).
+    screens_off_changed = Signal(bool)
+
+    def __init__(
+        self,
+        poll_interval: float = 10,
+        timer_service: Optional[TimerService] = None,
+    ):
+        """
+        Args:
+            poll_interval: How often to ask whether the screens are off, in
+                seconds.
+
+            timer_service: The TimerService to poll on.  (Without one, it's
+                a QTimer.)
+        """
+        super().__init__()
+        self.is_screensaver_on = False
+        self.are_screens_off = False
+        self._display = None
+        self._has_dpms = False
+        self._notifier = None
+        self._is_polling = False
+        self._is_paused = False
+        self._poll_msecs = round(poll_interval * 1_000)
+        if timer_service is not None:
+            self._poll_timer = timer_service.create_timer(
+                self.poll_screen_power, slack=1
+            )
+        else:
+            self._poll_timer = QTimer(self)
+            self._poll_timer.timeout.connect(self.poll_screen_power)
+
+    def start(self) -> bool:
+        """
+        Starts listening.  Returns whether there was an X server to listen
+        to.
+        """
+        try:
+            # pylint: disable=import-error, import-outside-toplevel
+            from Xlib import display
+            from Xlib.ext import screensaver
+        except ImportError:
+            logger.info("No python-xlib, so the X screensaver isn't watched")
+            return False
+
+        try:
+            self._display = display.Display()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.info("Couldn't connect to the X server:  %s", e)
+            return False
+
+        if self._display.has_extension("MIT-SCREEN-SAVER"):
+            self._display.screen().root.screensaver_select_input(
+                screensaver.NotifyMask
+            )
+            self._display.flush()
+            self._notifier = QSocketNotifier(
+                self._display.fileno(), QSocketNotifier.Read, self
+            )
+            self._notifier.activated.connect(self._read_events)
+        self._has_dpms = self._display.has_extension("DPMS")
+        return True
+
+    def stop(self):
+        self._poll_timer.stop()
+        if self._notifier is not None:
+            self._notifier.setEnabled(False)
+        if self._display is not None:
+            self._display.close()
+            self._display = None
+
+    @Slot()
+    def _read_events(self):
+        # pylint: disable=import-error, import-outside-toplevel
+        from Xlib.ext import screensaver
+
+        while self._display.pending_events():
+            event = self._display.next_event()
+            if isinstance(event, screensaver.Notify):
+                is_on = event.state != screensaver.StateOff
+                if is_on != self.is_screensaver_on:
+                    self.is_screensaver_on = is_on
+                    logger.info(
+                        "The X screensaver went %s", "on" if is_on else "off"
+                    )
+                    self.screensaver_changed.emit(is_on)
+
+    def set_polling(self, is_polling: bool):
+        """Starts or stops asking whether the screens are off."""
+        self._is_polling = is_polling
+        self._update_polling()
+
+    def pause(self):
+        """Stops polling (if it was), until `resume()`."""
+        self._is_paused = True
+        self._update_polling()
+
+    def resume(self):
+        self._is_paused = False
+        self._update_polling()
+
+    def _update_polling(self):
+        should_poll = (
+            self._has_dpms and self._is_polling and not self._is_paused
+        )
+        if should_poll and not self._poll_timer.isActive():
+            self.poll_screen_power()
+            self._poll_timer.start(self._poll_msecs)
+        elif not should_poll:
+            self._poll_timer.stop()
+
+    @Slot()
+    def poll_screen_power(self):
+        # pylint: disable=import-error, import-outside-toplevel
+        from Xlib.ext import dpms
+
+        info = self._display.dpms_info()
+        are_off = bool(info.state) and info.power_level != dpms.DPMSModeOn
+        if are_off != self.are_screens_off:
+            self.are_screens_off = are_off
+            logger.info(
+                "The screens were turned %s", "off" if are_off else "on"
+            )
+            self.screens_off_changed.emit(are_off)
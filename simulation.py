@@ -0,0 +1,452 @@
+"""
+Simulates workdays with the break engine, to see how breaks get scheduled.
+
+Nothing here needs Qt:  the break engine runs on a virtual clock, against a
+made up user who takes breaks (sometimes late), skips them, and wanders off
+from the computer now and then.  Thousands of days take a few seconds.
+
+Usage:
+    python simulation.py --days 2000 --seed 1
+    python simulation.py --config config.toml
+    python simulation.py --check
+"""
+
+import argparse
+import collections
+import heapq
+import itertools
+import random
+import time
+import logging
+
+import tomlkit
+
+import break_engine as be
+from metrics import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CONFIG = {
+    "general": {
+        "time_format": "%-I:%M:%S %p",
+        "suspend_policy": "count_as_afk",
+    },
+    "long_break": {
+        "spacing": 50 * 60,
+        "length": 10 * 60,
+        "early_notification": 2 * 60,
+    },
+    "short_break": {
+        "max_spacing": 20 * 60,
+        "length": 20,
+        "early_notification": 30,
+    },
+    "away_from_keyboard": {
+        "short_break_timeout": 120,
+        "long_break_timeout": 600,
+    },
+}
+
+# Settings which are easy to get wrong, each checked with `--check`.
+EDGE_CASE_CONFIGS = {
+    "long break no further apart than the short breaks": {
+        "long_break": {"spacing": 15 * 60},
+        "short_break": {"max_spacing": 20 * 60},
+    },
+    "long break exactly as far apart as the short breaks": {
+        "long_break": {"spacing": 20 * 60},
+        "short_break": {"max_spacing": 20 * 60},
+    },
+}
+
+# How long (in seconds) without input before the AFK worker notices.
+INPUT_TIMEOUT = 30
+
+
+class Simulation:
+    """A queue of actions to run at given times, on a virtual clock."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.action_count = 0
+        self._queue = []
+        self._sequence = itertools.count()
+
+    def schedule(self, delay, action):
+        """
+        Runs `action` after `delay` seconds.  Returns an entry which can be
+        cancelled.
+        """
+        entry = [self.now + max(delay, 0), next(self._sequence), action]
+        heapq.heappush(self._queue, entry)
+        return entry
+
+    @staticmethod
+    def cancel(entry):
+        if entry is not None:
+            entry[2] = None
+
+    def run_until(self, end_time):
+        while self._queue and self._queue[0][0] <= end_time:
+            self.now, _, action = heapq.heappop(self._queue)
+            if action is not None:
+                self.action_count += 1
+                action()
+        self.now = end_time
+
+
+class SimulatedWorkday(be.BreakUI):
+    """
+    A break engine and a made up user, for one day.
+
+    The user reacts to each notification by taking the break during the
+    early notification, taking it late, or skipping it.  Every so often (and
+    during long breaks) they leave the computer, and the AFK events the
+    AFKWorker would send are sent.
+    """
+
+    # Chances of each reaction to a notification.
+    SKIP_CHANCE = 0.1
+    ON_TIME_CHANCE = 0.6
+    # How long it takes to click, once the notification is late.
+    MEAN_LATE_CLICK = 120
+    # How long the user stays at the computer before wandering off.
+    MEAN_TIME_AT_COMPUTER = 40 * 60
+    # Chance of cutting a long break short.
+    LONG_BREAK_SKIP_CHANCE = 0.1
+
+    _REST_STATE_NAMES = {
+        "Short break in progress",
+        "Long break in progress",
+        "Long break finished",
+        "Waiting after a short AFK timeout",
+        "Waiting after a long AFK timeout",
+    }
+
+    def __init__(self, config, rng, day_length=8 * 3_600):
+        self.config = config
+        self.rng = rng
+        self.day_length = day_length
+        self.simulation = Simulation()
+        self.engine = be.BreakEngine(
+            config,
+            self,
+            clock=lambda: self.simulation.now,
+            wall_clock=lambda: self.simulation.now,
+        )
+
+        self.is_away = False
+        self._timers = {}
+        self._pending_reaction = None
+        self._pending_wander = None
+        self._work_started = 0.0
+        self._is_resting = False
+
+        self.counts = collections.Counter()
+        self.lateness = []
+        self.longest_stretch = 0.0
+        self.ignored = collections.Counter()
+
+    def run(self):
+        self.engine.start()
+        self._schedule_wander()
+        self.simulation.run_until(self.day_length)
+        self._end_stretch()
+        return self
+
+    # ##############  Feeding the engine
+    def _deliver(self, event):
+        if self.engine.is_ignored(event):
+            self.ignored[(self.engine.state.name, event.name)] += 1
+        self.engine.process_event(event)
+
+    def _click(self, event):
+        if not self.is_away:
+            self._pending_reaction = None
+            self._deliver(event)
+
+    # ##############  The break engine's UI
+    def start_timer(self, event, delay):
+        self.simulation.cancel(self._timers.get(event))
+        self._timers[event] = self.simulation.schedule(
+            delay, lambda: self._deliver(event)
+        )
+
+    def stop_timer(self, event):
+        self.simulation.cancel(self._timers.pop(event, None))
+
+    def show_early_notification(self, is_long_break):
+        section = "long_break" if is_long_break else "short_break"
+        early_notification = self.config[section]["early_notification"]
+        self.start_timer(
+            (
+                be.long_break_early_notif_timeout
+                if is_long_break
+                else be.short_break_early_notif_timeout
+            ),
+            early_notification,
+        )
+        if not self.is_away:
+            self._react_to_notification(early_notification)
+
+    def hide_notification(self):
+        self.stop_timer(be.short_break_early_notif_timeout)
+        self.stop_timer(be.long_break_early_notif_timeout)
+
+    def show_short_break(self):
+        self.counts["short breaks"] += 1
+        self.lateness.append(
+            self.simulation.now - self.engine.next_short_break_time
+        )
+        self.start_timer(be.break_ended, self.config["short_break"]["length"])
+
+    def hide_short_break(self):
+        self.stop_timer(be.break_ended)
+
+    def show_long_break(self):
+        self.counts["long breaks"] += 1
+        self.lateness.append(
+            self.simulation.now - self.engine.next_long_break_time
+        )
+        length = self.config["long_break"]["length"]
+        self.start_timer(be.long_break_finished_timeout, length)
+        if self.rng.random() < self.LONG_BREAK_SKIP_CHANCE:
+            self.counts["long breaks cut short"] += 1
+            self._go_away(length * self.rng.uniform(0.2, 0.9))
+        else:
+            self._go_away(length + self.rng.expovariate(1 / 90))
+
+    def show_long_break_finished(self):
+        if not self.is_away:
+            self._pending_reaction = self.simulation.schedule(
+                self.rng.uniform(1, 10), lambda: self._click(be.break_ended)
+            )
+
+    def state_entered(self, state):
+        self.counts[state.name] += 1
+        # The user only keeps reacting while a notification is showing.  (It
+        #  is hidden and shown again between the early and late ones.)
+        if state not in self._notification_states():
+            self.simulation.cancel(self._pending_reaction)
+            self._pending_reaction = None
+        # The long break screen's countdown stops when it's skipped.
+        if state is not self.engine.long_break_in_progress:
+            self.stop_timer(be.long_break_finished_timeout)
+
+        if state.name in self._REST_STATE_NAMES:
+            if not self._is_resting:
+                self._end_stretch()
+                self._is_resting = True
+        elif self._is_resting:
+            self._is_resting = False
+            self._work_started = self.simulation.now
+
+    def _notification_states(self):
+        return (
+            self.engine.showing_short_break_early_notif,
+            self.engine.showing_long_break_early_notif,
+            self.engine.showing_short_break_late_notif,
+            self.engine.showing_long_break_late_notif,
+        )
+
+    def _end_stretch(self):
+        if not self._is_resting:
+            self.longest_stretch = max(
+                self.longest_stretch,
+                self.simulation.now - self._work_started,
+            )
+
+    # ##############  The user
+    def _react_to_notification(self, early_notification):
+        chance = self.rng.random()
+        if chance < self.SKIP_CHANCE:
+            self.counts["skipped"] += 1
+            delay = self.rng.uniform(0, early_notification)
+            event = be.break_ended
+        elif chance < self.SKIP_CHANCE + self.ON_TIME_CHANCE:
+            delay = self.rng.uniform(0, early_notification)
+            event = be.break_started
+        else:
+            delay = early_notification + self.rng.expovariate(
+                1 / self.MEAN_LATE_CLICK
+            )
+            event = be.break_started
+        self._pending_reaction = self.simulation.schedule(
+            delay, lambda: self._click(event)
+        )
+
+    def _schedule_wander(self):
+        self._pending_wander = self.simulation.schedule(
+            self.rng.expovariate(1 / self.MEAN_TIME_AT_COMPUTER),
+            self._wander_off,
+        )
+
+    def _wander_off(self):
+        if self.is_away or self._is_resting:
+            self._schedule_wander()
+            return
+        self.counts["wandered off"] += 1
+        self._go_away(
+            self.rng.choices(
+                [
+                    self.rng.uniform(10, 60),
+                    self.rng.uniform(60, 300),
+                    self.rng.uniform(300, 900),
+                    self.rng.uniform(1_800, 3_600),
+                ],
+                weights=[50, 25, 20, 5],
+            )[0]
+        )
+
+    def _go_away(self, duration):
+        self.is_away = True
+        self.simulation.cancel(self._pending_wander)
+        self.simulation.cancel(self._pending_reaction)
+        afk_events = []
+        timeouts = self.config["away_from_keyboard"]
+        for timeout, event in (
+            (timeouts["short_break_timeout"], be.afk_short_period_ended),
+            (timeouts["long_break_timeout"], be.afk_long_period_ended),
+        ):
+            if 0 < timeout < duration:
+                afk_events.append(
+                    self.simulation.schedule(
+                        timeout, lambda event=event: self._deliver(event)
+                    )
+                )
+        self.simulation.schedule(duration, lambda: self._come_back(duration))
+
+    def _come_back(self, duration):
+        self.is_away = False
+        if duration > INPUT_TIMEOUT:
+            self._deliver(be.returned_to_computer)
+
+        state = self.engine.state
+        if state is self.engine.long_break_in_progress:
+            # Back early, so skipping the rest of the break.
+            self._click(be.break_ended)
+        elif state is self.engine.long_break_finished:
+            self.show_long_break_finished()
+        elif state in self._notification_states():
+            self._react_to_notification(0)
+        self._schedule_wander()
+
+
+def simulate(config, days, seed=None, day_length=8 * 3_600):
+    """
+    Simulates `days` workdays, and returns them (as SimulatedWorkday
+    objects).
+    """
+    rng = random.Random(seed)
+    return [
+        SimulatedWorkday(config, rng, day_length).run() for _ in range(days)
+    ]
+
+
+def check_edge_cases(days=20, seed=1):
+    """
+    Simulates a few days with each of `EDGE_CASE_CONFIGS`, making sure the
+    engine gets through them with breaks still being taken.
+    """
+    for name, overrides in EDGE_CASE_CONFIGS.items():
+        config = {
+            section: dict(values, **overrides.get(section, {}))
+            for section, values in DEFAULT_CONFIG.items()
+        }
+        workdays = simulate(config, days, seed)
+        assert all(day.counts["long breaks"] > 0 for day in workdays), name
+
+        # A short break planned when the long break is too close for one
+        #  (as when carrying on from a snapshot taken with other settings)
+        #  is due with the long break.
+        workday = SimulatedWorkday(config, random.Random(seed))
+        workday.engine.start()
+        engine = workday.engine
+        engine.set_timer_for_short_break()
+        assert engine.next_short_break_time == engine.next_long_break_time
+        print("ok:", name)
+
+
+def report(workdays, elapsed):
+    actions = sum(day.simulation.action_count for day in workdays)
+    print(
+        "Simulated {} workdays ({:g} hours each) in {:.2f} seconds"
+        " ({} events).".format(
+            len(workdays), workdays[0].day_length / 3_600, elapsed, actions
+        )
+    )
+
+    print("\nPer day:" + " " * 40 + "mean    p50    p99")
+    names = sorted({name for day in workdays for name in day.counts})
+    for name in names:
+        histogram = Histogram(name, unit="")
+        for day in workdays:
+            histogram.record(day.counts[name])
+        print(
+            "  {:<44} {:>6.1f} {:>6} {:>6}".format(
+                name,
+                sum(day.counts[name] for day in workdays) / len(workdays),
+                histogram.p50,
+                histogram.p99,
+            )
+        )
+
+    lateness = Histogram("Break started after it was due", unit="s")
+    for day in workdays:
+        for seconds in day.lateness:
+            lateness.record(max(0, round(seconds)))
+    stretches = Histogram("Longest stretch without a rest", unit="min")
+    for day in workdays:
+        stretches.record(round(day.longest_stretch / 60))
+    print()
+    print(lateness.summary())
+    print(stretches.summary())
+
+    ignored = collections.Counter()
+    for day in workdays:
+        ignored.update(day.ignored)
+    if ignored:
+        print("\nEvents the state machine ignored:")
+        for (state_name, event_name), count in ignored.most_common():
+            print(
+                "  {:>6} x {!r} in {!r}".format(count, event_name, state_name)
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--days", type=int, default=1_000)
+    parser.add_argument("--hours", type=float, default=8)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--config", help="Take the break settings from this file."
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only check that settings which are easy to get wrong work.",
+    )
+    args = parser.parse_args()
+
+    if args.check:
+        check_edge_cases()
+        return
+
+    config = {
+        section: dict(values) for section, values in DEFAULT_CONFIG.items()
+    }
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            toml_config = tomlkit.load(f)
+        for section in config:
+            config[section].update(toml_config.get(section, {}))
+
+    start = time.perf_counter()
+    workdays = simulate(config, args.days, args.seed, args.hours * 3_600)
+    report(workdays, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""One timer for the whole app, which batches nearby deadlines together."""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+import logging
+from typing import Callable, Optional
+
+# pylint: disable=import-error
+from PySide6.QtCore import Qt, QObject, QThread, QTimer, Signal, Slot
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Deadline:
+    __slots__ = (
+        "handle",
+        "deadline",
+        "latest",
+        "slack",
+        "interval",
+        "callback",
+        "sequence",
+        "is_cancelled",
+    )
+
+
+class TimerService(QObject):
+    """
+    Runs callbacks at deadlines, all from a single, precise QTimer.
+
+    Each deadline is allowed to run up to `slack` seconds late, so that
+    deadlines falling close together can share one wakeup:  the timer is set
+    for the earliest time that any deadline *has* to run by, and then every
+    deadline that has passed is run.  Nothing is ever run early.
+
+    Deadlines can be added and cancelled from any thread, but the callbacks
+    are always run in the thread the service lives in.
+    """
+
+    _rearm_signal = Signal()
+
+    def __init__(
+        self, slack: float = 0.05, clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            slack: How late (in seconds) a deadline can run, by default.
+
+            clock: The monotonic clock the deadlines are measured with.
+        """
+        super().__init__()
+        self.slack = slack
+        self._clock = clock
+
+        # The deadlines are kept in two heaps:  one ordered by when they're
+        #  due, to find which ones to run, and one ordered by how late they
+        #  can run, to find when to wake up.  Cancelled and rescheduled
+        #  deadlines are left in the heaps, and skipped when they reach the
+        #  top.
+        self._lock = threading.Lock()
+        self._deadlines = {}
+        self._by_deadline = []
+        self._by_latest = []
+        self._handles = itertools.count(1)
+        self._sequence = itertools.count()
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.timeout.connect(self._on_timeout)
+        self._armed_time = None
+        self._rearm_signal.connect(self._rearm, Qt.QueuedConnection)
+
+        self.wakeup_count = 0
+        self.callback_count = 0
+        self._started_time = self._clock()
+
+    # ##############  Adding and cancelling deadlines
+    def _push(self, entry):
+        entry.sequence = next(self._sequence)
+        entry.latest = entry.deadline + entry.slack
+        heapq.heappush(
+            self._by_deadline, (entry.deadline, entry.sequence, entry)
+        )
+        heapq.heappush(self._by_latest, (entry.latest, entry.sequence, entry))
+
+    def call_at(
+        self,
+        deadline: float,
+        callback: Callable[[], None],
+        slack: Optional[float] = None,
+        interval: Optional[float] = None,
+    ) -> int:
+        """
+        Runs `callback` once the `clock` reaches `deadline` (and then every
+        `interval` seconds after that, if there is an interval).
+
+        Returns a handle, which can be used to cancel the callback.  Raises a
+        ValueError if `interval` isn't positive, since the callback would be
+        due over and over without the clock moving.
+        """
+        if interval is not None and interval <= 0:
+            raise ValueError(
+                "A repeating callback's interval has to be positive, "
+                "not {}".format(interval)
+            )
+        entry = _Deadline()
+        entry.deadline = deadline
+        entry.slack = self.slack if slack is None else slack
+        entry.interval = interval
+        entry.callback = callback
+        entry.is_cancelled = False
+        with self._lock:
+            entry.handle = next(self._handles)
+            self._deadlines[entry.handle] = entry
+            self._push(entry)
+        self._request_rearm()
+        return entry.handle
+
+    def call_later(
+        self,
+        delay: float,
+        callback: Callable[[], None],
+        slack: Optional[float] = None,
+    ) -> int:
+        """Runs `callback` after `delay` seconds."""
+        return self.call_at(self._clock() + delay, callback, slack)
+
+    def call_every(
+        self,
+        interval: float,
+        callback: Callable[[], None],
+        slack: Optional[float] = None,
+    ) -> int:
+        """
+        Runs `callback` every `interval` seconds, starting one interval from
+        now.  Intervals which are missed altogether are skipped.
+        """
+        return self.call_at(
+            self._clock() + interval, callback, slack, interval=interval
+        )
+
+    def cancel(self, handle: int) -> bool:
+        """
+        Cancels a callback, so that it won't run after this returns.
+
+        Returns whether there was such a callback to cancel.
+        """
+        with self._lock:
+            entry = self._deadlines.pop(handle, None)
+            if entry is None:
+                return False
+            entry.is_cancelled = True
+        self._request_rearm()
+        return True
+
+    def create_timer(
+        self,
+        callback: Callable[[], None],
+        single_shot: bool = False,
+        slack: Optional[float] = None,
+    ) -> "ServiceTimer":
+        """Returns a QTimer look-alike, which runs on this service."""
+        return ServiceTimer(self, callback, single_shot, slack)
+
+    # ##############  Waking up
+    def _request_rearm(self):
+        if QThread.currentThread() is self.thread():
+            self._rearm()
+        else:
+            self._rearm_signal.emit()
+
+    @Slot()
+    def _rearm(self):
+        """Sets the timer for the earliest time a deadline has to run by."""
+        with self._lock:
+            heap = self._by_latest
+            while heap and (
+                heap[0][2].is_cancelled or heap[0][1] != heap[0][2].sequence
+            ):
+                heapq.heappop(heap)
+            wake_time = heap[0][0] if heap else None
+
+        if wake_time is None:
+            self._armed_time = None
+            self._timer.stop()
+        elif wake_time != self._armed_time or not self._timer.isActive():
+            self._armed_time = wake_time
+            msecs = max(0, math.ceil((wake_time - self._clock()) * 1_000))
+            self._timer.start(msecs)
+
+    @Slot()
+    def _on_timeout(self):
+        self.wakeup_count += 1
+        self._armed_time = None
+        now = self._clock()
+
+        due = []
+        with self._lock:
+            heap = self._by_deadline
+            while heap and heap[0][0] <= now:
+                _, sequence, entry = heapq.heappop(heap)
+                if entry.is_cancelled or sequence != entry.sequence:
+                    continue
+                due.append(entry)
+                if entry.interval is None:
+                    del self._deadlines[entry.handle]
+                    # It may have run before it had to, so mark its place
+                    #  in the other heap as stale, as well.
+                    entry.sequence = None
+                else:
+                    missed = math.floor(
+                        (now - entry.deadline) / entry.interval
+                    )
+                    entry.deadline += (missed + 1) * entry.interval
+                    self._push(entry)
+
+        for entry in due:
+            # An earlier callback may have cancelled this one.
+            if not entry.is_cancelled:
+                self.callback_count += 1
+                entry.callback()
+
+        self._rearm()
+
+    # ##############  Metrics
+    def wakeups_per_hour(self) -> float:
+        hours_running = (self._clock() - self._started_time) / 3_600
+        return self.wakeup_count / hours_running if hours_running else 0
+
+    def summary(self) -> str:
+        return "{} timer wakeups ({:.1f} per hour) for {} callbacks".format(
+            self.wakeup_count, self.wakeups_per_hour(), self.callback_count
+        )
+
+
+class ServiceTimer:
+    """
+    A stand-in for a QTimer (with `start`, `stop` and `isActive`), which runs
+    its callback on a TimerService instead.
+    """
+
+    def __init__(
+        self,
+        service: TimerService,
+        callback: Callable[[], None],
+        single_shot: bool = False,
+        slack: Optional[float] = None,
+    ):
+        self._service = service
+        self._callback = callback
+        self._is_single_shot = single_shot
+        self._slack = slack
+        self._handle = None
+
+    def start(self, msecs: float):
+        """
+        (Re)starts the timer, to time out after `msecs` milliseconds.  A
+        repeating timer needs a positive `msecs` (or it raises a
+        ValueError).
+        """
+        self.stop()
+        if self._is_single_shot:
+            self._handle = self._service.call_later(
+                msecs / 1_000, self._on_single_shot, self._slack
+            )
+        else:
+            self._handle = self._service.call_every(
+                msecs / 1_000, self._callback, self._slack
+            )
+
+    def stop(self):
+        if self._handle is not None:
+            self._service.cancel(self._handle)
+            self._handle = None
+
+    # pylint: disable=invalid-name
+    def isActive(self) -> bool:
+        return self._handle is not None
+
+    def _on_single_shot(self):
+        self._handle = None
+        self._callback()
@@ -0,0 +1,179 @@
+"""Renders the system tray tool tip, and works out when it will next change."""
+
+import time
+from typing import Callable, Optional, Sequence, Tuple
+
+
+# The clock times shown can change without anything else changing (when
+#  daylight saving time starts or ends), so the tool tip is rendered at
+#  least this often (in seconds).
+LONGEST_WAIT = 3_600
+
+# How long after a change (in seconds) to render it, so as not to wake up
+#  just before it.
+_MARGIN = 0.01
+
+
+def get_relative_due_time(seconds):
+    # TODO Use doc tests in this function.
+    closest_minute = (seconds + 30) // 60
+    if closest_minute == 0:
+        return "Due right now"
+    elif closest_minute == -1:
+        return "Past due by about 1 minute"
+    elif closest_minute < -1:
+        return "Past due by about {:.0f} minutes".format(-closest_minute)
+    elif closest_minute == 1:
+        return "In about 1 minute"
+    elif closest_minute > 1:
+        return "In about {:.0f} minutes".format(closest_minute)
+
+
+def seconds_until_relative_due_time_changes(seconds):
+    """
+    Returns how long until `get_relative_due_time(seconds)` changes, as the
+    `seconds` left count down.
+    """
+    # It rounds to the closest minute, so it changes every time the seconds
+    #  left drop below a whole number of minutes and a half.
+    return (seconds + 30) % 60
+
+
+class ScheduleTooltip:
+    """
+    Renders the tool tip which shows when the next breaks are due (and how
+    much of the last while was spent at the computer), along with how long
+    the text will stay the same, so it only has to be rendered then.
+    """
+
+    def __init__(
+        self,
+        title: str,
+        time_format: str,
+        show_clock_times: bool,
+        show_relative_times: bool,
+        fraction_present: Optional[Callable[[float], float]] = None,
+        presence_window: float = 0,
+        wall_clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            title: Shown in bold at the top.
+
+            time_format: How to format the clock times (for
+                `time.strftime`).
+
+            show_clock_times: Whether to show when the breaks are due.
+
+            show_relative_times: Whether to show how long until the breaks
+                are due, to the nearest minute.
+
+            fraction_present: If given, returns the fraction of the last
+                `presence_window` seconds spent at the computer, which is
+                shown as well.
+
+            wall_clock: Returns the current Unix time.
+        """
+        self._title = "<b>" + title + "</b>"
+        self._time_format = time_format
+        self._show_clock_times = show_clock_times
+        self._show_relative_times = show_relative_times
+        self._fraction_present = fraction_present
+        self._presence_window = presence_window
+        self._wall_clock = wall_clock
+        self.render_count = 0
+
+    def render(
+        self,
+        next_long_break: float,
+        next_short_break: Optional[float] = None,
+        later_breaks: Sequence[Tuple[float, bool]] = (),
+    ) -> Tuple[str, float]:
+        """
+        Returns the tool tip for breaks due at the given Unix times, and how
+        many seconds until its text changes.
+
+        Args:
+            later_breaks: The breaks planned after those, as (Unix time, is
+                a long break) pairs, which are listed one to a line.
+        """
+        self.render_count += 1
+        now = self._wall_clock()
+        wait = LONGEST_WAIT
+
+        def break_message(break_time):
+            nonlocal wait
+            if self._show_relative_times:
+                wait = min(
+                    wait,
+                    seconds_until_relative_due_time_changes(break_time - now),
+                )
+            return self._break_message(break_time, now)
+
+        tooltip_message = ""
+        if not (self._show_clock_times or self._show_relative_times):
+            pass
+        elif next_short_break is not None:
+            tooltip_message += "<br><u>Next break (short):</u>"
+            tooltip_message += break_message(next_short_break)
+            tooltip_message += "<br><u>Next long break:</u>"
+            tooltip_message += break_message(next_long_break)
+        else:
+            tooltip_message += "<br><u>Next break (long):</u>"
+            tooltip_message += break_message(next_long_break)
+
+        if later_breaks and (
+            self._show_clock_times or self._show_relative_times
+        ):
+            tooltip_message += "<br><u>Later breaks:</u>"
+            for break_time, is_long_break in later_breaks:
+                if self._show_relative_times and not self._show_clock_times:
+                    wait = min(
+                        wait,
+                        seconds_until_relative_due_time_changes(
+                            break_time - now
+                        ),
+                    )
+                tooltip_message += "<br>{} ({})".format(
+                    self._short_time_message(break_time, now),
+                    "long" if is_long_break else "short",
+                )
+
+        if self._fraction_present is not None:
+            tooltip_message += self._presence_message()
+            # The time at the computer is kept by the (wall clock) minute.
+            wait = min(wait, 60 - now % 60)
+
+        return self._title + tooltip_message, wait + _MARGIN
+
+    def _break_message(self, break_time, now):
+        if self._show_clock_times:
+            next_break_per_clock = time.strftime(
+                self._time_format, time.localtime(break_time)
+            )
+            if self._show_relative_times:
+                next_break_relative = get_relative_due_time(break_time - now)
+                return "<br>{}<br>({})".format(
+                    next_break_relative, next_break_per_clock
+                )
+            else:
+                return "<br>{}".format(next_break_per_clock)
+        else:
+            if self._show_relative_times:
+                next_break_relative = get_relative_due_time(break_time - now)
+                return "<br>{}".format(next_break_relative)
+            else:
+                return ""
+
+    def _short_time_message(self, break_time, now):
+        # Only one of the times fits on a line, so the clock time wins.
+        if self._show_clock_times:
+            return time.strftime(self._time_format, time.localtime(break_time))
+        return get_relative_due_time(break_time - now)
+
+    def _presence_message(self):
+        hours = self._presence_window / 3_600
+        return "<br><u>At the computer:</u><br>{:.0%} of the last {}".format(
+            self._fraction_present(self._presence_window),
+            "hour" if hours == 1 else "{:g} hours".format(hours),
+        )